@@ -0,0 +1,243 @@
+from VectorEngine import Cacm
+from BooleanEngine import Cacm as BooleanCacm, Cs276 as BooleanCs276, Compression
+from add_ins import CacmReader
+from add_ins.TermDictionary import TermDictionary
+import nltk
+import argparse
+import os
+import pickle
+import random
+import shutil
+import time
+import tracemalloc
+
+# Location of the CACM database
+CACM_PATH = '../CACM'
+CACM_FILENAME = 'cacm.all'
+CACM_QUERIES = '../CACM/query.text'
+
+# Location of the CS276 database
+CS276_PATH = '../CS276/pa1-data'
+
+# Argument parser for the CLI
+parser = argparse.ArgumentParser(description='Benchmarks of the search engines on the CACM collection')
+parser.add_argument('-b', '--benchmark', type=str, default='pruning',
+                    help='The benchmark to run (pruning, codecs, mapreduce, bsbi, tokenizers, dictionary)')
+parser.add_argument('-p', '--ponderation', type=str, default="tf-idf",
+                    help='Ponderation method (tf-idf, tf-idf-norm, freq-norm)')
+
+args = parser.parse_args()
+
+def load_queries():
+    """ Reads the .W field of every query in query.text """
+    queries = {}
+    sections = [".I", ".W", ".N", ".A"]
+    current_section = None
+    with open(CACM_QUERIES, "r") as f:
+        for line in f:
+            if line[:2] in sections:
+                current_section = line[:2]
+                if current_section == ".I":
+                    current_query = int(line.split(" ")[1])
+                    queries[current_query] = ""
+                continue
+            if current_section == ".W":
+                queries[current_query] = (queries[current_query] + " " + line.strip()).strip()
+    return queries
+
+def pruning():
+    """ Compares exhaustive term-at-a-time scoring with WAND and Block-Max WAND """
+    queries = load_queries()
+    engines = {}
+    for backend in ["taat", "wand", "bmw"]:
+        engines[backend] = Cacm.CACMSearchEngine(CACM_PATH, CACM_FILENAME)
+        engines[backend].initialize_engine(ponderation=args.ponderation, backend=backend)
+
+    print("\n{:>5} | {:>8} | {:>10} | {:>10} | {:>10} | {:>10} | {:>10}".format(
+        "Query", "Postings", "WAND skip", "BMW skip", "TAAT (ms)", "WAND (ms)", "BMW (ms)"))
+    totals = {"postings": 0, "wand": 0, "bmw": 0}
+    times = {"taat": 0, "wand": 0, "bmw": 0}
+    for q in sorted(queries):
+        timings = {}
+        skipped = {}
+        for backend in ["taat", "wand", "bmw"]:
+            t0 = time.time()
+            engines[backend].search(queries[q])
+            timings[backend] = time.time() - t0
+            times[backend] += timings[backend]
+            skipped[backend] = engines[backend].search_stats.get("skipped", 0)
+        postings = engines["wand"].search_stats["postings"]
+        totals["postings"] += postings
+        totals["wand"] += skipped["wand"]
+        totals["bmw"] += skipped["bmw"]
+        print("{:>5} | {:>8} | {:>10} | {:>10} | {:>10.2f} | {:>10.2f} | {:>10.2f}".format(
+            q, postings, skipped["wand"], skipped["bmw"],
+            1000 * timings["taat"], 1000 * timings["wand"], 1000 * timings["bmw"]))
+
+    print("Skipped postings: WAND {:.1%}, BMW {:.1%}".format(
+        totals["wand"] / totals["postings"], totals["bmw"] / totals["postings"]))
+    print("Total time: TAAT {:.3}s, WAND {:.3}s, BMW {:.3}s".format(times["taat"], times["wand"], times["bmw"]))
+
+def codecs():
+    """ Compressed size and decode throughput of every posting codec on the CACM BSBI index """
+    engine = BooleanCacm.CACMSearchEngine(CACM_PATH, CACM_FILENAME)
+    engine.initialize_engine()
+    engine.create_BSBI_index()
+    reverse_index = engine.BSBI_index
+    postings = sum(len(reverse_index[termID]) for termID in reverse_index)
+    print("\n{} terms, {} postings".format(len(reverse_index), postings))
+    print("Pickled dict: {:.1f} kB, 32 bits integers: {:.1f} kB".format(
+        len(pickle.dumps(reverse_index)) / 1000, 8 * postings / 1000))
+
+    print("{:>8} | {:>10} | {:>10} | {:>10} | {:>18}".format(
+        "Codec", "Size (kB)", "Bits/post.", "Build (s)", "Decode (post./s)"))
+    for name in Compression.CODECS:
+        t0 = time.time()
+        compressed = Compression.CompressedIndex(reverse_index, codec=name)
+        build_time = time.time() - t0
+        throughput = compressed.decode_throughput()
+        # Make sure nothing was lost on the way
+        for termID in reverse_index:
+            assert compressed[termID] == reverse_index[termID]
+        print("{:>8} | {:>10.1f} | {:>10.2f} | {:>10.2f} | {:>18,.0f}".format(
+            name, compressed.nbytes / 1000, 8 * compressed.nbytes / postings, build_time, throughput))
+
+def mapreduce():
+    """ Build time of the MapReduce index on CACM with an increasing number of processes """
+    engine = BooleanCacm.CACMSearchEngine(CACM_PATH, CACM_FILENAME)
+    engine.initialize_engine()
+    print("\n{:>8} | {:>10} | {:>8}".format("Workers", "Build (s)", "Speedup"))
+    reference = None
+    workers = 1
+    while workers <= max(os.cpu_count(), 2):
+        engine.MR_index = {}
+        t0 = time.time()
+        engine.create_MR_index(workers=workers)
+        build_time = time.time() - t0
+        if reference is None:
+            reference = (engine.MR_index, build_time)
+        # Every number of workers gives the same index
+        assert engine.MR_index == reference[0]
+        print("{:>8} | {:>10.3f} | {:>8.2f}".format(workers, build_time, reference[1] / build_time))
+        workers *= 2
+
+def measure(build):
+    """ Runs build() twice: once for the time, once under tracemalloc for the peak memory """
+    t0 = time.time()
+    build()
+    build_time = time.time() - t0
+    tracemalloc.start()
+    build()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return build_time, peak
+
+def bsbi():
+    """ Build time and peak memory of the BSBI modes, on CACM and on CS276 if it is available """
+    rows = []
+    for mode in BooleanCacm.BSBI_MODES:
+        engines = []
+        for _ in range(2):
+            engine = BooleanCacm.CACMSearchEngine(CACM_PATH, CACM_FILENAME)
+            engine.initialize_engine()
+            engines.append(engine)
+        # Every build needs a fresh engine, the reading and cleaning are not measured
+        rows.append(("CACM", mode) + measure(lambda: engines.pop().create_BSBI_index(mode=mode)))
+    if os.path.isdir(CS276_PATH):
+        directory = os.path.join(CS276_PATH, "..", "benchmark_index")
+        for mode in BooleanCs276.BSBI_MODES:
+            build = lambda: BooleanCs276.CS276SearchEngine(CS276_PATH).create_BSBI_index(index_directory=directory, mode=mode)
+            rows.append(("CS276", mode) + measure(build))
+            shutil.rmtree(directory, ignore_errors=True)
+
+    print("\n{:>10} | {:>8} | {:>10} | {:>10}".format("Collection", "Mode", "Build (s)", "Peak (MB)"))
+    for collection, mode, build_time, peak in rows:
+        print("{:>10} | {:>8} | {:>10.2f} | {:>10.1f}".format(collection, mode, build_time, peak / 2**20))
+
+def tokenizers():
+    """ Throughput of the tokenizers on CACM, and the differences of the regex index with the NLTK one """
+    records = list(CacmReader.read_records(os.path.join(CACM_PATH, CACM_FILENAME)))
+    stop_words = set(nltk.corpus.stopwords.words('english'))
+    stop_words.update(['.', ',', '"', "'", '?', '!', ':', ';', '(', ')', '[', ']', '{', '}'])
+    indexes = {}
+    print("\n{:>9} | {:>10} | {:>14} | {:>14}".format("Tokenizer", "Tokens", "Tokenize (s)", "Tokens/s"))
+    for tokenizer in CacmReader.TOKENIZERS:
+        t0 = time.time()
+        tokens = sum(len(CacmReader.tokenize(text, tokenizer)) for _, text in records)
+        tokenize_time = time.time() - t0
+        print("{:>9} | {:>10} | {:>14.2f} | {:>14,.0f}".format(tokenizer, tokens, tokenize_time, tokens / tokenize_time))
+        # Same cleaning as the engines: fields, lowercase and stop words
+        index = {}
+        for docID, text in records:
+            for word in CacmReader.analyze(text, stop_words, tokenizer):
+                index.setdefault(word, set()).add(docID)
+        indexes[tokenizer] = index
+
+    reference, regex = indexes["nltk"], indexes["regex"]
+    pairs = lambda index: set((word, docID) for word in index for docID in index[word])
+    reference_pairs, regex_pairs = pairs(reference), pairs(regex)
+    only_nltk = sorted(set(reference) - set(regex), key=lambda word: -len(reference[word]))
+    only_regex = sorted(set(regex) - set(reference), key=lambda word: -len(regex[word]))
+    print("\nVocabulary: {} terms with NLTK, {} with the regex, {} in common".format(
+        len(reference), len(regex), len(set(reference) & set(regex))))
+    print("Only with NLTK: {}, e.g. {}".format(len(only_nltk), only_nltk[:10]))
+    print("Only with the regex: {}, e.g. {}".format(len(only_regex), only_regex[:10]))
+    print("Postings (term, docID): {} with NLTK, {} with the regex, {:.2%} of the NLTK postings differ".format(
+        len(reference_pairs), len(regex_pairs), len(reference_pairs ^ regex_pairs) / len(reference_pairs)))
+
+def dictionary():
+    """ Memory per term and lookup time of the vocabulary as a dict and as a front-coded TermDictionary """
+    engine = BooleanCacm.CACMSearchEngine(CACM_PATH, CACM_FILENAME)
+    engine.initialize_engine()
+    engine.create_BSBI_index()
+    vocabularies = [("CACM", engine.BSBI_vocabulary)]
+    if os.path.isdir(CS276_PATH):
+        # Raw words of the files, without stop words filtering nor normalization
+        words = set()
+        for root, dirs, files in os.walk(CS276_PATH):
+            for file in files:
+                with open(os.path.join(root, file), 'r') as f:
+                    words.update(f.read().split())
+        vocabularies.append(("CS276", {word: termID for termID, word in enumerate(sorted(words))}))
+
+    print("\n{:>10} | {:>9} | {:>16} | {:>14} | {:>16} | {:>14}".format(
+        "Collection", "Terms", "dict (B/term)", "dict (us)", "front (B/term)", "front (us)"))
+    for collection, vocabulary in vocabularies:
+        terms = list(vocabulary)
+        # The terms and the termIDs are counted with the structure, as they are built from scratch
+        tracemalloc.start()
+        as_dict = {term.encode('utf-8').decode('utf-8'): termID + 2**16 for term, termID in vocabulary.items()}
+        dict_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        tracemalloc.start()
+        front_coded = TermDictionary.from_dict(vocabulary)
+        front_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        sample = random.Random(0).sample(terms, min(len(terms), 10000))
+        timings = []
+        for structure in [as_dict, front_coded]:
+            t0 = time.time()
+            for term in sample:
+                structure.get(term)
+            timings.append((time.time() - t0) / len(sample) * 1e6)
+        print("{:>10} | {:>9} | {:>16.1f} | {:>14.2f} | {:>16.1f} | {:>14.2f}".format(
+            collection, len(terms), dict_memory / len(terms), timings[0], front_memory / len(terms), timings[1]))
+
+BENCHMARKS = {
+    "pruning": pruning,
+    "codecs": codecs,
+    "mapreduce": mapreduce,
+    "bsbi": bsbi,
+    "tokenizers": tokenizers,
+    "dictionary": dictionary,
+}
+
+def run():
+    if args.benchmark in BENCHMARKS:
+        BENCHMARKS[args.benchmark]()
+    else:
+        print("Unrecognized benchmark. Please choose from {}".format(list(BENCHMARKS.keys())))
+        return True
+
+if __name__ == '__main__':
+    run()
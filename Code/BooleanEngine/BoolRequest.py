@@ -1,133 +1,81 @@
 import time
 import nltk
+from . import Postings, QueryPlanner
+from .QueryParser import QueryParser
 
 class BoolRequest():
     """ Boolean request engine based on any reverse index and vocabulary if needed """
-    def __init__(self, reverse_index, vocabulary=None):
+    def __init__(self, reverse_index, vocabulary=None, positional_index=None, normalize=None, kgram_index=None,
+                 fuzzy_index=None, correct=False):
         self.__vocabulary = vocabulary
         self.__reverse_index = reverse_index
-        self.__CONTROL_WORDS = ['and', 'or', '+', '-']
-        self.__CONTROL_FUNCTIONS = {
-            'and': lambda pl1, pl2: list(set(pl1).intersection(pl2)),
-            '+': lambda pl1, pl2: list(set(pl1).intersection(pl2)),
-            'or': lambda pl1, pl2: list(set(pl1 + pl2))
-        }
+        # {word: {docID: [positions]}}, needed by phrase and NEAR queries
+        self.__positional_index = positional_index
+        # normalize(word) gives the indexed form of a query word, if the documents were stemmed
+        self.__normalize = normalize
+        # kgram_index.expand(pattern) gives the indexed terms matching a wildcard
+        self.__kgram_index = kgram_index
+        # fuzzy_index.closest(term) gives the indexed terms closest to a misspelled term, replacing it if correct
+        self.__fuzzy_index = fuzzy_index
+        self.__correct = correct
+        # Sorted posting arrays, built once per term from the posting dicts
+        self.__posting_lists = {}
+        # Plan of the last query, can be printed
+        self.last_plan = None
         self.__stop_words = set(nltk.corpus.stopwords.words('english'))
         self.__stop_words.update(['.', ',', '"', "'", '?', '!', ':', ';', '(', ')', '[', ']', '{', '}'])
+        self.__parser = QueryParser(self.__stop_words)
 
-    def __parse_query(self, query):
-        """ Parse the query to find control words. Clean the stop at the same time """
-        query_as_list = query.split(' ')
-        # Get rid of the stop-words, but not the control words
-        query_clean = list(filter(lambda word: word not in self.__stop_words or word in self.__CONTROL_WORDS, query_as_list))
-        # Lowercase everything
-        query_clean = list(map(lambda x: x.lower(), query_clean))
-        return query_clean
+    def __posting_list(self, key):
+        """ Returns the sorted posting list of a key. A compressed index only decodes this list """
+        if hasattr(self.__reverse_index, 'postings'):
+            return Postings.PostingList(self.__reverse_index.postings(key))
+        if key not in self.__posting_lists:
+            self.__posting_lists[key] = Postings.PostingList.from_dict(self.__reverse_index[key])
+        return self.__posting_lists[key]
 
-    def BSBISearch(self, query):
-        """ Search in the index for the documents corresponding to the query """
-        q = self.__parse_query(query)
-        # Split in a first instruction and tuples coming after
+    def __document_frequency(self, key):
+        """ Length of a posting list, read without decoding it if the index is compressed """
+        if hasattr(self.__reverse_index, 'document_frequency'):
+            return self.__reverse_index.document_frequency(key)
+        return len(self.__reverse_index[key])
+
+    def __indexed(self, term):
+        """ Form of a query term in the index """
+        if self.__normalize is None:
+            return term
+        return self.__normalize(term)
+
+    def __search(self, query, key):
+        """ Parses, plans and runs the query, key(term) gives the key of an indexed term in the reverse index """
         t = time.time()
+        positions = None
+        if self.__positional_index is not None:
+            positions = lambda term: self.__positional_index.get(self.__indexed(term), {})
+        expand = None
+        if self.__kgram_index is not None:
+            # The terms of a wildcard are already in their indexed form
+            expand = lambda pattern: [(term, key(term)) for term in self.__kgram_index.expand(pattern)]
+        closest = None
+        if self.__fuzzy_index is not None:
+            closest = lambda term: [(word, key(word)) for word in self.__fuzzy_index.closest(self.__indexed(term))[0]]
+        planner = QueryPlanner.QueryPlanner(lambda term: key(self.__indexed(term)), self.__document_frequency, positions, expand,
+                                            closest, self.__correct)
         try:
-            seq = q[0] # First Bool instruction
-            rem_q = q[1:]
-            next_instructions = []
-            while len(rem_q) > 0:
-                if not rem_q[0] in self.__CONTROL_WORDS:
-                    print("No argument was specified before {}, defaulting to AND".format(rem_q[0]))
-                    next_instructions.append(('and', rem_q[0]))
-                    rem_q = rem_q[1:]
-                else:
-                    next_instructions.append((rem_q[0], rem_q[1]))
-                    rem_q = rem_q[2:]
-            # Process the different queries
-            ## First Query
-            if not isinstance(seq, str):
-                raise TypeError("The input string was not parsed correctly. Unable to recognize {}.".format(seq))
-            else:
-                try:
-                    pl1_dict = self.__reverse_index[self.__vocabulary[seq]]
-                except KeyError:
-                    print("The word {} was not found".format(seq))
-                    pl1_dict = {}
-                current_pl_dict = pl1_dict
-                # Create posting list
-                current_pl = []
-                for k in current_pl_dict:
-                    current_pl.append(k)
+            self.last_plan = planner.plan(self.__parser.parse(query))
+        except ValueError as e:
+            print(e)
+            self.last_plan = None
+            return [], time.time() - t
+        result = self.last_plan.execute(self.__posting_list)
+        ## Return the resulting posting list
+        t1 = time.time()
+        return result, t1-t
 
-            ## Next queries
-            for tup in next_instructions:
-                if not (isinstance(tup[1], str) and (tup[0] in self.__CONTROL_WORDS)):
-                    raise TypeError("The input string was not parsed correctly: {}".format(tup[1]))
-                else:
-                    try:
-                        pl_dict = self.__reverse_index[self.__vocabulary[tup[1]]]
-                    except KeyError:
-                        print("The word {} was not found".format(tup[1]))
-                        pl_dict = {}
-                    # Create posting list
-                    pl = []
-                    for k in pl_dict:
-                        pl.append(k)
-                    current_pl = self.__CONTROL_FUNCTIONS[tup[0]](current_pl, pl)
-            ## Return the resulting posting list
-            t1 = time.time()
-            return current_pl, t1-t
-        except IndexError:
-            return []
+    def BSBISearch(self, query):
+        """ Search in the index for the documents corresponding to the query """
+        return self.__search(query, lambda term: self.__vocabulary[term])
 
     def MRSearch(self, query):
         """ Search in the index for the documents corresponding to the query """
-        q = self.__parse_query(query)
-        # Split in a first instruction and tuples coming after
-        t = time.time()
-        try:
-            seq = q[0] # First Bool instruction
-            rem_q = q[1:]
-            next_instructions = []
-            while len(rem_q) > 0:
-                if not rem_q[0] in self.__CONTROL_WORDS:
-                    print("No argument was specified before {}, defaulting to AND".format(rem_q[0]))
-                    next_instructions.append(('AND', rem_q[0]))
-                    rem_q = rem_q[1:]
-                else:
-                    next_instructions.append((rem_q[0], rem_q[1]))
-                    rem_q = rem_q[2:]
-            # Process the different queries
-            ## First Query
-            if not isinstance(seq, str):
-                raise TypeError("The input string was not parsed correctly. Unable to recognize {}.".format(seq))
-            else:
-                try:
-                    pl1_dict = self.__reverse_index[seq]
-                except KeyError:
-                    print("The word {} was not found".format(seq))
-                    pl1_dict = {}
-                current_pl_dict = pl1_dict
-                # Create posting list
-                current_pl = []
-                for k in current_pl_dict:
-                    current_pl.append(k)
-
-            ## Next queries
-            for tup in next_instructions:
-                if not (isinstance(tup[1], str) and (tup[0] in self.__CONTROL_WORDS)):
-                    raise TypeError("The input string was not parsed correctly: {}".format(tup[1]))
-                else:
-                    try:
-                        pl_dict = self.__reverse_index[tup[1]]
-                    except KeyError:
-                        print("The word {} was not found".format(tup[1]))
-                        pl_dict = {}
-                    # Create posting list
-                    pl = []
-                    for k in pl_dict:
-                        pl.append(k)
-                    current_pl = self.__CONTROL_FUNCTIONS[tup[0]](current_pl, pl)
-            ## Return the resulting posting list
-            t1 = time.time()
-            return current_pl, t1-t
-        except IndexError:
-            return []
+        return self.__search(query, lambda term: term)
@@ -0,0 +1,66 @@
+import numpy as np
+
+def build_index(termIDs, docIDs, n_terms):
+    """
+    Builds the index from two parallel arrays, with one (termID, docID) pair per occurrence of a term
+    The pairs are sorted with a single lexsort and the term frequencies are the lengths of the runs of equal pairs
+    """
+    termIDs = np.asarray(termIDs)
+    docIDs = np.asarray(docIDs)
+    if len(termIDs) == 0:
+        return CSRIndex(np.zeros(n_terms + 1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32))
+    order = np.lexsort((docIDs, termIDs))
+    termIDs = termIDs[order]
+    docIDs = docIDs[order]
+    # Run-length encoding: a run starts wherever the pair changes
+    starts = np.flatnonzero(np.concatenate(([True], (termIDs[1:] != termIDs[:-1]) | (docIDs[1:] != docIDs[:-1]))))
+    tfs = np.diff(np.append(starts, len(termIDs))).astype(np.int32)
+    dfs = np.bincount(termIDs[starts], minlength=n_terms)
+    offsets = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(dfs, out=offsets[1:])
+    return CSRIndex(offsets, docIDs[starts], tfs)
+
+
+class CSRIndex():
+    """
+    Index {termID: {docID: tf}} stored as three arrays, like a CSR matrix: the postings of a termID t
+    are docIDs[offsets[t]:offsets[t + 1]], with their term frequencies in tfs
+    """
+    def __init__(self, offsets, docIDs, tfs):
+        self.offsets = offsets
+        self.docIDs = docIDs
+        self.tfs = tfs
+
+    def postings(self, key):
+        """ Returns the sorted docIDs of a key """
+        if key not in self:
+            raise KeyError(key)
+        return self.docIDs[self.offsets[key]:self.offsets[key + 1]].tolist()
+
+    def document_frequency(self, key):
+        """ Number of documents containing the key """
+        if key not in self:
+            raise KeyError(key)
+        return int(self.offsets[key + 1] - self.offsets[key])
+
+    def __getitem__(self, key):
+        """ Returns the posting dict {docID: tf} of a key, like the dict index """
+        if key not in self:
+            raise KeyError(key)
+        start, end = self.offsets[key], self.offsets[key + 1]
+        return dict(zip(self.docIDs[start:end].tolist(), self.tfs[start:end].tolist()))
+
+    def __contains__(self, key):
+        return isinstance(key, (int, np.integer)) and 0 <= key < len(self.offsets) - 1 \
+            and self.offsets[key + 1] > self.offsets[key]
+
+    def __iter__(self):
+        return iter(np.flatnonzero(np.diff(self.offsets)).tolist())
+
+    def __len__(self):
+        return int(np.count_nonzero(np.diff(self.offsets)))
+
+    @property
+    def nbytes(self):
+        """ Memory used by the three arrays """
+        return self.offsets.nbytes + self.docIDs.nbytes + self.tfs.nbytes
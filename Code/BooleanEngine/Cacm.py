@@ -1,29 +1,30 @@
 import os
 import sys
-import re
-from threading import Thread
-from queue import Queue
 import nltk
+import numpy as np
+from add_ins import IndexStore, CacmReader
+from add_ins.KGramIndex import KGramIndex
+from add_ins.FuzzyIndex import FuzzyIndex
+from . import MapReduce, CSRIndex
+
+BSBI_MODES = ["tuples", "numpy"]
 
 
 class CACMSearchEngine():
     """ Set of features to implement a boolean search engine on the CACM collection """
-    def __init__(self, path, filename):
+    def __init__(self, path, filename, workers=1, tokenizer="nltk"):
         self.__PATH = path
         self.__filename = filename
-        # Markers in the collection to split the files
-        self.__MARKERS_TO_KEEP = ['.T', '.W', '.K']
-        self.__MARKERS_TO_DROP = ['.B', '.A', '.N', '.X', '.C']
-        self.__MARKERS = self.__MARKERS_TO_KEEP + self.__MARKERS_TO_DROP
+        # Processes used to tokenize and clean the documents
+        self.__workers = workers
+        # NLTK tokenizer, or the faster regex tokenizer
+        self.__tokenizer = tokenizer
         self.__stop_words = set(nltk.corpus.stopwords.words('english'))
         self.__stop_words.update(
             ['.', ',', '"', "'", '?', '!', ':', ';', '(', ')', '[', ']', '{', '}']
         )
-        # Stuff for later
-        self.__documents = []
-        self.__tokenized_documents_as_list = []
+        # Stuff for later, the only copy of the collection kept in memory
         self.__clean_documents = {}
-        self.__clean_documents_list = []
         self.__index = {}
         # Stuff for BSBI
         self.BSBI_vocabulary = {}
@@ -33,91 +34,42 @@ class CACMSearchEngine():
         self.BSBI_index = {}
         # Stuff for MapReduce
         self.MR_index = {}
+        # Positions of the words, for phrase and NEAR queries
+        self.positional_index = {}
+        # k-grams of the vocabulary of an index, for wildcard queries
+        self.kgram_index = None
+        # Deletions of the vocabulary of an index, for the correction of misspelled words
+        self.fuzzy_index = None
 
-    def __load_data(self):
-        """ Loads the collection specified in the path & filename """
-        with open(os.path.join(self.__PATH, self.__filename), 'r') as file:
-            data = file.read()
-            self.__documents = re.split(r'\.I \d+', data)
-
-    def __convert_document_list_into_tokenized_lists(self):
-        """ Converts the list of documents to a list of lists """
-        self.__tokenized_documents_as_list = []
-        for document in self.__documents:
-            tokens = self.__tokenize_document(document)
-            self.__tokenized_documents_as_list.append(tokens)
-
-            sys.stdout.write(
-                "Tokenizing process: %d%%                         \r" % \
-                (100 * len(self.__tokenized_documents_as_list)/len(self.__documents))
-            )
-            sys.stdout.flush()
-
-    @staticmethod
-    def __tokenize_document(document):
+    def __tokenize_document(self, document):
         """ Convert a document into a list of tokens """
-        tokens = nltk.tokenize.word_tokenize(document)
-        return tokens # Returns a list of the tokens
+        return CacmReader.tokenize(document, self.__tokenizer)
 
     @staticmethod
     def __get_number_of_tokens(document):
         """ Returns the number of tokens in a document """
         return len(document)
 
-    def __clean_tokenized_document(self, tokenized_document):
-        """ SPECIFIC TO CACM - Drop the unwanted markers in the document """
-        if len(tokenized_document) > 0:
-            cont = True
-            data = [] # Value to return
-            for item in tokenized_document: # Document is a list if tokens
-                if item in self.__MARKERS: # A marker has been identified
-                    if item in self.__MARKERS_TO_DROP:
-                        # The marker should be dropped, \
-                        # cont is set to True to skip until next marker
-                        cont = True
-                        continue
-                    else:
-                        cont = False
-                        continue
-                if cont:
-                    continue # Skip the data until the next marker
-                else:
-                    data.append(item.lower()) # Add the data
-            return data
-        else:
-            return []
-
     def __filter_stop_words(self, clean_document):
         """ Removes the stop words in a document """
         terms_clean = list(filter(lambda word: word not in self.__stop_words, clean_document))
         return terms_clean
 
     def __clean_all_documents(self):
-        for i in range(len(self.__tokenized_documents_as_list)):
-            res = self.__clean_tokenized_document(self.__tokenized_documents_as_list[i])
-            res = self.__filter_stop_words(res)
-            self.__clean_documents_list.append(res)
-            self.__clean_documents[i] = res
-            sys.stdout.write(
-                "Cleaning process: %d%%                                             \r" % \
-                (100 * i/len(self.__tokenized_documents_as_list))
-            )
+        """ Reads the collection one record at a time and keeps only its clean words """
+        for docID, document in CacmReader.clean_documents(os.path.join(self.__PATH, self.__filename), self.__stop_words, self.__workers, self.__tokenizer):
+            self.__clean_documents[docID] = document
+            sys.stdout.write("Cleaning process: %d documents                                   \r" % docID)
             sys.stdout.flush()
 
     def initialize_engine(self):
         """ Initialize engine by reading and parsing the data """
         sys.stdout.write("Starting Engine \r")
         sys.stdout.flush()
-        sys.stdout.write("Reading database... \r")
-        sys.stdout.flush()
-        self.__load_data()
-        print("Successfully parsed {} documents".format(len(self.__documents)))
-        sys.stdout.write("Splitting into separate lists and tokenizing... \r")
-        sys.stdout.flush()
-        self.__convert_document_list_into_tokenized_lists()
-        sys.stdout.write("Dropping unwanted markers and filtering stop-words... \r")
+        sys.stdout.write("Reading, tokenizing, dropping unwanted markers and filtering stop-words... \r")
         sys.stdout.flush()
         self.__clean_all_documents()
+        print("Successfully parsed {} documents                                   ".format(len(self.__clean_documents)))
         sys.stdout.write("Successfully created a clean list of documents ! \r")
         sys.stdout.flush()
 
@@ -140,12 +92,14 @@ class CACMSearchEngine():
             vocabulary.add(elem)
         return vocabulary
 
-    def create_BSBI_index(self):
-        """ Create an index based on the BSBI algorithm """
+    def create_BSBI_index(self, mode="tuples"):
+        """ Create an index based on the BSBI algorithm, with Python tuples or NumPy arrays """
+        if mode not in BSBI_MODES:
+            raise ValueError("Unknown BSBI mode {}. Please choose from {}".format(mode, BSBI_MODES))
         # Create a term/termID dictionnary
         current_id = 0
         current_doc_number = 0
-        for document in self.__clean_documents_list:
+        for document in self.__clean_documents.values():
             voc = self.__get_vocabulary(document)
             for word in voc:
                 if word in self.BSBI_vocabulary:
@@ -153,17 +107,21 @@ class CACMSearchEngine():
                 else:
                     self.BSBI_vocabulary[word] = current_id
                     current_id += 1
-            sys.stdout.write("Building term/termID dictionnary: %d%%                    \r" % (100 * current_doc_number/len(self.__clean_documents_list)))
+            sys.stdout.write("Building term/termID dictionnary: %d%%                    \r" % (100 * current_doc_number/len(self.__clean_documents)))
             sys.stdout.flush()
             current_doc_number += 1
 
+        if mode == "numpy":
+            self.__create_BSBI_arrays()
+            return
+
         # Iterate on the documents to gather tuples (termID, docID)
         current_doc_number = 0
         for i in self.__clean_documents:
             current_doc = self.__clean_documents[i]
             for word in current_doc:
                 self.__BSBI_tuples.append((self.BSBI_vocabulary[word], i))
-            sys.stdout.write("Gathering tuples (termID, docID): %d%%                  \r" % (100 * current_doc_number/len(self.__clean_documents_list)))
+            sys.stdout.write("Gathering tuples (termID, docID): %d%%                  \r" % (100 * current_doc_number/len(self.__clean_documents)))
             sys.stdout.flush()
             current_doc_number += 1
 
@@ -182,6 +140,8 @@ class CACMSearchEngine():
                 self.__BSBI_tuples_by_termID_and_docID += sorted(current_batch, key=self.__get_docID)
                 current_batch = [t]
                 current_termID += 1
+        # The last batch has no following termID to flush it
+        self.__BSBI_tuples_by_termID_and_docID += sorted(current_batch, key=self.__get_docID)
         sys.stdout.write("Sorted BSBI Tuples by TermID & DocID                        \r")
 
         # Merge results to get the reverse index
@@ -204,7 +164,28 @@ class CACMSearchEngine():
             current_doc_number += 1
         print("Created reverse index for the BSBI algorithm")
 
-    # MAPREDUCE ALGORITHM W/O THREADING
+    def __create_BSBI_arrays(self):
+        """ Sorts the (termID, docID) pairs as two NumPy arrays and aggregates them into a CSR index """
+        lengths = [len(self.__clean_documents[i]) for i in self.__clean_documents]
+        docIDs = np.repeat(np.fromiter(self.__clean_documents.keys(), dtype=np.int32, count=len(lengths)), lengths)
+        termIDs = np.fromiter(
+            (self.BSBI_vocabulary[word] for i in self.__clean_documents for word in self.__clean_documents[i]),
+            dtype=np.int32, count=sum(lengths)
+        )
+        self.BSBI_index = CSRIndex.build_index(termIDs, docIDs, len(self.BSBI_vocabulary))
+        print("Created reverse index for the BSBI algorithm")
+
+    # POSITIONAL INDEX
+    def create_positional_index(self):
+        """ Create an index {word: {docID: [positions]}} on the clean documents, for phrase and NEAR queries """
+        self.positional_index = {}
+        for docID in self.__clean_documents:
+            for position, word in enumerate(self.__clean_documents[docID]):
+                postings = self.positional_index.setdefault(word, {})
+                postings.setdefault(docID, []).append(position)
+        print("Created positional index")
+
+    # MAPREDUCE ALGORITHM
     @staticmethod
     def __mapper(doc, docID):
         """ Create a list of tuples (term, docID) """
@@ -225,80 +206,55 @@ class CACMSearchEngine():
                 self.MR_index[t[0]] = {}
                 self.MR_index[t[0]][t[1]] = 1
 
-    def create_MR_index(self, threading=False):
-        if not threading:
+    def create_MR_index(self, workers=1):
+        """ Create an index with MapReduce, in a pool of processes if there are several workers """
+        if workers == 1:
             buffer = []
             for i in self.__clean_documents:
                 buffer.append(self.__mapper(self.__clean_documents[i], i))
             for b in buffer:
                 self.__reducer(b)
         else:
-            # Create the synchronised queue
-            docs_queue = Queue()
-            for doc in self.__clean_documents:
-                docs_queue.put(doc)
-            buffer = Queue()
+            # A few shards per worker to balance the load
+            documents = list(self.__clean_documents.items())
+            self.MR_index = MapReduce.build_index(MapReduce.split(documents, 4 * workers), workers=workers)
 
-            # Create the index
-            MR_index = {}
-            global continuer
-            continuer = True
+    # K-GRAM INDEX
+    def create_kgram_index(self, method="BSBI"):
+        """ Create the k-gram index of the terms of the BSBI or MR index, for wildcard queries """
+        self.kgram_index = KGramIndex.build(self.BSBI_vocabulary if method == "BSBI" else self.MR_index)
+        print("Created k-gram index")
 
-            # Create the threads
-            class mapper(Thread):
-                """ Mapper """
-                def __init__(self, documents):
-                    Thread.__init__(self)
-                    self.__documents = documents
+    # FUZZY INDEX
+    def create_fuzzy_index(self, method="BSBI"):
+        """ Create the deletions of the terms of the BSBI or MR index, for the correction of misspelled words """
+        self.fuzzy_index = FuzzyIndex.build(self.BSBI_vocabulary if method == "BSBI" else self.MR_index)
+        print("Created fuzzy index")
 
-                def run(self):
-                    while not docs_queue.empty():
-                        docID = docs_queue.get()
-
-                        res = []
-                        for word in self.__documents[docID]:
-                            res.append((word, docID))
-
-                        buffer.put(res)
-                        docs_queue.task_done()
-
-            class reducer(Thread):
-                """ Reducer """
-                def __init__(self):
-                    Thread.__init__(self)
+    # SAVED INDEX
+    def save_index(self, directory, method="BSBI"):
+        """ Saves the BSBI or MR index in the on-disk format, with the positions, the k-grams and the deletions if they were built """
+        if method == "BSBI":
+            terms = [term for term in self.BSBI_vocabulary if self.BSBI_vocabulary[term] in self.BSBI_index]
+            postings = lambda term: self.BSBI_index[self.BSBI_vocabulary[term]]
+        else:
+            terms = self.MR_index
+            postings = self.MR_index.__getitem__
+        IndexStore.save(
+            directory, terms, postings,
+            positions=self.positional_index.__getitem__ if len(self.positional_index) > 0 else None,
+            docIDs=list(self.__clean_documents),
+            metadata={"engine": "boolean", "collection": "CACM", "method": method, "tokenizer": self.__tokenizer},
+            kgrams=self.kgram_index is not None, deletions=self.fuzzy_index is not None
+        )
+        print("Saved the index in {}".format(directory))
 
-                def run(self):
-                    while (not buffer.empty()) or continuer:
-                        tuples_list = buffer.get()
-                        for t in tuples_list:
-                            if t[0] in MR_index:
-                                if t[1] in MR_index[t[0]]:
-                                    MR_index[t[0]][t[1]] += 1
-                                else:
-                                    MR_index[t[0]][t[1]] = 1
-                            else:
-                                MR_index[t[0]] = {}
-                                MR_index[t[0]][t[1]] = 1
-                        buffer.task_done()
+    # SEGMENTS
+    def update_segments(self, segments, batch_size=1000):
+        """ Adds the documents that are not in the segments yet, batch_size documents per new segment """
+        print("Added {} new documents to the segments".format(segments.add_new_documents(self.__clean_documents, batch_size)))
 
-            # Run the threads
-            M = []
-            R = []
-            # MAPPERS
-            for tm in range(5):
-                M.append(mapper(self.__clean_documents))
-                M[tm].start()
-            # REDUCERS
-            for tr in range(5):
-                R.append(reducer())
-                R[tr].start()
-            # Wait for the mappers to finish
-            for tm in range(5):
-                M[tm].join()
-            # Let the reducers stop if the queue is empty
-            continuer = False
-            # Wait for the reducers to finish
-            for tr in range(5):
-                R[tr].join()
-            # Put the dictionnary back
-            self.MR_index = MR_index
+    def clean_text(self, text):
+        """ Clean words of a new text of a document, cleaned like a query """
+        document = [token.lower() for token in self.__tokenize_document(text)]
+        return self.__filter_stop_words(document)
@@ -0,0 +1,215 @@
+import time
+import numpy as np
+
+class VariableByteCodec():
+    """ Variable byte encoding: 7 bits per byte, the high bit marks the last byte of a number """
+    name = "vbyte"
+
+    @staticmethod
+    def encode(numbers):
+        data = bytearray()
+        for n in numbers:
+            chunks = []
+            while True:
+                chunks.append(n & 0x7F)
+                if n < 128:
+                    break
+                n >>= 7
+            chunks.reverse()
+            chunks[-1] |= 0x80
+            data.extend(chunks)
+        return bytes(data)
+
+    @staticmethod
+    def decode(data, count):
+        numbers = []
+        n = 0
+        for byte in data:
+            if byte < 128:
+                n = (n << 7) | byte
+            else:
+                numbers.append((n << 7) | (byte & 0x7F))
+                n = 0
+                if len(numbers) == count:
+                    break
+        return numbers
+
+
+class _BitCodec():
+    """ Codecs working on a string of bits, padded with zeros up to a whole byte """
+    @classmethod
+    def encode(cls, numbers):
+        bits = "".join(cls._encode_number(n) for n in numbers)
+        if len(bits) == 0:
+            return b""
+        bits += "0" * (-len(bits) % 8)
+        return int(bits, 2).to_bytes(len(bits) // 8, "big")
+
+    @classmethod
+    def decode(cls, data, count):
+        if count == 0:
+            return []
+        bits = bin(int.from_bytes(data, "big"))[2:].zfill(8 * len(data))
+        numbers = []
+        pos = 0
+        for _ in range(count):
+            n, pos = cls._decode_number(bits, pos)
+            numbers.append(n)
+        return numbers
+
+    @staticmethod
+    def _decode_gamma(bits, pos):
+        """ Reads a gamma code: as many zeros as there are bits after the leading 1 """
+        length = bits.index("1", pos) - pos
+        end = pos + 2 * length + 1
+        return int(bits[pos + length:end], 2), end
+
+
+class EliasGammaCodec(_BitCodec):
+    """ Elias gamma encoding, for numbers >= 1 """
+    name = "gamma"
+
+    @staticmethod
+    def _encode_number(n):
+        binary = bin(n)[2:]
+        return "0" * (len(binary) - 1) + binary
+
+    @classmethod
+    def _decode_number(cls, bits, pos):
+        return cls._decode_gamma(bits, pos)
+
+
+class EliasDeltaCodec(_BitCodec):
+    """ Elias delta encoding, for numbers >= 1: the length is gamma encoded """
+    name = "delta"
+
+    @staticmethod
+    def _encode_number(n):
+        binary = bin(n)[2:]
+        length = bin(len(binary))[2:]
+        return "0" * (len(length) - 1) + length + binary[1:]
+
+    @classmethod
+    def _decode_number(cls, bits, pos):
+        length, pos = cls._decode_gamma(bits, pos)
+        end = pos + length - 1
+        return int("1" + bits[pos:end], 2), end
+
+
+class BitPackingCodec():
+    """ Every number of a list is packed on the same number of bits, with NumPy """
+    name = "bitpack"
+
+    @staticmethod
+    def encode(numbers):
+        values = np.asarray(numbers, dtype=np.uint64)
+        if len(values) == 0:
+            return b""
+        width = max(int(values.max()).bit_length(), 1)
+        shifts = np.arange(width - 1, -1, -1, dtype=np.uint64)
+        bits = ((values[:, None] >> shifts) & np.uint64(1)).astype(np.uint8)
+        # The first byte holds the width of the fields
+        return bytes([width]) + np.packbits(bits.ravel()).tobytes()
+
+    @staticmethod
+    def decode(data, count):
+        if count == 0:
+            return []
+        width = data[0]
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8, offset=1))[:count * width]
+        weights = np.left_shift(np.uint64(1), np.arange(width - 1, -1, -1, dtype=np.uint64))
+        return (bits.reshape(count, width).astype(np.uint64) @ weights).tolist()
+
+
+CODECS = {
+    codec.name: codec for codec in [VariableByteCodec, EliasGammaCodec, EliasDeltaCodec, BitPackingCodec]
+}
+
+
+class CompressedIndex():
+    """
+    Reverse index {key: {docID: tf}} stored as delta-encoded docIDs and term frequencies in one byte buffer
+    Only the posting lists that are accessed get decoded
+    """
+    def __init__(self, reverse_index, codec="vbyte"):
+        if codec not in CODECS:
+            raise ValueError("Unknown codec {}. Please choose from {}".format(codec, list(CODECS.keys())))
+        self.codec = CODECS[codec]
+        self.__data = bytearray()
+        # {key: (offset, docIDs length in bytes, tfs length in bytes, document frequency)}
+        self.__entries = {}
+        # Non-integer docIDs are replaced by their rank in this table
+        self.__docID_table = None
+        self.__build(reverse_index)
+
+    def __build(self, reverse_index):
+        """ Compresses every posting list of the index """
+        docIDs = set()
+        for key in reverse_index:
+            docIDs.update(reverse_index[key].keys())
+        if not all(isinstance(docID, int) for docID in docIDs):
+            self.__docID_table = sorted(docIDs)
+        ranks = {docID: rank for rank, docID in enumerate(self.__docID_table)} if self.__docID_table else None
+
+        for key in reverse_index:
+            postings = reverse_index[key]
+            ids = sorted(ranks[docID] for docID in postings) if ranks else sorted(postings)
+            tfs = [postings[self.__docID_table[i]] for i in ids] if ranks else [postings[i] for i in ids]
+            # Gaps between consecutive docIDs, shifted by one so that every number is >= 1
+            gaps = [ids[i] - ids[i - 1] if i > 0 else ids[0] + 1 for i in range(len(ids))]
+            encoded_gaps = self.codec.encode(gaps)
+            encoded_tfs = self.codec.encode(tfs)
+            self.__entries[key] = (len(self.__data), len(encoded_gaps), len(encoded_tfs), len(ids))
+            self.__data += encoded_gaps
+            self.__data += encoded_tfs
+        self.__data = bytes(self.__data)
+
+    def __decode_docIDs(self, offset, length, df):
+        """ Decodes the gaps and accumulates them back into docIDs """
+        gaps = self.codec.decode(self.__data[offset:offset + length], df)
+        ids = []
+        current = -1
+        for gap in gaps:
+            current += gap
+            ids.append(current)
+        if self.__docID_table:
+            return [self.__docID_table[i] for i in ids]
+        return ids
+
+    def postings(self, key):
+        """ Returns the sorted docIDs of a key, without decoding the term frequencies """
+        offset, docs_length, _, df = self.__entries[key]
+        return self.__decode_docIDs(offset, docs_length, df)
+
+    def document_frequency(self, key):
+        """ Number of documents containing the key, read from the dictionary """
+        return self.__entries[key][3]
+
+    def __getitem__(self, key):
+        """ Returns the posting dict {docID: tf} of a key, like the uncompressed index """
+        offset, docs_length, tfs_length, df = self.__entries[key]
+        ids = self.__decode_docIDs(offset, docs_length, df)
+        tfs = self.codec.decode(self.__data[offset + docs_length:offset + docs_length + tfs_length], df)
+        return dict(zip(ids, tfs))
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def __iter__(self):
+        return iter(self.__entries)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    @property
+    def nbytes(self):
+        """ Size of the compressed postings, docIDs and term frequencies """
+        return len(self.__data)
+
+    def decode_throughput(self):
+        """ Decodes every posting list, returns the number of postings decoded per second """
+        t0 = time.time()
+        total = 0
+        for key in self.__entries:
+            total += len(self[key])
+        return total / max(time.time() - t0, 1e-9)
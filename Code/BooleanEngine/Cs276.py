@@ -1,19 +1,43 @@
 import os
 import sys
+from functools import partial
 import nltk
-from threading import Thread
-from queue import Queue
+import numpy as np
+from add_ins.ExternalSorter import ExternalSorter, pack, unpack
+from add_ins import IndexStore, Parallel
+from add_ins.Normalizer import Normalizer
+from add_ins.DocIDTable import DocIDTable
+from add_ins.TermDictionary import TermDictionary
+from add_ins.KGramIndex import KGramIndex
+from add_ins.FuzzyIndex import FuzzyIndex
+from . import MapReduce, DiskIndex, CSRIndex
+
+BSBI_MODES = ["disk", "numpy"]
+
+# Location of the on-disk BSBI index
+INDEX_DIRECTORY = 'BooleanEngine/cs276_index'
+
+def _load_shard(shard):
+    """ Reads and cleans the files of a shard in a mapper process, like the engine does """
+    path, folder, first_docID, files, stop_words, normalize = shard
+    # Every mapper has its own cache
+    normalizer = Normalizer() if normalize else None
+    for j, file in files:
+        doc = Parallel.clean_file(os.path.join(path, str(folder), file), stop_words)
+        yield first_docID + j, doc if normalizer is None else normalizer.normalize_document(doc)
 
 class CS276SearchEngine():
-    def __init__(self, path):
+    def __init__(self, path, workers=1, normalize=True):
         self.__PATH = path
+        # Processes used to read and clean the documents
+        self.__workers = workers
         self.__current_folder = 0
         self.__files_to_load = []
         # NLTK
         self.__stop_words = set(nltk.corpus.stopwords.words('english'))
         self.__stop_words.update(['.', ',', '"', "'", '?', '!', ':', ';', '(', ')', '[', ']', '{', '}'])
-        self.__lemmatizer = nltk.stem.WordNetLemmatizer()
-        self.__stemmer = nltk.stem.SnowballStemmer("english")
+        # Lemmatizes and stems the documents, each distinct word once
+        self.normalizer = Normalizer() if normalize else None
         # Stuff for later
         self.__current_docID = 0
         self.__clean_documents = {}
@@ -21,20 +45,26 @@ class CS276SearchEngine():
         self.__index = {}
         # Stuff for BSBI
         self.BSBI_vocabulary = {}
-        self.__BSBI_tuples = []
-        self.__BSBI_tuples_by_termID = []
-        self.__BSBI_tuples_by_termID_and_docID = []
         self.BSBI_index = {}
         self.__max_termID = 0
         # Stuff for MapReduce
         self.MR_index = {}
+        # Positions of the words, for phrase and NEAR queries
+        self.positional_index = {}
+        # k-grams of the vocabulary of an index, for wildcard queries
+        self.kgram_index = None
+        # Deletions of the vocabulary of an index, for the correction of misspelled words
+        self.fuzzy_index = None
+        # (folder, filename) of every docID, the docIDs are numbered across the folders
+        self.documents = DocIDTable()
 
     def __get_files_name_to_load(self):
         """ Loads the collection specified in the path and at the correct id """
         file_id = 0
         self.__files_to_load = []
         for root, dirs, files in os.walk(os.path.join(self.__PATH, str(self.__current_folder))):
-            for file in files:
+            # Sorted, so that the docIDs do not depend on the file system
+            for file in sorted(files):
                 self.__files_to_load.append(file)
                 sys.stdout.write("Cleaning progress: %d%%   \r" % (100 * file_id/len(files)))
                 sys.stdout.flush()
@@ -50,20 +80,11 @@ class CS276SearchEngine():
         terms_clean = list(filter(lambda word: word not in self.__stop_words, document))
         return terms_clean
 
-    def __lemmatize_document(self, document):
-        """ Lemmatizes the document """
-        lemmatized_document = []
-        for word in document:
-            lemmatized_document.append(self.__lemmatizer.lemmatize(word))
-        return lemmatized_document
-
-    def __stem_document(self, document):
-        """ Stems the document with the SnowBall Stemmer """
-        stemmed_document = []
-        for word in document:
-            stemmed_document.append(self.__stemmer.stem(word))
-        return stemmed_document
-
+    def __normalize_document(self, document):
+        """ Lemmatizes then stems the words of a document, through the cache of the normalizer """
+        if self.normalizer is None:
+            return document
+        return self.normalizer.normalize_document(document)
 
     def __clean_all_documents(self):
         """ Cleans all the documents in the current folder and updates the list and the doc/docID dict """
@@ -71,18 +92,16 @@ class CS276SearchEngine():
         self.__clean_documents = {}
         self.__clean_documents_list = []
 
-        for file in self.__files_to_load:
-            with open(os.path.join(self.__PATH, str(self.__current_folder), file), 'r') as f:
-                doc = f.read()
-                doc = self.__parse_document_into_list(doc)
-                doc = self.__filter_stop_words(doc)
-                #doc = self.__lemmatize_document(doc)
-                #doc = self.__stem_document(doc)
-                self.__clean_documents_list.append(doc)
-                self.__clean_documents[self.__current_docID] = doc
-                sys.stdout.write("Cleaning progress (Stop-words, Stemming, Lemmatizing): %d%%   \r" % (100 * self.__current_docID / len(self.__files_to_load)))
-                sys.stdout.flush()
-                self.__current_docID += 1
+        # The files are read and cleaned by the workers, the documents come back in the order of the files
+        filenames = [os.path.join(self.__PATH, str(self.__current_folder), file) for file in self.__files_to_load]
+        for doc in Parallel.map_in_order(partial(Parallel.clean_file, stop_words=self.__stop_words), filenames, self.__workers):
+            # Normalized in this process, so that every folder shares the same cache
+            doc = self.__normalize_document(doc)
+            self.__clean_documents_list.append(doc)
+            self.__clean_documents[self.__current_docID] = doc
+            sys.stdout.write("Cleaning progress (Stop-words, Stemming, Lemmatizing): %d%%   \r" % (100 * self.__current_docID / len(self.__files_to_load)))
+            sys.stdout.flush()
+            self.__current_docID += 1
                 
 
     @staticmethod
@@ -94,14 +113,20 @@ class CS276SearchEngine():
         return vocabulary
 
     def __initialize_engine(self):
-        """ Initialize engine by reading and parsing the data """
+        """ Initialize engine by reading and parsing the data, returns the docID of the first document of the folder """
         print("Engine started")
         print("Reading database...")
-        self.__get_files_name_to_load()
+        first_docID = self.__number_documents()
         print("Splitting into documents...")
         print("Dropping unwanted markers and filtering stop-words...               ")
         self.__clean_all_documents()
         print("Successfully created a clean list of documents !              ")
+        return first_docID
+
+    def __number_documents(self):
+        """ Lists the files of the current folder and gives them their docIDs, returns the docID of the first one """
+        self.__get_files_name_to_load()
+        return self.documents.add_folder(self.__current_folder, self.__files_to_load)
 
     ################## USED WITH EXTERNAL SORTING TO CREATE THE TERMID/DOCID TUPLES ############# 
     # def __create_partial_term_termID_dict(self):
@@ -127,24 +152,24 @@ class CS276SearchEngine():
     #         self.__create_partial_term_termID_dict()
     ##############################################################################################
 
-    @staticmethod
-    def __get_termID(t):
-        """ Used for sorting """
-        return t[0]
-
-    @staticmethod
-    def __get_docID(t):
-        """ Used for sorting """
-        return t[1]
-    
-    def create_BSBI_index(self):
-        """ Supposes that the term/termID (self.BSBI_vocabulary) is already computed, checks if not """
-
-        # Iterate on the documents to gather tuples (termID, docID)
+    def create_BSBI_index(self, memory_budget=64 * 2**20, index_directory=INDEX_DIRECTORY, mode="disk"):
+        """
+        Block sort-based indexing: the (termID, docID) pairs are sorted by blocks that fit in the memory budget
+        (in bytes), written to disk as runs and merged into an inverted index on disk
+        In numpy mode, the pairs are kept in memory as NumPy arrays and aggregated into a CSR index
+        """
+        if mode not in BSBI_MODES:
+            raise ValueError("Unknown BSBI mode {}. Please choose from {}".format(mode, BSBI_MODES))
+        sorter = ExternalSorter(os.path.join(index_directory, "runs"), memory_budget) if mode == "disk" else None
+        # The vocabulary is a dict while the folders are read
+        self.BSBI_vocabulary = {}
+        self.__max_termID = 0
+        termID_arrays = []
+        docID_arrays = []
         for i in range(10):
             self.__current_folder = i
             print("Current folder is: {}".format(self.__current_folder))
-            self.__initialize_engine()
+            first_docID = self.__initialize_engine()
 
             # Add the new vocabulary to the document
             current_doc_number = 0
@@ -160,54 +185,51 @@ class CS276SearchEngine():
                 sys.stdout.flush()
                 current_doc_number += 1 
             current_doc_number = 0
-            #self.__BSBI_tuples = []
-            #self.__BSBI_tuples_by_termID = []
-            #self.__BSBI_tuples_by_termID_and_docID = []
+            if mode == "numpy":
+                # One array of termIDs and one of docIDs for the whole folder
+                lengths = [len(document) for document in self.__clean_documents_list]
+                docID_arrays.append(np.repeat(np.arange(first_docID, first_docID + len(lengths), dtype=np.int32), lengths))
+                termID_arrays.append(np.fromiter(
+                    (self.BSBI_vocabulary[word] for document in self.__clean_documents_list for word in document),
+                    dtype=np.int32, count=sum(lengths)
+                ))
+                continue
             for j in self.__clean_documents:
                 current_doc = self.__clean_documents[j]
                 for word in current_doc:
-                    self.__BSBI_tuples.append((self.BSBI_vocabulary[word], str(i) + str(j)))
+                    sorter.add(pack(self.BSBI_vocabulary[word], first_docID + j))
                 sys.stdout.write("Gathering tuples (termID, docID): %d%%                  \r" % (100 * current_doc_number/len(self.__clean_documents_list)))
                 sys.stdout.flush()
                 current_doc_number += 1
-                    
-        # Sort the tuples by termID
-        self.__BSBI_tuples_by_termID = sorted(self.__BSBI_tuples, key=self.__get_termID)
-        sys.stdout.write("Sorted BSBI Tuples by TermID                                  \r")
 
-        # Sort again on docID
-        # Do not break the order. Work with batches with the same termID and sort in place
-        current_termID = 0
-        current_batch = []
-        for t in self.__BSBI_tuples_by_termID:
-            if self.__get_termID(t) == current_termID:
-                current_batch.append(t)
-            else:
-                self.__BSBI_tuples_by_termID_and_docID += sorted(current_batch, key=self.__get_docID)
-                current_batch = [t]
-                current_termID += 1
-        sys.stdout.write("Sorted BSBI Tuples by TermID & DocID                        \r")
+        # The vocabulary is complete, its terms are front-coded instead of being kept as Python objects
+        self.BSBI_vocabulary = TermDictionary.from_dict(self.BSBI_vocabulary)
+        if mode == "numpy":
+            self.BSBI_index = CSRIndex.build_index(np.concatenate(termID_arrays), np.concatenate(docID_arrays), self.__max_termID)
+            print("Created reverse index for the BSBI algorithm")
+            return
 
-        # Merge the tuples
-        current_termID = 0
-        current_posting_dic = {}
-        current_doc_number = 0
-        for t in self.__BSBI_tuples_by_termID_and_docID:
-            try:
-                self.BSBI_index[self.__get_termID(t)]
-                try:
-                    self.BSBI_index[self.__get_termID(t)][self.__get_docID(t)]
-                    self.BSBI_index[self.__get_termID(t)][self.__get_docID(t)] += 1
-                except KeyError:
-                    self.BSBI_index[self.__get_termID(t)][self.__get_docID(t)] = 1
-            except KeyError:
-                self.BSBI_index[self.__get_termID(t)] = {}
-                self.BSBI_index[self.__get_termID(t)][self.__get_docID(t)] = 1
-            
-            sys.stdout.write("Merging results: %d%%                      \r" % (100 * current_doc_number/len(self.__BSBI_tuples_by_termID_and_docID)))
-            sys.stdout.flush()
-            current_doc_number += 1
-        print("Created reverse index for the BSBI algorithm")
+        # Merge the sorted runs into the final index
+        sys.stdout.write("Merging the sorted runs...                              \r")
+        sys.stdout.flush()
+        pairs = (unpack(key) for key in sorter.merge())
+        DiskIndex.write_index(index_directory, DiskIndex.postings_from_pairs(pairs))
+        self.BSBI_index = DiskIndex.DiskIndex(index_directory)
+        print("Created reverse index for the BSBI algorithm in {}".format(index_directory))
+
+    # POSITIONAL INDEX
+    def create_positional_index(self):
+        """ Create an index {word: {docID: [positions]}}, with the docIDs of the BSBI and MR indexes """
+        self.positional_index = {}
+        for i in range(10):
+            self.__current_folder = i
+            print("Current folder is: {}".format(self.__current_folder))
+            first_docID = self.__initialize_engine()
+            for j in self.__clean_documents:
+                for position, word in enumerate(self.__clean_documents[j]):
+                    postings = self.positional_index.setdefault(word, {})
+                    postings.setdefault(first_docID + j, []).append(position)
+        print("Created positional index")
 
     # MAPREDUCE ALGORITHM
     @staticmethod
@@ -230,88 +252,96 @@ class CS276SearchEngine():
                 self.MR_index[t[0]] = {}
                 self.MR_index[t[0]][t[1]] = 1
 
-    def create_MR_index(self, threading=False):
-        if not threading:
+    def create_MR_index(self, workers=1):
+        """ Create an index with MapReduce, in a pool of processes if there are several workers """
+        if workers == 1:
             for i in range(10):
                 self.__current_folder = i
                 print("Current folder is: {}".format(self.__current_folder))
-                self.__initialize_engine()
+                first_docID = self.__initialize_engine()
                 buffer = []
-                for i in self.__clean_documents:
-                    buffer.append(self.__mapper(self.__clean_documents[i], i))
+                for j in self.__clean_documents:
+                    buffer.append(self.__mapper(self.__clean_documents[j], first_docID + j))
                 for b in buffer:
                     self.__reducer(b)
         else:
-            # Create the synchronised queue
-            docs_queue = Queue()
+            # The mappers read and clean their own files, only the file names are sent to them
+            shards = []
             for i in range(10):
                 self.__current_folder = i
-                print("Current folder is: {}".format(self.__current_folder))
-                self.__initialize_engine()
-                for doc in self.__clean_documents:
-                    docs_queue.put(doc)
-            buffer = Queue()
-
-            # Create the index
-            MR_index = {}
-            global continuer
-            continuer = True
-
-            # Create the threads
-            class mapper(Thread):
-                def __init__(self, documents):
-                    Thread.__init__(self)
-                    self.__documents = documents
+                first_docID = self.__number_documents()
+                files = list(enumerate(self.__files_to_load))
+                for files_shard in MapReduce.split(files, 4 * workers):
+                    shards.append((self.__PATH, i, first_docID, files_shard, self.__stop_words, self.normalizer is not None))
+            print("Mapping {} shards on {} workers...".format(len(shards), workers))
+            self.MR_index = MapReduce.build_index(shards, load=_load_shard, workers=workers)
 
-                def run(self):
-                    while not docs_queue.empty():
-                        docID = docs_queue.get()
-
-                        res = []
-                        for word in self.__documents[docID]:
-                            res.append((word, docID))
-
-                        buffer.put(res)
-                        docs_queue.task_done()
+    # K-GRAM INDEX
+    def create_kgram_index(self, method="BSBI"):
+        """ Create the k-gram index of the terms of the BSBI or MR index, for wildcard queries """
+        if method == "BSBI":
+            # The lists of the k-grams hold ranks in the front-coded vocabulary, the terms are not copied
+            self.kgram_index = KGramIndex.from_vocabulary(self.BSBI_vocabulary)
+        else:
+            self.kgram_index = KGramIndex.build(self.MR_index)
+        print("Created k-gram index")
 
-            class reducer(Thread):
-                def __init__(self):
-                    Thread.__init__(self)
+    # FUZZY INDEX
+    def create_fuzzy_index(self, method="BSBI"):
+        """ Create the deletions of the terms of the BSBI or MR index, for the correction of misspelled words """
+        if method == "BSBI":
+            self.fuzzy_index = FuzzyIndex.from_vocabulary(self.BSBI_vocabulary)
+        else:
+            self.fuzzy_index = FuzzyIndex.build(self.MR_index)
+        print("Created fuzzy index")
 
-                def run(self):
-                    while (not buffer.empty()) or continuer:
-                        tuples_list = buffer.get()
+    # SAVED INDEX
+    def save_index(self, directory, method="BSBI"):
+        """ Saves the BSBI or MR index in the on-disk format, with the positions, the k-grams and the deletions if they were built """
+        if method == "BSBI":
+            terms = [term for term, termID in self.BSBI_vocabulary.items() if termID in self.BSBI_index]
+            postings = lambda term: self.BSBI_index[self.BSBI_vocabulary[term]]
+        else:
+            terms = self.MR_index
+            postings = self.MR_index.__getitem__
+        IndexStore.save(
+            directory, terms, postings,
+            positions=self.positional_index.__getitem__ if len(self.positional_index) > 0 else None,
+            metadata={"engine": "boolean", "collection": "CS276", "method": method, "normalization": self.normalizer is not None},
+            kgrams=self.kgram_index is not None, deletions=self.fuzzy_index is not None
+        )
+        if self.normalizer is not None:
+            self.normalizer.save(directory)
+        self.documents.save(directory)
+        print("Saved the index in {}".format(directory))
 
-                        for t in tuples_list:
-                            if t[0] in MR_index:
-                                if t[1] in MR_index[t[0]]:
-                                    MR_index[t[0]][t[1]] += 1
-                                else:
-                                    MR_index[t[0]][t[1]] = 1
-                            else:
-                                MR_index[t[0]] = {}
-                                MR_index[t[0]][t[1]] = 1
-                        
-                        buffer.task_done()
+    # SEGMENTS
+    def update_segments(self, segments):
+        """
+        Adds the files that are not in the segments yet, the new files of a folder make a new segment
+        The files are found by name in the docID table saved with the segments, a new file gets a docID after every other one
+        """
+        self.documents = segments.document_table()
+        added = 0
+        for i in range(10):
+            self.__current_folder = i
+            self.__get_files_name_to_load()
+            # Deleted files are still in the table, they are not added again
+            indexed = self.documents.files(self.__current_folder)
+            self.__files_to_load = [file for file in self.__files_to_load if file not in indexed]
+            # Folders without new files are not read
+            if len(self.__files_to_load) == 0:
+                continue
+            print("Current folder is: {}".format(self.__current_folder))
+            first_docID = self.documents.add_files(self.__current_folder, self.__files_to_load)
+            self.__clean_all_documents()
+            segments.add_new_documents({first_docID + j: document for j, document in self.__clean_documents.items()})
+            # Saved with every segment, so that the table always covers the docIDs of the segments
+            self.documents.save(segments.directory)
+            added += len(self.__files_to_load)
+        print("Added {} new documents to the segments".format(added))
 
-            # Run the threads
-            M = []
-            R = []
-            # MAPPERS
-            for tm in range(5):
-                M.append(mapper(self.__clean_documents))
-                M[tm].start()
-            # REDUCERS
-            for tr in range(5):
-                R.append(reducer())
-                R[tr].start()
-            # Wait for the mappers to finish
-            for tm in range(5):
-                M[tm].join()
-            # Let the reducers stop if the queue is empty
-            continuer = False
-            # Wait for the reducers to finish
-            for tr in range(5):
-                R[tr].join()
-            # Put the dictionnary back
-            self.MR_index = MR_index
+    def clean_text(self, text):
+        """ Clean words of a new text of a document, cleaned like the files of the collection """
+        document = self.__filter_stop_words(self.__parse_document_into_list(text))
+        return self.__normalize_document(document)
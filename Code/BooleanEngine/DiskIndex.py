@@ -0,0 +1,97 @@
+import os
+from array import array
+import numpy as np
+
+POSTINGS_FILENAME = "postings.bin"
+DICTIONARY_FILENAME = "dictionary.bin"
+
+def write_index(directory, postings):
+    """
+    Writes an inverted index on disk from the (termID, docIDs, tfs) of every term, sorted by termID
+    postings.bin holds the docIDs then the term frequencies of each term, as 32 bits integers
+    dictionary.bin holds a (termID, offset, document frequency) triple per term
+    """
+    os.makedirs(directory, exist_ok=True)
+    dictionary = array('Q')
+    offset = 0
+    with open(os.path.join(directory, POSTINGS_FILENAME), 'wb') as f:
+        for termID, docIDs, tfs in postings:
+            array('I', docIDs).tofile(f)
+            array('I', tfs).tofile(f)
+            dictionary.extend((termID, offset, len(docIDs)))
+            offset += 8 * len(docIDs)
+    with open(os.path.join(directory, DICTIONARY_FILENAME), 'wb') as f:
+        dictionary.tofile(f)
+
+def postings_from_pairs(pairs):
+    """ Groups sorted (termID, docID) pairs, one per occurrence, into the (termID, docIDs, tfs) of every term """
+    termID, docIDs, tfs = None, [], []
+    for t, docID in pairs:
+        if t != termID:
+            if termID is not None:
+                yield termID, docIDs, tfs
+            termID, docIDs, tfs = t, [], []
+        if len(docIDs) > 0 and docIDs[-1] == docID:
+            tfs[-1] += 1
+        else:
+            docIDs.append(docID)
+            tfs.append(1)
+    if termID is not None:
+        yield termID, docIDs, tfs
+
+
+class DiskIndex():
+    """
+    Inverted index {termID: {docID: tf}} stored on disk, only the dictionary is kept in memory
+    A posting list is read from disk when it is accessed
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.__postings_filename = os.path.join(directory, POSTINGS_FILENAME)
+        dictionary = array('Q')
+        with open(os.path.join(directory, DICTIONARY_FILENAME), 'rb') as f:
+            dictionary.frombytes(f.read())
+        # {termID: (offset, document frequency)}
+        self.__entries = {dictionary[i]: (dictionary[i + 1], dictionary[i + 2]) for i in range(0, len(dictionary), 3)}
+
+    def __read(self, key, with_tfs):
+        offset, df = self.__entries[key]
+        with open(self.__postings_filename, 'rb') as f:
+            f.seek(offset)
+            data = array('I')
+            data.frombytes(f.read(4 * df * (2 if with_tfs else 1)))
+        return data
+
+    def arrays(self, key):
+        """ Returns the docIDs and term frequencies of a key, as NumPy arrays """
+        data = np.frombuffer(self.__read(key, True), dtype=np.uint32)
+        df = len(data) // 2
+        return data[:df], data[df:]
+
+    def postings(self, key):
+        """ Returns the sorted docIDs of a key, without reading the term frequencies """
+        return self.__read(key, False)
+
+    def document_frequency(self, key):
+        """ Number of documents containing the key, read from the dictionary """
+        return self.__entries[key][1]
+
+    def __getitem__(self, key):
+        """ Returns the posting dict {docID: tf} of a key, like the in-memory index """
+        data = self.__read(key, True)
+        df = len(data) // 2
+        return dict(zip(data[:df], data[df:]))
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def __iter__(self):
+        return iter(self.__entries)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    @property
+    def nbytes(self):
+        """ Size of the postings file """
+        return os.path.getsize(self.__postings_filename)
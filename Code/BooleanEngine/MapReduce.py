@@ -0,0 +1,56 @@
+import os
+import zlib
+from multiprocessing import Pool
+
+def partition(term, reducers):
+    """ Reducer in charge of a term, stable between processes unlike hash() """
+    return zlib.crc32(term.encode('utf-8')) % reducers
+
+def _documents(shard):
+    """ Default loader: the shard already is a list of (docID, words) """
+    return shard
+
+def _map(load, shard, reducers):
+    """
+    Mapper: counts the (term, docID) pairs of a shard of documents
+    Returns one {term: {docID: tf}} partition per reducer
+    """
+    partitions = [{} for _ in range(reducers)]
+    for docID, words in load(shard):
+        for word in words:
+            postings = partitions[partition(word, reducers)].setdefault(word, {})
+            postings[docID] = postings.get(docID, 0) + 1
+    return partitions
+
+def _reduce(partials):
+    """ Reducer: merges the partial postings of its terms, in the order of the shards """
+    index = {}
+    for partial in partials:
+        for word, postings in partial.items():
+            merged = index.setdefault(word, {})
+            for docID, tf in postings.items():
+                merged[docID] = merged.get(docID, 0) + tf
+    return index
+
+def build_index(shards, load=_documents, workers=None):
+    """
+    Builds a reverse index {term: {docID: tf}} with a pool of processes
+    load(shard) runs in the mappers and yields the (docID, words) of a shard, it must be a module-level function
+    """
+    workers = workers or os.cpu_count()
+    with Pool(workers) as pool:
+        mapped = pool.starmap(_map, [(load, shard, workers) for shard in shards])
+        # Shuffle: the r-th partition of every mapper goes to the r-th reducer
+        reduced = pool.map(_reduce, [[partitions[r] for partitions in mapped] for r in range(workers)])
+    # The partitions have no term in common
+    index = {}
+    for partial_index in reduced:
+        index.update(partial_index)
+    return index
+
+def split(items, shards):
+    """ Splits a list into contiguous shards of similar sizes """
+    if shards < 1:
+        raise ValueError("A list cannot be split into {} shards. Please use a positive number of shards".format(shards))
+    size = max(1, -(-len(items) // shards))
+    return [items[i:i + size] for i in range(0, len(items), size)]
@@ -0,0 +1,91 @@
+import re
+from .Postings import END
+
+# "exact phrase" and word NEAR/k word in a free-text query
+PHRASE_PATTERN = re.compile(r'"([^"]*)"')
+NEAR_PATTERN = re.compile(r'(\S+)\s+near/(\d+)\s+(?=(\S+))', re.IGNORECASE)
+NEAR_OPERATOR = re.compile(r'\s+near/\d+\s+', re.IGNORECASE)
+
+PHRASE_WINDOW = (1, 1)
+
+def near_window(k):
+    """ Allowed offsets between two words at most k positions apart, in any order """
+    return (-k, k)
+
+def match(position_lists, windows):
+    """
+    Positional merge of the sorted positions of consecutive words in a document
+    True if there are positions p0, p1 ... with low <= p(i+1) - p(i) <= high for the i-th window (low, high)
+    """
+    current = position_lists[0]
+    for positions, (low, high) in zip(position_lists[1:], windows):
+        reached = []
+        j = 0
+        for p in positions:
+            # Both lists are sorted: the first position that can precede p only moves forward
+            while j < len(current) and current[j] < p - high:
+                j += 1
+            if j < len(current) and current[j] <= p - low:
+                reached.append(p)
+        if len(reached) == 0:
+            return False
+        current = reached
+    return True
+
+
+class PositionalCursor():
+    """ Documents of a docID cursor whose word positions satisfy the windows """
+    def __init__(self, candidates, positions, windows):
+        # candidates streams the documents containing every word, led by the rarest one
+        self.__candidates = candidates
+        # {docID: [positions]} of every word, in the order of the phrase
+        self.__positions = positions
+        self.__windows = windows
+        self.__find()
+
+    def __find(self):
+        while self.__candidates.doc is not END and not self.__match(self.__candidates.doc):
+            self.__candidates.next()
+        self.doc = self.__candidates.doc
+
+    def __match(self, docID):
+        position_lists = [positions.get(docID) for positions in self.__positions]
+        if any(p is None for p in position_lists):
+            return False
+        return match(position_lists, self.__windows)
+
+    def next(self):
+        self.__candidates.next()
+        self.__find()
+
+    def seek(self, target):
+        self.__candidates.seek(target)
+        self.__find()
+
+
+def matching_documents(index, words, windows):
+    """ Set of the docIDs of a positional index {word: {docID: [positions]}} where the words satisfy the windows """
+    if any(word not in index for word in words):
+        return set()
+    postings = [index[word] for word in words]
+    # The rarest word gives the candidates, the others are only probed
+    rarest = min(postings, key=len)
+    documents = set()
+    for docID in rarest:
+        if all(docID in p for p in postings) and match([p[docID] for p in postings], windows):
+            documents.add(docID)
+    return documents
+
+def extract_constraints(query):
+    """
+    Splits a free-text query into its positional constraints and plain text
+    Returns ([(text, window)], text), the words of the constraints are kept in the text to be ranked
+    """
+    constraints = []
+    for phrase in PHRASE_PATTERN.findall(query):
+        constraints.append((phrase, PHRASE_WINDOW))
+    text = PHRASE_PATTERN.sub(lambda m: " " + m.group(1) + " ", query)
+    for left, k, right in NEAR_PATTERN.findall(text):
+        constraints.append((left + " " + right, near_window(int(k))))
+    text = NEAR_OPERATOR.sub(" ", text)
+    return constraints, text
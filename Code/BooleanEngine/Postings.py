@@ -0,0 +1,216 @@
+import heapq
+from array import array
+from bisect import bisect_left
+from functools import total_ordering
+from math import sqrt
+
+# Above this length ratio, the shorter list is galloped into the longer one
+GALLOP_RATIO = 8
+# Lists shorter than this do not get skip pointers
+MIN_SKIP_LENGTH = 16
+
+class PostingList():
+    """ Sorted docIDs in a compact array, with implicit skip pointers every sqrt(n) postings """
+    def __init__(self, docIDs):
+        try:
+            self.docIDs = array('q', docIDs)
+        except TypeError:
+            # docIDs that are not integers (CS276 BSBI) are kept in a sorted list
+            self.docIDs = list(docIDs)
+        n = len(self.docIDs)
+        self.skip = int(sqrt(n)) if n >= MIN_SKIP_LENGTH else 0
+
+    @classmethod
+    def from_dict(cls, postings):
+        """ Builds the posting list of a {docID: tf} dict """
+        return cls(sorted(postings))
+
+    def __len__(self):
+        return len(self.docIDs)
+
+    def __iter__(self):
+        return iter(self.docIDs)
+
+    def __repr__(self):
+        return "PostingList({})".format(list(self.docIDs))
+
+
+def _merge_with_skips(a, b):
+    """ Linear merge of two lists of similar lengths, following the skip pointers when possible """
+    A, B = a.docIDs, b.docIDs
+    i = j = 0
+    result = []
+    while i < len(A) and j < len(B):
+        x, y = A[i], B[j]
+        if x == y:
+            result.append(x)
+            i += 1
+            j += 1
+        elif x < y:
+            if a.skip and i % a.skip == 0 and i + a.skip < len(A) and A[i + a.skip] <= y:
+                while i % a.skip == 0 and i + a.skip < len(A) and A[i + a.skip] <= y:
+                    i += a.skip
+            else:
+                i += 1
+        else:
+            if b.skip and j % b.skip == 0 and j + b.skip < len(B) and B[j + b.skip] <= x:
+                while j % b.skip == 0 and j + b.skip < len(B) and B[j + b.skip] <= x:
+                    j += b.skip
+            else:
+                j += 1
+    return result
+
+def _gallop(small, large):
+    """ Looks for every docID of the short list in the long one with an exponential search """
+    S, L = small.docIDs, large.docIDs
+    n = len(L)
+    result = []
+    pos = 0
+    for x in S:
+        bound = 1
+        while pos + bound < n and L[pos + bound] < x:
+            bound *= 2
+        pos = bisect_left(L, x, pos + bound // 2, min(pos + bound, n - 1) + 1)
+        if pos >= n:
+            break
+        if L[pos] == x:
+            result.append(x)
+    return result
+
+def intersect(a, b):
+    """ AND of two posting lists, in time proportional to the shorter one when they are unbalanced """
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) == 0:
+        return PostingList([])
+    if len(b) >= GALLOP_RATIO * len(a):
+        return PostingList(_gallop(a, b))
+    return PostingList(_merge_with_skips(a, b))
+
+def union(*posting_lists):
+    """ OR of any number of posting lists, with a k-way merge """
+    result = []
+    for docID in heapq.merge(*(pl.docIDs for pl in posting_lists)):
+        if len(result) == 0 or result[-1] != docID:
+            result.append(docID)
+    return PostingList(result)
+
+
+@total_ordering
+class _EndOfList():
+    """ Sentinel docID of an exhausted cursor, greater than any docID """
+    def __eq__(self, other):
+        return self is other
+
+    def __lt__(self, other):
+        return False
+
+    def __hash__(self):
+        return 0
+
+    def __repr__(self):
+        return "END"
+
+END = _EndOfList()
+
+
+class PostingCursor():
+    """ Streaming iterator over a posting list, which can jump forward """
+    def __init__(self, posting_list):
+        self.__docIDs = posting_list.docIDs
+        self.__pos = 0
+        self.doc = self.__docIDs[0] if len(self.__docIDs) > 0 else END
+
+    def __move(self, pos):
+        self.__pos = pos
+        self.doc = self.__docIDs[pos] if pos < len(self.__docIDs) else END
+
+    def next(self):
+        """ Moves to the next docID """
+        self.__move(self.__pos + 1)
+
+    def seek(self, target):
+        """ Moves to the first docID >= target, with an exponential search from the current position """
+        if self.doc is END or not self.doc < target:
+            return
+        if target is END:
+            self.__move(len(self.__docIDs))
+            return
+        L, pos, n = self.__docIDs, self.__pos, len(self.__docIDs)
+        bound = 1
+        while pos + bound < n and L[pos + bound] < target:
+            bound *= 2
+        self.__move(bisect_left(L, target, pos + bound // 2, min(pos + bound + 1, n)))
+
+
+class AndCursor():
+    """ Documents present in every positive cursor and in none of the negative ones """
+    def __init__(self, positives, negatives=()):
+        # The first positive cursor should be the shortest list, it leads the search
+        self.__positives = positives
+        self.__negatives = negatives
+        self.doc = None
+        self.__find(positives[0].doc)
+
+    def __find(self, candidate):
+        """ Leapfrogs the cursors until they agree on a docID >= candidate """
+        while candidate is not END:
+            agreed = True
+            for cursor in self.__positives:
+                cursor.seek(candidate)
+                if cursor.doc != candidate:
+                    candidate = cursor.doc
+                    agreed = False
+                    break
+            if not agreed:
+                continue
+            # AND NOT: the negative lists are only probed at the candidate docID
+            excluded = False
+            for cursor in self.__negatives:
+                cursor.seek(candidate)
+                if cursor.doc == candidate:
+                    excluded = True
+                    break
+            if not excluded:
+                break
+            self.__positives[0].next()
+            candidate = self.__positives[0].doc
+        self.doc = candidate
+
+    def next(self):
+        self.__positives[0].next()
+        self.__find(self.__positives[0].doc)
+
+    def seek(self, target):
+        if self.doc is END or not self.doc < target:
+            return
+        self.__find(target)
+
+
+class OrCursor():
+    """ K-way merge of any number of cursors, every docID is returned once """
+    def __init__(self, children):
+        self.__children = children
+        self.__heap = [(child.doc, i) for i, child in enumerate(children) if child.doc is not END]
+        heapq.heapify(self.__heap)
+        self.__update()
+
+    def __update(self):
+        self.doc = self.__heap[0][0] if len(self.__heap) > 0 else END
+
+    def next(self):
+        current = self.doc
+        while len(self.__heap) > 0 and self.__heap[0][0] == current:
+            _, i = heapq.heappop(self.__heap)
+            self.__children[i].next()
+            if self.__children[i].doc is not END:
+                heapq.heappush(self.__heap, (self.__children[i].doc, i))
+        self.__update()
+
+    def seek(self, target):
+        while len(self.__heap) > 0 and self.__heap[0][0] < target:
+            _, i = heapq.heappop(self.__heap)
+            self.__children[i].seek(target)
+            if self.__children[i].doc is not END:
+                heapq.heappush(self.__heap, (self.__children[i].doc, i))
+        self.__update()
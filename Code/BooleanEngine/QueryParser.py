@@ -0,0 +1,128 @@
+import re
+from .QueryPlanner import TermNode, NotNode, OperatorNode, PositionalNode, WildcardNode
+from . import Positional
+
+# "Phrases", parentheses, + and - operators at the start of a word, and words
+TOKEN_PATTERN = re.compile(r'"[^"]*"|[()]|(?<!\S)[+-]|[^\s()"]+')
+NEAR_TOKEN = re.compile(r'near/(\d+)$')
+OPERATORS = ['and', 'or', 'not', '+', '-']
+PARENTHESES = ['(', ')']
+
+class QueryParser():
+    """
+    Parser of the boolean query language, by increasing precedence:
+    a OR b, a AND b (also a + b, or a b), NOT a (also -a), a NEAR/k b, "exact phrases" and parentheses
+    A * in a word stands for any characters, e.g. comput*, *tion or multi*ing
+    """
+    def __init__(self, stop_words=()):
+        self.__stop_words = stop_words
+        self.__tokens = []
+        self.__pos = 0
+
+    def tokenize(self, query):
+        """ Splits the query into lowercase tokens, the stop-words are dropped but not the operators and parentheses """
+        tokens = [token.lower() for token in TOKEN_PATTERN.findall(query)]
+        return [token for token in tokens if self.__is_special(token) or token not in self.__stop_words]
+
+    @staticmethod
+    def __is_special(token):
+        """ Operators, parentheses and phrases are never dropped """
+        return token in OPERATORS or token in PARENTHESES or token.startswith('"') or NEAR_TOKEN.match(token)
+
+    def parse(self, query):
+        """ Returns the operator tree of the query, raises a ValueError if it is malformed """
+        self.__tokens = self.tokenize(query)
+        self.__pos = 0
+        if len(self.__tokens) == 0:
+            raise ValueError("The query is empty")
+        tree = self.__parse_or()
+        if self.__pos < len(self.__tokens):
+            raise ValueError("Unexpected '{}' in the query".format(self.__tokens[self.__pos]))
+        return tree
+
+    def __peek(self):
+        if self.__pos < len(self.__tokens):
+            return self.__tokens[self.__pos]
+        return None
+
+    def __next(self):
+        token = self.__peek()
+        if token is None:
+            raise ValueError("A term is missing at the end of the query")
+        self.__pos += 1
+        return token
+
+    def __parse_or(self):
+        children = [self.__parse_and()]
+        while self.__peek() == 'or':
+            self.__pos += 1
+            children.append(self.__parse_and())
+        return children[0] if len(children) == 1 else OperatorNode('or', children)
+
+    def __parse_and(self):
+        children = [self.__parse_not()]
+        while True:
+            token = self.__peek()
+            if token == 'and' or token == '+':
+                self.__pos += 1
+                children.append(self.__parse_not())
+            elif token is not None and token != 'or' and token != ')':
+                # No operator between two terms defaults to AND
+                children.append(self.__parse_not())
+            else:
+                break
+        return children[0] if len(children) == 1 else OperatorNode('and', children)
+
+    def __parse_not(self):
+        if self.__peek() == 'not' or self.__peek() == '-':
+            self.__pos += 1
+            return NotNode(self.__parse_not())
+        return self.__parse_near()
+
+    def __parse_near(self):
+        """ Chains of words or phrases joined by NEAR/k, the window applies between neighbouring words """
+        node = self.__parse_primary()
+        while self.__peek() is not None and NEAR_TOKEN.match(self.__peek()):
+            k = int(NEAR_TOKEN.match(self.__next()).group(1))
+            right = self.__parse_primary()
+            left_terms, left_windows, left_label = self.__positional_operand(node)
+            right_terms, right_windows, right_label = self.__positional_operand(right)
+            node = PositionalNode(left_terms + right_terms,
+                                  left_windows + [Positional.near_window(k)] + right_windows,
+                                  "{} NEAR/{} {}".format(left_label, k, right_label))
+        return node
+
+    @staticmethod
+    def __positional_operand(node):
+        """ Words, windows and label of an operand of NEAR """
+        if isinstance(node, TermNode):
+            return [node], [], "'{}'".format(node.term)
+        if isinstance(node, PositionalNode):
+            return node.terms, node.windows, node.label
+        raise ValueError("NEAR can only be used between words or phrases")
+
+    def __parse_primary(self):
+        token = self.__next()
+        if token == '(':
+            node = self.__parse_or()
+            if self.__peek() != ')':
+                raise ValueError("A closing parenthesis is missing")
+            self.__pos += 1
+            return node
+        if token.startswith('"'):
+            return self.__phrase(token)
+        if token in OPERATORS or token == ')' or NEAR_TOKEN.match(token):
+            raise ValueError("Unexpected '{}' in the query".format(token))
+        if '*' in token:
+            return WildcardNode(token)
+        return TermNode(token)
+
+    def __phrase(self, token):
+        """ A phrase of one word is a simple term """
+        words = [word for word in token.strip('"').split() if word not in self.__stop_words]
+        if len(words) == 0:
+            raise ValueError("The phrase {} has no searchable word".format(token))
+        if len(words) == 1:
+            return TermNode(words[0])
+        return PositionalNode([TermNode(word) for word in words], [Positional.PHRASE_WINDOW] * (len(words) - 1),
+                              "PHRASE '{}'".format(" ".join(words)))
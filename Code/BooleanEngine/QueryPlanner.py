@@ -0,0 +1,239 @@
+from . import Postings, Positional
+
+# Corrections of a misspelled word printed, the most frequent first
+SUGGESTIONS = 3
+
+class TermNode():
+    """ Leaf of a plan: the posting list of one term """
+    def __init__(self, term):
+        self.term = term
+        self.key = None # Key in the reverse index, None if the term is unknown
+        self.df = 0
+        self.correction = None # Indexed term searched instead of a misspelled term
+
+    @property
+    def estimate(self):
+        """ Estimated number of documents, exact for a term """
+        return self.df
+
+    def cursor(self, fetch):
+        if self.key is None:
+            return Postings.PostingCursor(Postings.PostingList([]))
+        return Postings.PostingCursor(fetch(self.key))
+
+    def describe(self, depth=0):
+        if self.correction is not None:
+            return ["{}term '{}' -> '{}' (df {})".format("  " * depth, self.term, self.correction, self.df)]
+        return ["{}term '{}' (df {})".format("  " * depth, self.term, self.df)]
+
+
+class WildcardNode():
+    """ Term with * wildcards: the OR of the terms of the index matching it """
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.terms = [] # TermNode of every matching term, found by the planner
+
+    @property
+    def estimate(self):
+        """ Upper bound given by the sum of the document frequencies """
+        return sum(term.df for term in self.terms)
+
+    def cursor(self, fetch):
+        # K-way merge of the posting lists of the matching terms
+        return Postings.OrCursor([term.cursor(fetch) for term in self.terms])
+
+    def describe(self, depth=0):
+        return ["{}wildcard '{}' ({} terms, est. {})".format("  " * depth, self.pattern, len(self.terms), self.estimate)] + \
+            [line for term in self.terms for line in term.describe(depth + 1)]
+
+
+class PositionalNode():
+    """ Phrase or NEAR/k: documents where consecutive words are within the given windows """
+    def __init__(self, terms, windows, label):
+        self.terms = terms # TermNode of every word, in the order of the query
+        self.windows = windows # (low, high) offsets between two consecutive words
+        self.label = label
+        self.positions = [] # {docID: [positions]} of every word
+
+    @property
+    def estimate(self):
+        """ Upper bound given by the rarest word """
+        return min(term.estimate for term in self.terms)
+
+    def cursor(self, fetch):
+        if self.estimate == 0:
+            return Postings.PostingCursor(Postings.PostingList([]))
+        # The rarest word leads the docID intersection, positions are only merged on common documents
+        terms = sorted(self.terms, key=lambda term: term.estimate)
+        candidates = Postings.AndCursor([term.cursor(fetch) for term in terms])
+        return Positional.PositionalCursor(candidates, self.positions, self.windows)
+
+    def describe(self, depth=0):
+        return ["{}{} (est. {})".format("  " * depth, self.label, self.estimate)] + \
+            [line for term in self.terms for line in term.describe(depth + 1)]
+
+
+class NotNode():
+    """ Negation of its child, only evaluated as an AND NOT inside an AND """
+    def __init__(self, child):
+        self.child = child
+
+    @property
+    def estimate(self):
+        return self.child.estimate
+
+    def describe(self, depth=0):
+        return ["{}NOT".format("  " * depth)] + self.child.describe(depth + 1)
+
+
+class OperatorNode():
+    """ N-ary AND or OR over the results of its children """
+    def __init__(self, operator, children):
+        self.operator = operator
+        self.children = children
+
+    @property
+    def estimate(self):
+        """ Upper bound on the number of documents of the result """
+        if self.operator == 'and':
+            return min(child.estimate for child in self.children if not isinstance(child, NotNode))
+        return sum(child.estimate for child in self.children)
+
+    def cursor(self, fetch):
+        if self.operator == 'or':
+            return Postings.OrCursor([child.cursor(fetch) for child in self.children])
+        if self.estimate == 0:
+            # One of the operands is empty, the other posting lists are not even fetched
+            return Postings.PostingCursor(Postings.PostingList([]))
+        positives = [child.cursor(fetch) for child in self.children if not isinstance(child, NotNode)]
+        negatives = [child.child.cursor(fetch) for child in self.children if isinstance(child, NotNode)]
+        return Postings.AndCursor(positives, negatives)
+
+    def describe(self, depth=0):
+        lines = ["{}{} (est. {})".format("  " * depth, self.operator.upper(), self.estimate)]
+        for child in self.children:
+            lines += child.describe(depth + 1)
+        return lines
+
+
+class QueryPlan():
+    """ Operator tree of a boolean query, ready to be executed on a reverse index """
+    def __init__(self, root):
+        self.root = root
+
+    def __str__(self):
+        return "\n".join(self.root.describe())
+
+    def execute(self, fetch):
+        """
+        Runs the plan, fetch(key) returns the posting list of a key of the reverse index
+        The operators stream their docIDs, only the final result is built
+        """
+        cursor = self.root.cursor(fetch)
+        result = []
+        while cursor.doc is not Postings.END:
+            result.append(cursor.doc)
+            cursor.next()
+        return result
+
+
+class QueryPlanner():
+    """ Builds cost-based plans for boolean queries, whatever the type of reverse index """
+    def __init__(self, resolve, document_frequency, positions=None, expand=None, closest=None, correct=False):
+        # resolve(term) returns the key of a term in the reverse index, or raises a KeyError
+        self.__resolve = resolve
+        self.__document_frequency = document_frequency
+        # positions(term) returns the {docID: [positions]} of a term, None without positional index
+        self.__positions = positions
+        # expand(pattern) returns the (term, key) of the terms matching a wildcard, None without k-gram index
+        self.__expand = expand
+        # closest(term) returns the (term, key) of the indexed terms closest to a misspelled term, None without fuzzy index
+        self.__closest = closest
+        # A misspelled term is replaced by its most frequent correction instead of only suggesting it
+        self.__correct = correct
+
+    def __resolve_term(self, node, correct=False):
+        """
+        Finds the key and the document frequency of a leaf of the plan
+        An unknown term is replaced by its most frequent correction if correct, otherwise the corrections are suggested
+        """
+        try:
+            node.key = self.__resolve(node.term)
+            node.df = self.__document_frequency(node.key)
+            return
+        except KeyError:
+            node.key = None
+            node.df = 0
+        corrections = []
+        if self.__closest is not None:
+            corrections = sorted(((self.__document_frequency(key), term, key) for term, key in self.__closest(node.term)),
+                                 key=lambda correction: (-correction[0], correction[1]))
+        if len(corrections) == 0:
+            print("The word {} was not found".format(node.term))
+        elif correct:
+            node.df, node.correction, node.key = corrections[0]
+            print("The word {} was not found, searching for {} instead".format(node.term, node.correction))
+        else:
+            print("The word {} was not found. Did you mean {}?".format(
+                node.term, " or ".join(term for _, term, _ in corrections[:SUGGESTIONS])))
+
+    def plan(self, tree):
+        """
+        Plans the operator tree of a parsed query
+        Nested operators of the same kind are collapsed into one n-ary operation and
+        the operands of an AND are ordered by ascending document frequency
+        """
+        root = self.__optimize(tree)
+        if isinstance(root, NotNode):
+            raise ValueError("NOT must be combined with another term, e.g. 'a AND NOT b'")
+        return QueryPlan(root)
+
+    def __optimize(self, node):
+        if isinstance(node, TermNode):
+            self.__resolve_term(node, self.__correct)
+            return node
+        if isinstance(node, WildcardNode):
+            if self.__expand is None:
+                raise ValueError("Wildcard queries need the k-gram index of the vocabulary")
+            node.terms = []
+            for term, key in self.__expand(node.pattern):
+                term_node = TermNode(term)
+                term_node.key = key
+                term_node.df = self.__document_frequency(key)
+                node.terms.append(term_node)
+            if len(node.terms) == 0:
+                raise ValueError("No word matches {}".format(node.pattern))
+            return node
+        if isinstance(node, PositionalNode):
+            if self.__positions is None:
+                raise ValueError("Phrase and NEAR queries need the positional index")
+            for term in node.terms:
+                self.__resolve_term(term)
+            node.positions = [self.__positions(term.term) if term.key is not None else {} for term in node.terms]
+            return node
+        if isinstance(node, NotNode):
+            child = self.__optimize(node.child)
+            # NOT NOT a is a
+            if isinstance(child, NotNode):
+                return child.child
+            return NotNode(child)
+
+        children = []
+        for child in node.children:
+            child = self.__optimize(child)
+            if isinstance(child, OperatorNode) and child.operator == node.operator:
+                children += child.children
+            else:
+                children.append(child)
+        if node.operator == 'or':
+            if any(isinstance(child, NotNode) for child in children):
+                raise ValueError("NOT cannot be used inside an OR, e.g. 'a OR NOT b'")
+            return OperatorNode('or', children)
+
+        positives = [child for child in children if not isinstance(child, NotNode)]
+        negatives = [child for child in children if isinstance(child, NotNode)]
+        if len(positives) == 0:
+            raise ValueError("NOT must be combined with another term, e.g. 'a AND NOT b'")
+        # The rarest operand leads the intersection, the negations are only probed
+        positives.sort(key=lambda child: child.estimate)
+        return OperatorNode('and', positives + negatives)
@@ -1,6 +1,6 @@
-from BooleanEngine import Cacm, Cs276, BoolRequest
+from BooleanEngine import Cacm, Cs276, BoolRequest, Compression
+from add_ins import IndexStore, PostingCache, SegmentedIndex, Normalizer, DocIDTable
 # from add_ins import ExternalSorter
-import pickle
 import argparse
 import time
 import math
@@ -12,6 +12,15 @@ CACM_FILENAME = 'cacm.all'
 # Location of the CS276 database
 CS276_PATH = '../CS276/pa1-data'
 
+# Location of the saved indexes
+INDEX_DIRECTORIES = {"CACM": 'BooleanEngine/cacm_saved_index', "CS276": 'BooleanEngine/cs276_saved_index'}
+
+# Location of the segments of the incremental index
+SEGMENT_DIRECTORIES = {"CACM": 'BooleanEngine/cacm_segments', "CS276": 'BooleanEngine/cs276_segments'}
+
+# Files of the CS276 documents printed after a search
+FILES_SHOWN = 10
+
 # Argument parser for the CLI
 parser = argparse.ArgumentParser(description='A set of functions to create and query indexes created on the CACM and CS276 databases')
 parser.add_argument('-c', '--collection', type=str,
@@ -19,194 +28,252 @@ parser.add_argument('-c', '--collection', type=str,
 parser.add_argument('-m', '--method', type=str,
                     help='The method you want to use for the index (BSBI or MR)', default='BSBI')
 
-parser.add_argument('-up', '--use_pickle', action='store_true', default=False,
-                    help='Use a pickle created earlier')
-parser.add_argument('-sp', '--save_pickle', action='store_true',
-                    help='Pickle your results for later use')
+parser.add_argument('-w', '--workers', type=int, default=1,
+                    help='Number of processes used to clean the documents and by MapReduce (MR)')
+parser.add_argument('-np', '--numpy', action='store_true', default=False,
+                    help='Sort and aggregate the BSBI index with NumPy arrays')
+parser.add_argument('-mb', '--memory_budget', type=int, default=64,
+                    help='Memory budget of a block of the CS276 BSBI index, in MB')
+parser.add_argument('-z', '--compression', type=str, default=None,
+                    help='Compress the posting lists with a codec (vbyte, gamma, delta, bitpack)')
+parser.add_argument('-e', '--explain', action='store_true', default=False,
+                    help='Print the plan of every query')
+parser.add_argument('-pi', '--positional', action='store_true', default=False,
+                    help='Build the positional index, needed by phrase and NEAR queries')
+parser.add_argument('-kg', '--kgrams', action='store_true', default=False,
+                    help='Build the k-gram index of the vocabulary, needed by wildcard queries')
+parser.add_argument('-tk', '--tokenizer', type=str, default="nltk",
+                    help='Tokenizer of the CACM documents (nltk, or regex: faster, slightly different tokens)')
+parser.add_argument('-cm', '--cache_memory', type=int, default=16,
+                    help='Memory of the cache of the posting lists read from the disk, in MB')
+parser.add_argument('-fz', '--fuzzy', action='store_true', default=False,
+                    help='Build the deletions of the vocabulary, needed to suggest the closest words of a misspelled word')
+parser.add_argument('-ac', '--autocorrect', action='store_true', default=False,
+                    help='Replace a misspelled word by its closest indexed word, rather than only suggesting it (implies -fz)')
+parser.add_argument('-sg', '--segments', action='store_true', default=False,
+                    help='Index only the new documents into segments, and search every segment')
+parser.add_argument('-bs', '--batch_size', type=int, default=1000,
+                    help='Number of CACM documents of a new segment')
+parser.add_argument('-mf', '--merge_factor', type=int, default=4,
+                    help='Number of segments of the same size merged together')
+parser.add_argument('-ui', '--use_index', action='store_true', default=False,
+                    help='Use an index saved earlier')
+parser.add_argument('-si', '--save_index', action='store_true',
+                    help='Save your index for later use')
 
 args = parser.parse_args()
+if args.workers < 1:
+    parser.error("the number of workers (-w) must be at least 1")
 
-def run():
+def compress(reverse_index):
+    """
+    Returns the index compressed with the selected codec, if asked
+    Otherwise, the posting lists of an index on disk are read through a LRU cache
+    """
+    if args.compression:
+        t0 = time.time()
+        reverse_index = Compression.CompressedIndex(reverse_index, codec=args.compression)
+        t1 = time.time()
+        print("Compressed the postings with {} in {:.2}s: {:.1f} kB".format(args.compression, t1-t0, reverse_index.nbytes / 1000))
+    elif hasattr(reverse_index, 'arrays'):
+        reverse_index = PostingCache.PostingCache(reverse_index, capacity=args.cache_memory * 2**20)
+    return reverse_index
+
+def get_positional_index(engine):
+    """ Returns the positional index if phrase and NEAR queries are enabled, builds it if needed """
+    if not args.positional:
+        return None
+    if len(engine.positional_index) == 0:
+        t0 = time.time()
+        engine.create_positional_index()
+        t1 = time.time()
+        print("Positional indexing took {:.2}s                            ".format(t1-t0))
+    return engine.positional_index
+
+def get_kgram_index(engine):
+    """ Returns the k-gram index if wildcard queries are enabled, builds it if needed """
+    if not args.kgrams:
+        return None
+    if engine.kgram_index is None:
+        t0 = time.time()
+        engine.create_kgram_index(method=args.method)
+        t1 = time.time()
+        print("K-gram indexing took {:.2}s                            ".format(t1-t0))
+    return engine.kgram_index
+
+def get_fuzzy_index(engine):
+    """ Returns the fuzzy index if misspelled words are corrected, builds it if needed """
+    if not (args.fuzzy or args.autocorrect):
+        return None
+    if engine.fuzzy_index is None:
+        t0 = time.time()
+        engine.create_fuzzy_index(method=args.method)
+        t1 = time.time()
+        print("Fuzzy indexing took {:.2}s                            ".format(t1-t0))
+    return engine.fuzzy_index
+
+def build_engine():
+    """ Reads the collection and creates the index with the selected method, None if the method is unknown """
+    if args.method not in ['BSBI', 'MR']:
+        print("Unrecognized method. Please choose from 'BSBI' or 'MR'.")
+        return None
     if args.collection == "CACM":
-        # Load the data from the pickle, or recompute everything
-        if args.use_pickle:
-            # Check if the file exists
-            try:
-                with open('BooleanEngine/cacm_pickle', 'rb') as file:
-                    CacmEngine = pickle.load(file)
-            except FileNotFoundError:
-                print("The pickle could not be found. Make sure the file exists and has the correct name (collection_pickle)")
-                return True
+        engine = Cacm.CACMSearchEngine(CACM_PATH, CACM_FILENAME, workers=args.workers, tokenizer=args.tokenizer)
+        t0 = time.time()
+        engine.initialize_engine()
+        t1 = time.time()
+        print("Reading and cleaning process took {:.2}s                             ".format(t1-t0))
+        t0 = time.time()
+        if args.method == 'BSBI':
+            engine.create_BSBI_index(mode="numpy" if args.numpy else "tuples")
         else:
-            CacmEngine = Cacm.CACMSearchEngine(CACM_PATH, CACM_FILENAME)
-            t0 = time.time()
-            CacmEngine.initialize_engine()
-            t1 = time.time()
-            print("Reading and cleaning process took {:.2}s                             ".format(t1-t0))
-
-            # Initialize a BSBI Index
-            if args.method == 'BSBI':
-                CacmEngine.create_BSBI_index()
-                t1 = time.time()
-                print("Indexing process for BSBI took {:.2}s                            ".format(t1-t0))
-            # Initialize a MapReduc Index
-            elif args.method == 'MR':
-                th = input("Use multithreading for the computation ? (y/n)")
-                t0 = time.time()
-                if th == "y" or th == "Y":
-                    CacmEngine.create_MR_index(threading=True)
-                    t1 = time.time()
-                    print("Indexing process for MR took {:.2}s                          ".format(t1-t0))
-                elif th == "n" or th == "N":
-                    CacmEngine.create_MR_index()
-                    t1 = time.time()
-                    print("Indexing process for MR took {:.2}s                          ".format(t1-t0))
-                else:
-                    print("Unrecognized command, skipping multithreading")
-                    CacmEngine.create_MR_index()
-                    t1 = time.time()
-                    print("Indexing process for MR took {:.2}s                          ".format(t1-t0))
-            # Error in the arguments supplied to the CLI
-            else:
-                print("Unrecognized method. Please choose from 'BSBI' or 'MR'.")
-                return True
-
-            # Pickle the object to avoid recomputing every time
-            if args.save_pickle:
-                with open('BooleanEngine/cacm_pickle', 'wb') as file:
-                    pickle.dump(CacmEngine, file)
-            else:
-                res = ""
-                while res != "y" or res !="n":
-                    res = input("You did not ask for the pickle to be saved. Are you sure ? (y/n)")
-                    if res == "y":
-                        print("Moving on...")
-                        break
-                    else:
-                        print("Pickling the good stuff...")
-                        with open('BooleanEngine/cacm_pickle', 'wb') as file:
-                            pickle.dump(CacmEngine, file)
-                            print("Done ! Use the -up flag next time to avoid recomputation")
-                            break
-
-        """
-        Main Execution Loop
-        The program is set to query the user for an input, parse it and return the posting list
-        corresponding to the query
-        """
-        input_string = ""
-        print("Please enter a words to search, separated with boolean operators (AND, OR, +). Defaults to AND if no operator is selected. \nQuit with \q\n")
-        while True:
-            if args.method == 'BSBI':
-                res = BoolRequest.BoolRequest(reverse_index=CacmEngine.BSBI_index, vocabulary=CacmEngine.BSBI_vocabulary)
-                input_string = input()
-                if input_string == "\q":
-                    break
-                else:
-                    a, t = res.BSBISearch(input_string)
-                    if len(a) > 0:
-                        print("Request done in {:.3}s".format(t))
-                        print("Found {} document(s): {}".format(len(a), a))
-                    else:
-                        print("Request done in {:.3}s".format(t))
-                        print("Sorry, no documents were found...")
-
-            elif args.method == 'MR':
-                res = BoolRequest.BoolRequest(reverse_index=CacmEngine.MR_index)
-                input_string = input()
-                if input_string == "\q":
-                    break
-                else:
-                    a, t = res.MRSearch(input_string)
-                    if len(a) > 0:
-                        print("Request done in {:.3}s".format(t))
-                        print("Found {} document(s): {}".format(len(a), a))
-                    else:
-                        print("Request done in {:.3}s".format(t))
-                        print("Sorry, no documents were found...")
+            engine.create_MR_index(workers=args.workers)
+    else:
+        engine = Cs276.CS276SearchEngine(CS276_PATH, workers=args.workers)
+        t0 = time.time()
+        if args.method == 'BSBI':
+            engine.create_BSBI_index(memory_budget=args.memory_budget * 2**20, mode="numpy" if args.numpy else "disk")
+        else:
+            engine.create_MR_index(workers=args.workers)
+    t1 = time.time()
+    print("Indexing process for {} took {:.2}s                            ".format(args.method, t1-t0))
+    return engine
 
+def save_index(engine, directory):
+    """ Saves the index to avoid recomputing it every time, asks first if it was not requested """
+    if not args.save_index:
+        res = input("You did not ask for the index to be saved. Are you sure ? (y/n)")
+        if res == "y":
+            print("Moving on...")
+            return
+        print("Saving the good stuff...")
+    engine.save_index(directory, method=args.method)
+    print("Done ! Use the -ui flag next time to avoid recomputation")
 
-    elif args.collection == "CS276":
-        if args.use_pickle:
-            try:
-                with open('BooleanEngine/cs_276_pickle', 'rb') as file:
-                    Cs276Engine = pickle.load(file)
-            except FileNotFoundError:
-                print("The pickle could not be found. Make sure the file exists and has the correct name (collection_pickle)")
-                return True
+def load_index(directory):
+    """ Opens the saved index, returns the index, its vocabulary and its positional index """
+    t0 = time.time()
+    store = IndexStore.IndexStore(directory)
+    t1 = time.time()
+    print("Opened the {} index of {} terms in {:.2}s".format(store.metadata["method"], store.metadata["terms"], t1-t0))
+    # The CACM documents were tokenized like the new documents would be
+    tokenizer = store.metadata.get("tokenizer", "nltk")
+    if store.metadata.get("collection") == "CACM" and tokenizer != args.tokenizer:
+        raise ValueError("The index was saved with the {} tokenizer. Please use -tk {}, or build it again".format(tokenizer, tokenizer))
+    if args.positional and store.positional_index is None:
+        print("The saved index has no positions, build it again with -pi for phrase and NEAR queries")
+    return store, store.vocabulary, store.positional_index if args.positional else None
 
-        else:
-            Cs276Engine = Cs276.CS276SearchEngine(CS276_PATH)
-            t0 = time.time()
-            if args.method == 'BSBI':
-                Cs276Engine.create_BSBI_index()
-                t1 = time.time()
-                print("Indexing process for BSBI took {:.2}s                          ".format(t1-t0))
-            elif args.method == 'MR':
-                Cs276Engine.create_MR_index()
-                t1 = time.time()
-                print("Indexing process for MR took {:.2}s                          ".format(t1-t0))
-            else:
-                print("Unrecognized method. Please choose from 'BSBI' or 'MR'.")
-
-            # Pickle the object to avoid recomputing every time
-            if args.save_pickle:
-                with open('BooleanEngine/cs_276_pickle', 'wb') as file:
-                    pickle.dump(Cs276Engine, file)
-            else:
-                res = ""
-                while res != "y" or res !="n":
-                    res = input("You did not ask for the pickle to be saved. Are you sure ?")
-                    if res == "y":
-                        print("Moving on...")
-                        break
-                    else:
-                        print("Pickling the good stuff...")
-                        with open('BooleanEngine/cs_276_pickle', 'wb') as file:
-                            pickle.dump(Cs276Engine, file)
-                            print("Done ! Use the -up flag next time to avoid recomputation")
-                            break
-
-        """
-        Main execution Loop
-        The program is set to query the user for an input, parse it and return the posting list
-        corresponding to the query
-        """
-        input_string = ""
-        print("Please enter a words to search, separated with boolean operators (AND, OR, +). Defaults to AND if no operator is selected. \nQuit with \q\n")
-        while True:
-            if args.method == 'BSBI':
-                res = BoolRequest.BoolRequest(reverse_index=Cs276Engine.BSBI_index, vocabulary=Cs276Engine.BSBI_vocabulary)
-                input_string = input()
-                if input_string == "\q":
-                    break
-                else:
-                    a, t = res.BSBISearch(input_string)
-                    if len(a) > 0:
-                        print("Request done in {:.3}s".format(t))
-                        print("Found {} document(s): {}".format(len(a), a))
-                    else:
-                        print("Request done in {:.3}s".format(t))
-                        print("Sorry, no documents were found...")
-
-            elif args.method == 'MR':
-                res = BoolRequest.BoolRequest(reverse_index=Cs276Engine.MR_index)
-                input_string = input()
-                if input_string == "\q":
-                    break
-                else:
-                    a, t = res.MRSearch(input_string)
-                    if len(a) > 0:
-                        print("Request done in {:.3}s".format(t))
-                        print("Found {} document(s): {}".format(len(a), a))
-                    else:
-                        print("Request done in {:.3}s".format(t))
-                        print("Sorry, no documents were found...")
-
-    # Error parsing the arguments
+def update_segments():
+    """ Indexes the new documents into segments, returns the engine, the segmented index, its vocabulary and its positional index """
+    tokenizer = args.tokenizer if args.collection == "CACM" else None
+    segments = SegmentedIndex.SegmentedIndex(SEGMENT_DIRECTORIES[args.collection], merge_factor=args.merge_factor, tokenizer=tokenizer)
+    t0 = time.time()
+    if args.collection == "CACM":
+        engine = Cacm.CACMSearchEngine(CACM_PATH, CACM_FILENAME, workers=args.workers, tokenizer=args.tokenizer)
+        engine.initialize_engine()
+        engine.update_segments(segments, batch_size=args.batch_size)
     else:
+        engine = Cs276.CS276SearchEngine(CS276_PATH, workers=args.workers)
+        engine.update_segments(segments)
+    t1 = time.time()
+    print("Updating the segments took {:.2}s, segments (name, documents): {}".format(t1-t0, segments.segments))
+    # Segments are merged in the background, the queries read the current ones
+    return engine, segments, None, segments.positional_index if args.positional else None
+
+def run():
+    if args.collection not in INDEX_DIRECTORIES:
         print("Unrecognised collection {}".format(args.collection))
         return True
+    directory = INDEX_DIRECTORIES[args.collection]
+    # Open the saved index, or recompute everything
+    engine = None
+    if args.segments:
+        try:
+            engine, segments, vocabulary, positional_index = update_segments()
+            reverse_index = segments
+        except ValueError as e:
+            print(e)
+            return True
+    elif args.use_index:
+        try:
+            reverse_index, vocabulary, positional_index = load_index(directory)
+        except FileNotFoundError:
+            print("The index could not be found. Make sure it was saved in {}".format(directory))
+            return True
+        except ValueError as e:
+            print(e)
+            return True
+    else:
+        engine = build_engine()
+        if engine is None:
+            return True
+        # The positions, the k-grams and the deletions are saved with the index
+        positional_index = get_positional_index(engine)
+        kgram_index = get_kgram_index(engine)
+        fuzzy_index = get_fuzzy_index(engine)
+        save_index(engine, directory)
+        if args.method == 'BSBI':
+            reverse_index, vocabulary = engine.BSBI_index, engine.BSBI_vocabulary
+        else:
+            reverse_index, vocabulary = engine.MR_index, None
+
+    # The CS276 documents are lemmatized and stemmed, the query terms are normalized the same way
+    # Their docIDs are numbered across the folders, the table gives the file of each one
+    normalizer = None
+    documents = None
+    if args.use_index and not args.segments:
+        if reverse_index.metadata.get("normalization"):
+            normalizer = Normalizer.Normalizer.load(directory)
+        documents = DocIDTable.DocIDTable.load(directory)
+    elif args.collection == "CS276":
+        normalizer = engine.normalizer
+        documents = engine.documents
+    # Wildcards are expanded and misspelled words corrected through the k-grams and the deletions saved with the index,
+    # or built from its vocabulary if it was saved without them. Every segment builds its own on first use
+    fuzzy = args.fuzzy or args.autocorrect
+    if args.segments:
+        kgram_index = reverse_index if args.kgrams else None
+        fuzzy_index = reverse_index if fuzzy else None
+    elif args.use_index:
+        kgram_index = reverse_index.kgram_index if args.kgrams else None
+        fuzzy_index = reverse_index.fuzzy_index if fuzzy else None
+
+    """
+    Main Execution Loop
+    The program is set to query the user for an input, parse it and return the posting list
+    corresponding to the query
+    """
+    reverse_index = compress(reverse_index)
+    print("Please enter a words to search, separated with boolean operators (AND, OR, NOT, +, -, NEAR/k), \"exact phrases\", wildcards (comput*) and parentheses. Defaults to AND if no operator is selected. \nQuit with \q\n")
+    if args.segments:
+        print("Delete documents with \\d docID ..., update a document with \\u docID text\n")
+    # The request engine keeps the sorted posting lists between queries
+    res = BoolRequest.BoolRequest(reverse_index=reverse_index, vocabulary=vocabulary, positional_index=positional_index,
+                                  normalize=normalizer.normalize if normalizer is not None else None, kgram_index=kgram_index,
+                                  fuzzy_index=fuzzy_index, correct=args.autocorrect)
+    # The terms of a BSBI index and of a saved index are found through their vocabulary
+    search = res.BSBISearch if vocabulary is not None else res.MRSearch
+    while True:
+        input_string = input()
+        if input_string == "\q":
+            if isinstance(reverse_index, PostingCache.PostingCache):
+                print(reverse_index)
+            break
+        if args.segments and input_string[:3] in ["\\d ", "\\u "]:
+            # The cached lists of the segments are read again after the change
+            print(segments.edit(input_string, engine.clean_text))
+            continue
+        a, t = search(input_string)
+        if args.explain and res.last_plan is not None:
+            print(res.last_plan)
+        print("Request done in {:.3}s".format(t))
+        if len(a) > 0:
+            print("Found {} document(s): {}".format(len(a), a))
+            if documents is not None:
+                print("First files: {}".format(", ".join(documents.path(int(docID)) for docID in list(a)[:FILES_SHOWN])))
+        else:
+            print("Sorry, no documents were found...")
 
 if __name__ == '__main__':
     run()
@@ -1,6 +1,6 @@
 from VectorEngine import Cacm, Cs276
+from add_ins import SegmentedIndex
 # from add_ins import ExternalSorter
-import pickle
 import argparse
 import time
 
@@ -11,135 +11,152 @@ CACM_FILENAME = 'cacm.all'
 # Location of the CS276 database
 CS276_PATH = '../CS276/pa1-data'
 
+# Location of the saved indexes
+INDEX_DIRECTORIES = {"CACM": 'VectorEngine/cacm_saved_index', "CS276": 'VectorEngine/cs276_saved_index'}
+
+# Location of the out-of-core index of the whole CS276 collection
+FULL_INDEX_DIRECTORY = 'VectorEngine/cs276_full_index'
+
+# Location of the segments of the incremental index
+SEGMENT_DIRECTORIES = {"CACM": 'VectorEngine/cacm_segments', "CS276": 'VectorEngine/cs276_segments'}
+
+# Files of the CS276 documents printed after a search
+FILES_SHOWN = 10
+
 # Argument parser for the CLI
 parser = argparse.ArgumentParser(description='A set of functions to create and query indexes created on the CACM and CS276 databases')
 parser.add_argument('-c', '--collection', type=str,
                     help='The collection you want to work with (CACM or CS276)', default='CACM')
 parser.add_argument('-p', '--ponderation', type=str, default="tf-idf",
                     help='Ponderation method (tf-idf, tf-idf-norm, freq-norm)')
-parser.add_argument('-up', '--use_pickle', action='store_true', default=False,
-                    help='Use a pickle created earlier')
-parser.add_argument('-sp', '--save_pickle', action='store_true',
-                    help='Pickle your results for later use')
+parser.add_argument('-b', '--backend', type=str, default="dense",
+                    help='Scoring backend used for the search (dense, sparse, taat, wand, bmw)')
+parser.add_argument('-k', '--k', type=int, default=50,
+                    help='Number of documents returned by a search')
+parser.add_argument('-w', '--workers', type=int, default=1,
+                    help='Number of processes used to clean the documents')
+parser.add_argument('-tk', '--tokenizer', type=str, default="nltk",
+                    help='Tokenizer of the CACM documents (nltk, or regex: faster, slightly different tokens)')
+parser.add_argument('-cm', '--cache_memory', type=int, default=16,
+                    help='Memory of the cache of the posting lists read from a saved index, in MB')
+parser.add_argument('-sg', '--segments', action='store_true', default=False,
+                    help='Index only the new documents into segments, and search every segment')
+parser.add_argument('-bs', '--batch_size', type=int, default=1000,
+                    help='Number of documents of a new segment')
+parser.add_argument('-mf', '--merge_factor', type=int, default=4,
+                    help='Number of segments of the same size merged together')
+parser.add_argument('-fc', '--full_collection', action='store_true', default=False,
+                    help='Index the 10 folders of CS276 out of core, instead of the first folder in memory')
+parser.add_argument('-ui', '--use_index', action='store_true', default=False,
+                    help='Use an index saved earlier')
+parser.add_argument('-si', '--save_index', action='store_true',
+                    help='Save your index for later use')
 
 args = parser.parse_args()
+if args.workers < 1:
+    parser.error("the number of workers (-w) must be at least 1")
+if args.k < 1:
+    parser.error("the number of documents returned (-k) must be at least 1")
 
-def run():
+def create_engine():
+    """ Returns an engine on the selected collection, nothing is read yet """
     if args.collection == "CACM":
-        # Load the data from the pickle, or recompute everything
-        if args.use_pickle:
-            # Check if the file exists
-            try:
-                with open('VectorEngine/cacm_pickle', 'rb') as file:
-                    CacmEngine = pickle.load(file)
-            except FileNotFoundError:
-                print("The pickle could not be found. Make sure the file exists and has the correct name (collection_pickle)")
-                return True
-        else:
-            CacmEngine = Cacm.CACMSearchEngine(CACM_PATH, CACM_FILENAME)
-            t0 = time.time()
-            CacmEngine.initialize_engine(ponderation=args.ponderation)
-            t1 = time.time()
-            print("Cleaning and Indexing process took {:.2}s                        ".format(t1-t0))
+        return Cacm.CACMSearchEngine(CACM_PATH, CACM_FILENAME, workers=args.workers, tokenizer=args.tokenizer)
+    return Cs276.CS276SearchEngine(CS276_PATH, workers=args.workers)
 
-            # Pickle the object to avoid recomputing every time
-            if args.save_pickle:
-                with open('VectorEngine/cacm_pickle', 'wb') as file:
-                    pickle.dump(CacmEngine, file)
-            else:
-                res = ""
-                while res != "y" or res != "n":
-                    res = input("You did not ask for the pickle to be saved. Are you sure ? (y/n)")
-                    if res == "y":
-                        print("Moving on...")
-                        break
-                    else:
-                        print("Pickling the good stuff...")
-                        with open('VectorEngine/cacm_pickle', 'wb') as file:
-                            pickle.dump(CacmEngine, file)
-                            print("Done ! Use the -up flag next time to avoid recomputation")
-                            break
-
-        """
-        Main Execution Loop
-        The program is set to query the user for an input, parse it and return the posting list
-        corresponding to the query
-        """
-        input_string = ""
-        print("Please enter some text to search\nQuit with \q\n")
-        while True:
+def save_index(engine, directory):
+    """ Saves the index to avoid recomputing it every time, asks first if it was not requested """
+    if not args.save_index:
+        res = input("You did not ask for the index to be saved. Are you sure ? (y/n)")
+        if res == "y":
+            print("Moving on...")
+            return
+        print("Saving the good stuff...")
+    engine.save_index(directory)
+    print("Done ! Use the -ui flag next time to avoid recomputation")
 
-            input_string = input()
-            if input_string == "\q":
-                break
+def run():
+    if args.collection not in INDEX_DIRECTORIES:
+        print("Unrecognised collection {}".format(args.collection))
+        return True
+    directory = INDEX_DIRECTORIES[args.collection]
+    engine = create_engine()
+    # Open the saved index, or recompute everything
+    if args.full_collection:
+        if args.collection != "CS276":
+            print("The out-of-core index is only available for CS276")
+            return True
+        t0 = time.time()
+        try:
+            if args.use_index:
+                engine.load_full_index(FULL_INDEX_DIRECTORY)
             else:
-                a, t = CacmEngine.search(input_string)
-                if len(a) > 0:
-                    print("Request done in {:.3}s".format(t))
-                    print("Found {} document(s): {}".format(len(a), a))
-                else:
-                    print("Request done in {:.3}s".format(t))
-                    print("Sorry, no documents were found...")
-
-
-    elif args.collection == "CS276":
-        if args.use_pickle:
-            try:
-                with open('VectorEngine/cs_276_pickle', 'rb') as file:
-                    Cs276Engine = pickle.load(file)
-            except FileNotFoundError:
-                print("The pickle could not be found. Make sure the file exists and has the correct name (collection_pickle)")
-                return True
+                engine.create_full_index(FULL_INDEX_DIRECTORY, ponderation=args.ponderation)
+        except FileNotFoundError:
+            print("The index could not be found. Make sure it was saved in {}".format(FULL_INDEX_DIRECTORY))
+            return True
+        except ValueError as e:
+            print(e)
+            return True
+        t1 = time.time()
+        print("Opened the index of the {} documents in {:.2}s                   ".format(len(engine.full_index), t1-t0))
+    elif args.segments:
+        t0 = time.time()
+        try:
+            tokenizer = args.tokenizer if args.collection == "CACM" else None
+            segments = SegmentedIndex.SegmentedIndex(SEGMENT_DIRECTORIES[args.collection], merge_factor=args.merge_factor, ponderation=args.ponderation,
+                                                     tokenizer=tokenizer)
+            engine.update_segments(segments, batch_size=args.batch_size, cache_memory=args.cache_memory * 2**20)
+        except ValueError as e:
+            print(e)
+            return True
+        t1 = time.time()
+        print("Updating the segments took {:.2}s, segments (name, documents): {}".format(t1-t0, segments.segments))
+    elif args.use_index:
+        t0 = time.time()
+        try:
+            engine.load_index(directory, cache_memory=args.cache_memory * 2**20)
+        except FileNotFoundError:
+            print("The index could not be found. Make sure it was saved in {}".format(directory))
+            return True
+        except ValueError as e:
+            print(e)
+            return True
+        t1 = time.time()
+        print("Opened the index in {:.2}s".format(t1-t0))
+    else:
+        t0 = time.time()
+        engine.initialize_engine(ponderation=args.ponderation, backend=args.backend)
+        t1 = time.time()
+        print("Cleaning and Indexing process took {:.2}s                        ".format(t1-t0))
+        save_index(engine, directory)
 
+    """
+    Main Execution Loop
+    The program is set to query the user for an input, parse it and return the posting list
+    corresponding to the query
+    """
+    print("Please enter some text to search, \"exact phrases\" and NEAR/k restrict the results\nQuit with \q\n")
+    if args.segments:
+        print("Delete documents with \\d docID ..., update a document with \\u docID text\n")
+    while True:
+        input_string = input()
+        if input_string == "\q":
+            if engine.posting_cache is not None:
+                print(engine.posting_cache)
+            break
+        if args.segments and input_string[:3] in ["\\d ", "\\u "]:
+            # The cached lists of the segments are read again after the change
+            print(segments.edit(input_string, engine.clean_text))
+            continue
+        a, t = engine.search(input_string, k=args.k)
+        print("Request done in {:.3}s".format(t))
+        if len(a) > 0:
+            print("Found {} document(s): {}".format(len(a), a))
+            if args.collection == "CS276" and len(engine.documents) > 0:
+                print("First files: {}".format(", ".join(engine.documents.path(docID) for docID, _ in a[:FILES_SHOWN])))
         else:
-            Cs276Engine = Cs276.CS276SearchEngine(CS276_PATH)
-            t0 = time.time()
-            Cs276Engine.initialize_engine()
-            t1 = time.time()
-            print("Indexing process took {:.2}s                        ".format(t1-t0))
-
-            # Pickle the object to avoid recomputing every time
-            if args.save_pickle:
-                with open('VectorEngine/cs_276_pickle', 'wb') as file:
-                    pickle.dump(Cs276Engine, file)
-            else:
-                res = ""
-                while res != "y" or res !="n":
-                    res = input("You did not ask for the pickle to be saved. Are you sure ?")
-                    if res == "y":
-                        print("Moving on...")
-                        break
-                    else:
-                        print("Pickling the good stuff...")
-                        with open('VectorEngine/cacm_pickle', 'wb') as file:
-                            pickle.dump(Cs276Engine, file)
-                            print("Done ! Use the -up flag next time to avoid recomputation")
-                            break
-
-        """
-        Main execution Loop
-        The program is set to query the user for an input, parse it and return the posting list
-        corresponding to the query
-        """
-        input_string = ""
-        print("Please enter some text to search\nQuit with \q\n")
-        while True:
-            input_string = input()
-            if input_string == "\q":
-                break
-            else:
-                a, t = Cs276Engine.search(input_string)
-                if len(a) > 0:
-                    print("Request done in {:.3}s".format(t))
-                    print("Found {} document(s): {}".format(len(a), a))
-                else:
-                    print("Request done in {:.3}s".format(t))
-                    print("Sorry, no documents were found...")
-
-    # Error parsing the arguments
-    else:
-        print("Unrecognised collection {}".format(args.collection))
-        return True
+            print("Sorry, no documents were found...")
 
 if __name__ == '__main__':
     run()
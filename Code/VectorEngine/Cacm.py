@@ -2,75 +2,49 @@ import os
 import sys
 import time
 import nltk
-import re
 from math import log10
 from scipy.spatial.distance import cosine
 from numpy.linalg import norm
+from .SparseBackend import SparseBackend, PONDERATIONS
+from .TermAtATime import TermAtATimeScorer
+from .DynamicPruning import DynamicPruningScorer
+from .TopK import TopK
+from .StoredScorer import StoredScorer, document_norms
+from BooleanEngine import Positional
+from add_ins import IndexStore, CacmReader
+
+BACKENDS = ["dense", "sparse", "taat", "wand", "bmw"]
 
 class CACMSearchEngine():
     """ Set of features to implement a search engine on the CACM collection """
-    def __init__(self, path, filename):
+    def __init__(self, path, filename, workers=1, tokenizer="nltk"):
         self.__PATH = path
         self.__filename = filename
-        # Markers in the collection to split the files
-        self.__MARKERS_TO_KEEP = ['.T', '.W', '.K']
-        self.__MARKERS_TO_DROP = ['.B', '.A', '.N', '.X', '.C']
-        self.__MARKERS = self.__MARKERS_TO_KEEP + self.__MARKERS_TO_DROP
+        # Processes used to tokenize and clean the documents
+        self.__workers = workers
+        # NLTK tokenizer, or the faster regex tokenizer
+        self.__tokenizer = tokenizer
         self.__stop_words = set(nltk.corpus.stopwords.words('english'))
         self.__stop_words.update(['.', ',', '"', "'", '?', '!', ':', ';', '(', ')', '[', ']', '{', '}'])
-        # Indexing variables
-        self.__documents = []
-        self.__tokenized_documents_as_list = []
+        # Indexing variables, the only copy of the collection kept in memory
         self.__clean_documents = {}
-        self.__clean_documents_list = []
         # Vector space
         self.__index = {}
         self.__idfs = {}
         self.__keyword_to_vect_position = {}
         self.__vectors = {}
+        self.__ponderation = "tf-idf"
+        self.__backend = "dense"
+        self.__sparse = None
+        self.__taat = None
+        self.__pruning = None
+        # Index opened from the disk, the documents are not read
+        self.__store = None
+        self.__stored = None
 
-    def __load_data(self):
-        """ Loads the collection specified in the path & filename """
-        with open(os.path.join(self.__PATH, self.__filename), 'r') as file:
-            data = file.read()
-            self.__documents = re.split(r'\.I \d+', data)
-
-    @staticmethod
-    def __tokenize_document(document):
+    def __tokenize_document(self, document):
         """ Convert a document into a list of tokens """
-        tokens = nltk.tokenize.word_tokenize(document)
-        return tokens
-
-    def __convert_document_list_into_tokenized_lists(self):
-        """ Converts the list of documents to a list of lists """
-        self.__tokenized_documents_as_list = []
-        for document in self.__documents:
-            tokens = self.__tokenize_document(document)
-            self.__tokenized_documents_as_list.append(tokens)
-
-            sys.stdout.write("Tokenizing process: %d%%                         \r" % (100 * len(self.__tokenized_documents_as_list)/len(self.__documents)))
-            sys.stdout.flush()
-
-    def __clean_tokenized_document(self, tokenized_document):
-        """ SPECIFIC TO CACM - Drop the unwanted markers in the document """
-        if len(tokenized_document) > 0:
-            cont = True
-            data = [] # Value to return
-            for item in tokenized_document: # Document is a list if tokens
-                if item in self.__MARKERS: # A marker has been identified
-                    if item in self.__MARKERS_TO_DROP: # The marker should be dropped, cont is set to True to skip until next marker
-                        cont = True
-                        continue
-                    else:
-                        cont = False
-                        continue
-                if cont:
-                    continue # Skip the data until the next marker
-                else:
-                    data.append(item.lower()) # Add the data
-            return data
-        else:
-            return []
+        return CacmReader.tokenize(document, self.__tokenizer)
 
     def __filter_stop_words(self, clean_document):
         """ Removes the stop words in a document """
@@ -78,12 +52,10 @@ class CACMSearchEngine():
         return terms_clean
 
     def __clean_all_documents(self):
-        for i in range(1, len(self.__tokenized_documents_as_list)):
-            res = self.__clean_tokenized_document(self.__tokenized_documents_as_list[i])
-            res = self.__filter_stop_words(res)
-            self.__clean_documents_list.append(res)
-            self.__clean_documents[i] = res
-            sys.stdout.write("Cleaning process: %d%%                                             \r" % (100 * i/len(self.__tokenized_documents_as_list)))
+        """ Reads the collection one record at a time and keeps only its clean words """
+        for docID, document in CacmReader.clean_documents(os.path.join(self.__PATH, self.__filename), self.__stop_words, self.__workers, self.__tokenizer):
+            self.__clean_documents[docID] = document
+            sys.stdout.write("Cleaning process: %d documents                                   \r" % docID)
             sys.stdout.flush()
 
     def __create_index(self):
@@ -109,7 +81,7 @@ class CACMSearchEngine():
 
     def __compute_weights(self):
         """ Computes the tfs """
-        N = len(self.__clean_documents_list)
+        N = len(self.__clean_documents)
         for word in self.__index:
             self.__idfs[word] = log10(N / len(self.__index[word].keys()))
 
@@ -118,14 +90,10 @@ class CACMSearchEngine():
         doc = self.__clean_documents[docID]
         vector = [0] * len(self.__keyword_to_vect_position.keys())
         for word in doc:
-            if type(vector[self.__keyword_to_vect_position[word]]) == list:
-                vector[self.__keyword_to_vect_position[word]] += 1
-            else:
-                vector[self.__keyword_to_vect_position[word]] = 1
-        for word in doc:
+            vector[self.__keyword_to_vect_position[word]] += 1
+        for word in set(doc):
             i = self.__keyword_to_vect_position[word]
-            if vector[i] > 0:
-                vector[i] = (1 + log10(vector[i])) * self.__idfs[word]
+            vector[i] = (1 + log10(vector[i])) * self.__idfs[word]
         return vector
 
     def __vectorize_doc_freq_norm(self, docID):
@@ -134,45 +102,55 @@ class CACMSearchEngine():
         vector = [0] * len(self.__keyword_to_vect_position.keys())
         max_tf = 0
         for word in doc:
-            if type(vector[self.__keyword_to_vect_position[word]]) == list:
-                vector[self.__keyword_to_vect_position[word]] += 1
-                if vector[self.__keyword_to_vect_position[word]] > max_tf:
-                    max_tf = vector[self.__keyword_to_vect_position[word]]
-            else:
-                vector[self.__keyword_to_vect_position[word]] = 1
-                if vector[self.__keyword_to_vect_position[word]] > max_tf:
-                    max_tf = vector[self.__keyword_to_vect_position[word]]
-        for word in doc:
+            vector[self.__keyword_to_vect_position[word]] += 1
+            if vector[self.__keyword_to_vect_position[word]] > max_tf:
+                max_tf = vector[self.__keyword_to_vect_position[word]]
+        for word in set(doc):
             i = self.__keyword_to_vect_position[word]
-            if vector[i] > 0:
-                vector[i] = vector[i]/max_tf
+            vector[i] = vector[i]/max_tf
         return vector
 
-    def initialize_engine(self, ponderation="tf-idf"):
+    def initialize_engine(self, ponderation="tf-idf", backend="dense"):
         """ Initialize engine by reading and parsing the data """
+        if ponderation not in PONDERATIONS:
+            raise ValueError("Unknown ponderation {}. Please choose from {}".format(ponderation, PONDERATIONS))
+        if backend not in BACKENDS:
+            raise ValueError("Unknown backend {}. Please choose from {}".format(backend, BACKENDS))
+        self.__ponderation = ponderation
+        self.__backend = backend
         sys.stdout.write("Starting Engine \r")
         sys.stdout.flush()
         sys.stdout.write("Reading database... \r")
         sys.stdout.flush()
-        self.__load_data()
-        print("Successfully parsed {} documents".format(len(self.__documents)))
-        sys.stdout.write("Splitting into separate lists and tokenizing... \r")
-        sys.stdout.flush()
-        self.__convert_document_list_into_tokenized_lists()
-        sys.stdout.write("Dropping unwanted markers and filtering stop-words... \r")
+        sys.stdout.write("Tokenizing, dropping unwanted markers and filtering stop-words... \r")
         sys.stdout.flush()
         self.__clean_all_documents()
+        print("Successfully parsed {} documents                                   ".format(len(self.__clean_documents)))
         sys.stdout.write("Successfully created a clean list of documents ! \r")
         sys.stdout.flush()
         self.__create_index()
         self.__compute_weights()
 
+        # Term-at-a-time scoring only needs the positional index and the idfs
+        if backend == "taat":
+            self.__taat = TermAtATimeScorer(self.__index, self.__idfs, ponderation)
+            return
+        # WAND and Block-Max WAND share the same docID-sorted postings
+        if backend == "wand" or backend == "bmw":
+            self.__pruning = DynamicPruningScorer(self.__index, self.__idfs, ponderation)
+            return
+
         # Create the vector space
-        for doc in self.__clean_documents_list:
+        for doc in self.__clean_documents.values():
             for word in doc:
                 if word not in self.__keyword_to_vect_position.keys():
                     self.__keyword_to_vect_position[word] = len(self.__keyword_to_vect_position.keys())
-        
+
+        # The sparse backend builds a single CSR matrix instead of the dense vectors
+        if backend == "sparse":
+            self.__sparse = SparseBackend(self.__clean_documents, self.__keyword_to_vect_position, self.__idfs, ponderation)
+            return
+
         # Create a vector for each document
         if ponderation == "tf-idf" or ponderation == "tf-idf-norm":
             for docID in self.__clean_documents:
@@ -189,12 +167,98 @@ class CACMSearchEngine():
             for docID in self.__clean_documents:
                 self.__vectors[docID] = self.__vectorize_doc_freq_norm(docID)
 
-    def search(self, query):
-        """ Cleans the query and compares it to the vectors in the database """
-        t0 = time.time()
+    def save_index(self, directory):
+        """ Saves the positional index and the norms of the documents in the on-disk format """
+        docIDs = sorted(self.__clean_documents)
+        IndexStore.save(
+            directory, self.__index,
+            lambda word: {docID: len(positions) for docID, positions in self.__index[word].items()},
+            positions=self.__index.__getitem__, docIDs=docIDs,
+            norms=document_norms(self.__index, docIDs, self.__idfs, self.__ponderation),
+            metadata={"engine": "vector", "collection": "CACM", "ponderation": self.__ponderation, "tokenizer": self.__tokenizer}
+        )
+        print("Saved the index in {}".format(directory))
+
+    def load_index(self, directory, cache_memory=16 * 2**20):
+        """
+        Opens an index saved earlier, the documents are scored term by term on the mapped files
+        At most cache_memory bytes of posting lists are kept in memory
+        """
+        self.__store = IndexStore.IndexStore(directory)
+        self.__ponderation = self.__store.metadata["ponderation"]
+        # The queries are tokenized like the saved documents
+        self.__tokenizer = self.__store.metadata.get("tokenizer", "nltk")
+        self.__stored = StoredScorer(self.__store, self.__ponderation, cache_memory)
+
+    def update_segments(self, segments, batch_size=1000, cache_memory=16 * 2**20):
+        """
+        Adds the documents that are not in the segments yet, batch_size documents per new segment,
+        then searches every segment, with the idfs of the whole collection
+        """
+        if len(self.__clean_documents) == 0:
+            self.__clean_all_documents()
+        print("Added {} new documents to the segments".format(segments.add_new_documents(self.__clean_documents, batch_size)))
+        self.__store = segments
+        self.__ponderation = segments.ponderation
+        self.__stored = StoredScorer(segments, self.__ponderation, cache_memory)
+
+    def clean_text(self, text):
+        """ Clean words of a new text of a document, cleaned like the documents """
+        return self.__filter_stop_words(map(lambda x: x.lower(), self.__tokenize_document(text)))
+
+    @property
+    def posting_cache(self):
+        """ Cache of the posting lists of a saved index, None if the index was built in memory """
+        if self.__stored is None:
+            return None
+        return self.__stored.cache
+
+    @property
+    def search_stats(self):
+        """ Postings scored and skipped by the last WAND/BMW search """
+        if self.__pruning is None:
+            return {}
+        return self.__pruning.stats
+
+    def __clean_query(self, query):
+        """ Applies the cleaning of the documents to a query """
         clean_query = self.__tokenize_document(query)
         clean_query = map(lambda x: x.lower(), clean_query)
         clean_query = self.__filter_stop_words(clean_query)
+        return clean_query
+
+    def __positional_candidates(self, constraints):
+        """ Documents matching every "phrase" and NEAR/k of the query, None if there are none """
+        candidates = None
+        for text, window in constraints:
+            words = self.__clean_query(text)
+            if len(words) == 0:
+                continue
+            index = self.__index if self.__store is None else self.__store.positional_index
+            documents = Positional.matching_documents(index, words, [window] * (len(words) - 1))
+            candidates = documents if candidates is None else candidates & documents
+        return candidates
+
+    def search(self, query, k=50):
+        """
+        Cleans the query and compares it to the vectors in the database, returns the k closest documents
+        The "phrases" and NEAR/k of the query restrict the ranking to the documents matching them
+        """
+        t0 = time.time()
+        constraints, query = Positional.extract_constraints(query)
+        candidates = self.__positional_candidates(constraints)
+        if candidates is not None and len(candidates) == 0:
+            return [], time.time() - t0
+        clean_query = self.__clean_query(query)
+        if self.__stored is not None:
+            return self.__stored.search(clean_query, k=k, candidates=candidates), time.time() - t0
+        if self.__backend == "sparse":
+            return self.__sparse.search(clean_query, k=k, candidates=candidates), time.time() - t0
+        if self.__backend == "taat":
+            return self.__taat.search(clean_query, k=k, candidates=candidates), time.time() - t0
+        if self.__backend == "wand" or self.__backend == "bmw":
+            results = self.__pruning.search(clean_query, k=k, block_max=(self.__backend == "bmw"), candidates=candidates)
+            return results, time.time() - t0
         # Convert to a vector
         query_vector = [0] * len(self.__keyword_to_vect_position.keys())
         for word in clean_query:
@@ -205,18 +269,13 @@ class CACMSearchEngine():
                 pass
         if query_vector == [0] * len(self.__keyword_to_vect_position.keys()):
             return [], time.time() - t0
-        # Compute distances
-        distances = {}
-        for docID in self.__vectors:
-            if docID > 0:
-                distances[docID] = cosine(self.__vectors[docID], query_vector)
+        # Compute distances, only the k closest documents are kept
+        top_k = TopK(k)
+        for docID in self.__vectors if candidates is None else sorted(candidates):
+            if docID > 0 and docID in self.__vectors:
+                distance = cosine(self.__vectors[docID], query_vector)
+                if distance < 1:
+                    top_k.push(docID, distance)
 
         # Return the list of documents and the time
-        def get_distance(t):
-            """ Helper """
-            return t[1]
-
-        results = sorted(distances.items(), key=get_distance)
-        results = [t for t in results if get_distance(t) < 1][:50] # Only the 10 first
-
-        return results, time.time() - t0
+        return top_k.results(), time.time() - t0
@@ -1,21 +1,36 @@
 import os
 import time
+from functools import partial
 from math import log10
 import sys
 import nltk
 from scipy.spatial.distance import cosine
+from .SparseBackend import SparseBackend, PONDERATIONS
+from .TermAtATime import TermAtATimeScorer
+from .DynamicPruning import DynamicPruningScorer
+from .TopK import TopK
+from .StoredScorer import StoredScorer, document_norms
+from . import OutOfCore
+from BooleanEngine import Positional
+from add_ins import IndexStore, Parallel
+from add_ins.Normalizer import Normalizer
+from add_ins.DocIDTable import DocIDTable
+
+BACKENDS = ["dense", "sparse", "taat", "wand", "bmw"]
 
 class CS276SearchEngine():
     """ Set of features to implement a vector search engine on the CS276 collection """
-    def __init__(self, path):
+    def __init__(self, path, workers=1, normalize=True):
         self.__PATH = path
+        # Processes used to read and clean the documents
+        self.__workers = workers
         self.__current_folder = 0
         self.__files_to_load = []
         # NLTK
         self.__stop_words = set(nltk.corpus.stopwords.words('english'))
         self.__stop_words.update(['.', ',', '"', "'", '?', '!', ':', ';', '(', ')', '[', ']', '{', '}'])
-        self.__lemmatizer = nltk.stem.WordNetLemmatizer()
-        self.__stemmer = nltk.stem.SnowballStemmer("english")
+        # Lemmatizes and stems the documents and the queries, each distinct word once
+        self.__normalizer = Normalizer() if normalize else None
         # Stuff for later
         self.__current_docID = 0
         self.__clean_documents = {}
@@ -25,18 +40,36 @@ class CS276SearchEngine():
         self.__idfs = {}
         self.__keyword_to_vect_position = {}
         self.__vectors = {}
+        self.__ponderation = "tf-idf"
+        self.__backend = "dense"
+        self.__sparse = None
+        self.__taat = None
+        self.__pruning = None
+        # Index opened from the disk, the documents are not read
+        self.__store = None
+        self.__stored = None
+        # Weighted rows of the whole collection on the disk
+        self.__full = None
+        # (folder, filename) of every docID, numbered across the folders like the boolean engine
+        self.__documents = DocIDTable()
 
     def __get_files_name_to_load(self):
         """ Loads the collection specified in the path and at the correct id """
         file_id = 0
         self.__files_to_load = []
         for root, dirs, files in os.walk(os.path.join(self.__PATH, str(self.__current_folder))):
-            for file in files:
+            # Sorted, so that the docIDs do not depend on the file system
+            for file in sorted(files):
                 self.__files_to_load.append(file)
                 sys.stdout.write("Loading progress: %d%%   \r" % (100 * file_id/len(files)))
                 sys.stdout.flush()
                 file_id += 1
 
+    def __number_documents(self):
+        """ Lists the files of the current folder and gives them their docIDs, like the boolean engine """
+        self.__get_files_name_to_load()
+        self.__documents.add_folder(self.__current_folder, self.__files_to_load)
+
     @staticmethod
     def __parse_document_into_list(document):
         """ Parse the document into a list """
@@ -53,19 +86,11 @@ class CS276SearchEngine():
         terms_clean = list(filter(lambda word: word not in self.__stop_words, document))
         return terms_clean
 
-    def __lemmatize_document(self, document):
-        """ Lemmatizes the document """
-        lemmatized_document = []
-        for word in document:
-            lemmatized_document.append(self.__lemmatizer.lemmatize(word))
-        return lemmatized_document
-
-    def __stem_document(self, document):
-        """ Stems the document with the SnowBall Stemmer """
-        stemmed_document = []
-        for word in document:
-            stemmed_document.append(self.__stemmer.stem(word))
-        return stemmed_document
+    def __normalize_document(self, document):
+        """ Lemmatizes then stems the words of a document, through the cache of the normalizer """
+        if self.__normalizer is None:
+            return document
+        return self.__normalizer.normalize_document(document)
 
     def __clean_all_documents(self):
         """ Cleans all the documents in the current folder and updates the list and the doc/docID dict """
@@ -73,18 +98,28 @@ class CS276SearchEngine():
         self.__clean_documents = {}
         self.__clean_documents_list = []
 
-        for file in self.__files_to_load:
-            with open(os.path.join(self.__PATH, str(self.__current_folder), file), 'r') as f:
-                doc = f.read()
-                doc = self.__parse_document_into_list(doc)
-                doc = self.__filter_stop_words(doc)
-                #doc = self.__lemmatize_document(doc)
-                #doc = self.__stem_document(doc)
-                self.__clean_documents_list.append(doc)
-                self.__clean_documents[self.__current_docID] = doc
-                sys.stdout.write("Cleaning progress (Stop-words, Stemming, Lemmatizing): %d%%   \r" % (100 * self.__current_docID / len(self.__files_to_load)))
+        # The files are read and cleaned by the workers, the documents come back in the order of the files
+        filenames = [os.path.join(self.__PATH, str(self.__current_folder), file) for file in self.__files_to_load]
+        for doc in Parallel.map_in_order(partial(Parallel.clean_file, stop_words=self.__stop_words), filenames, self.__workers):
+            # Normalized in this process, so that every folder shares the same cache
+            doc = self.__normalize_document(doc)
+            self.__clean_documents_list.append(doc)
+            self.__clean_documents[self.__current_docID] = doc
+            sys.stdout.write("Cleaning progress (Stop-words, Stemming, Lemmatizing): %d%%   \r" % (100 * self.__current_docID / len(self.__files_to_load)))
+            sys.stdout.flush()
+            self.__current_docID += 1
+
+    def __stream_documents(self):
+        """ Yields the clean documents of the 10 folders one at a time, in the order of their docIDs """
+        cleaner = partial(Parallel.clean_file, stop_words=self.__stop_words)
+        for i in range(10):
+            self.__current_folder = i
+            self.__number_documents()
+            filenames = [os.path.join(self.__PATH, str(i), file) for file in self.__files_to_load]
+            for j, doc in enumerate(Parallel.map_in_order(cleaner, filenames, self.__workers)):
+                yield self.__normalize_document(doc)
+                sys.stdout.write("Indexing folder %d: %d%%   \r" % (i, 100 * j / len(filenames)))
                 sys.stdout.flush()
-                self.__current_docID += 1
 
     def __create_index(self):
         """ 
@@ -120,18 +155,24 @@ class CS276SearchEngine():
         for word in doc:
             vector[self.__keyword_to_vect_position[word]] += 1
         # Loop again to set the weights
-        for word in doc:
+        for word in set(doc):
             i = self.__keyword_to_vect_position[word]
             vector[i] = (1 + log10(vector[i])) * self.__idfs[word]
         return vector
 
-    def initialize_engine(self):
+    def initialize_engine(self, ponderation="tf-idf", backend="dense"):
         """ Initialize engine by reading and parsing the data """
+        if backend not in BACKENDS:
+            raise ValueError("Unknown backend {}. Please choose from {}".format(backend, BACKENDS))
+        if ponderation not in PONDERATIONS or (backend == "dense" and ponderation != "tf-idf"):
+            raise ValueError("Ponderation {} is not available with the {} backend".format(ponderation, backend))
+        self.__ponderation = ponderation
+        self.__backend = backend
         sys.stdout.write("Starting Engine \r")
         sys.stdout.flush()
         sys.stdout.write("Reading database... \r")
         sys.stdout.flush()
-        self.__get_files_name_to_load()
+        self.__number_documents()
         sys.stdout.write("Dropping unwanted markers and filtering stop-words...      \r")
         sys.stdout.flush()
         self.__clean_all_documents()
@@ -140,40 +181,190 @@ class CS276SearchEngine():
         self.__create_index()
         self.__compute_weights()
 
+        # Term-at-a-time scoring only needs the positional index and the idfs
+        if backend == "taat":
+            self.__taat = TermAtATimeScorer(self.__index, self.__idfs, ponderation)
+            return
+        # WAND and Block-Max WAND share the same docID-sorted postings
+        if backend == "wand" or backend == "bmw":
+            self.__pruning = DynamicPruningScorer(self.__index, self.__idfs, ponderation)
+            return
+
         # Create the vector space
         for doc in self.__clean_documents_list:
             for word in doc:
                 if word not in self.__keyword_to_vect_position.keys():
                     self.__keyword_to_vect_position[word] = len(self.__keyword_to_vect_position.keys())
-        
+
+        # The sparse backend builds a single CSR matrix instead of the dense vectors
+        if backend == "sparse":
+            self.__sparse = SparseBackend(self.__clean_documents, self.__keyword_to_vect_position, self.__idfs, ponderation)
+            return
+
         # Create a vector for each document
         for docID in self.__clean_documents:
             self.__vectors[docID] = self.__vectorize_doc(docID)
 
-    def search(self, query):
-        """ Cleans the query and compares it to the vectors in the database """
-        t0 = time.time()
+    def save_index(self, directory):
+        """ Saves the positional index and the norms of the documents in the on-disk format """
+        docIDs = sorted(self.__clean_documents)
+        IndexStore.save(
+            directory, self.__index,
+            lambda word: {docID: len(positions) for docID, positions in self.__index[word].items()},
+            positions=self.__index.__getitem__, docIDs=docIDs,
+            norms=document_norms(self.__index, docIDs, self.__idfs, self.__ponderation),
+            metadata={"engine": "vector", "collection": "CS276", "ponderation": self.__ponderation,
+                      "normalization": self.__normalizer is not None}
+        )
+        if self.__normalizer is not None:
+            self.__normalizer.save(directory)
+        self.__documents.save(directory)
+        print("Saved the index in {}".format(directory))
+
+    def load_index(self, directory, cache_memory=16 * 2**20):
+        """
+        Opens an index saved earlier, the documents are scored term by term on the mapped files
+        At most cache_memory bytes of posting lists are kept in memory
+        """
+        self.__store = IndexStore.IndexStore(directory)
+        self.__ponderation = self.__store.metadata["ponderation"]
+        self.__stored = StoredScorer(self.__store, self.__ponderation, cache_memory)
+        # The queries are normalized like the saved documents, mostly by lookups in the saved cache
+        self.__normalizer = Normalizer.load(directory) if self.__store.metadata.get("normalization") else None
+        self.__documents = DocIDTable.load(directory) or DocIDTable()
+
+    def create_full_index(self, directory, ponderation="tf-idf"):
+        """
+        Indexes the 10 folders out of core: the documents are read once and their weighted rows are written in directory
+        Only the vocabulary is kept in memory, the index is then searched on the mapped files
+        """
+        OutOfCore.build(directory, self.__stream_documents(), ponderation,
+                        metadata={"engine": "vector", "collection": "CS276", "normalization": self.__normalizer is not None})
+        self.__documents.save(directory)
+        if self.__normalizer is not None:
+            self.__normalizer.save(directory)
+        self.load_full_index(directory)
+
+    def load_full_index(self, directory):
+        """ Opens the weighted rows of the whole collection written by create_full_index """
+        self.__full = OutOfCore.OutOfCoreScorer(directory)
+        self.__documents = DocIDTable.load(directory) or DocIDTable()
+        self.__ponderation = self.__full.metadata["ponderation"]
+        self.__normalizer = Normalizer.load(directory) if self.__full.metadata.get("normalization") else None
+
+    def update_segments(self, segments, batch_size=1000, cache_memory=16 * 2**20):
+        """
+        Adds the files of the 10 folders that are not in the segments yet, batch_size documents per new segment,
+        then searches every segment, with the idfs of the whole collection
+        The files are found by name in the docID table saved with the segments, like the boolean engine does
+        """
+        self.__documents = segments.document_table()
+        added = 0
+        for i in range(10):
+            self.__current_folder = i
+            self.__get_files_name_to_load()
+            # Deleted files are still in the table, they are not added again
+            indexed = self.__documents.files(self.__current_folder)
+            self.__files_to_load = [file for file in self.__files_to_load if file not in indexed]
+            # Folders without new files are not read
+            if len(self.__files_to_load) == 0:
+                continue
+            first_docID = self.__documents.add_files(self.__current_folder, self.__files_to_load)
+            self.__clean_all_documents()
+            segments.add_new_documents({first_docID + j: document for j, document in enumerate(self.__clean_documents_list)}, batch_size)
+            # Saved with every folder, so that the table always covers the docIDs of the segments
+            self.__documents.save(segments.directory)
+            added += len(self.__files_to_load)
+        # The documents of the last folder read are not kept
+        self.__clean_documents, self.__clean_documents_list = {}, []
+        print("Added {} new documents to the segments".format(added))
+        self.__store = segments
+        self.__ponderation = segments.ponderation
+        self.__stored = StoredScorer(segments, self.__ponderation, cache_memory)
+
+    def clean_text(self, text):
+        """ Clean words of a new text of a document, cleaned like the documents """
+        document = self.__filter_stop_words(self.__parse_document_into_list(text))
+        return self.__normalize_document(document)
+
+    @property
+    def posting_cache(self):
+        """ Cache of the posting lists of a saved index, None if the index was built in memory """
+        if self.__stored is None:
+            return None
+        return self.__stored.cache
+
+    @property
+    def documents(self):
+        """ (folder, filename) of the docIDs read so far """
+        return self.__documents
+
+    @property
+    def full_index(self):
+        """ Out-of-core index of the whole collection, None if it was not built or opened """
+        return self.__full
+
+    @property
+    def search_stats(self):
+        """ Postings scored and skipped by the last WAND/BMW search """
+        if self.__pruning is None:
+            return {}
+        return self.__pruning.stats
+
+    def __clean_query(self, query):
+        """ Applies the cleaning of the documents to a query """
         clean_query = self.__tokenize_document(query)
         clean_query = map(lambda x: x.lower(), clean_query)
         clean_query = self.__filter_stop_words(clean_query)
-        clean_query = self.__lemmatize_document(clean_query)
-        clean_query = self.__stem_document(clean_query)
+        clean_query = self.__normalize_document(clean_query)
+        return clean_query
+
+    def __positional_candidates(self, constraints):
+        """ Documents matching every "phrase" and NEAR/k of the query, None if there are none """
+        candidates = None
+        for text, window in constraints:
+            words = self.__normalize_document(self.__filter_stop_words(text.split()))
+            if len(words) == 0:
+                continue
+            index = self.__index if self.__store is None else self.__store.positional_index
+            documents = Positional.matching_documents(index, words, [window] * (len(words) - 1))
+            candidates = documents if candidates is None else candidates & documents
+        return candidates
+
+    def search(self, query, k=50):
+        """
+        Cleans the query and compares it to the vectors in the database, returns the k closest documents
+        The "phrases" and NEAR/k of the query restrict the ranking to the documents matching them
+        """
+        t0 = time.time()
+        constraints, query = Positional.extract_constraints(query)
+        # The rows of the whole collection have no positions, the words of the phrases are only scored
+        if self.__full is not None:
+            return self.__full.search(self.__clean_query(query), k=k), time.time() - t0
+        candidates = self.__positional_candidates(constraints)
+        if candidates is not None and len(candidates) == 0:
+            return [], time.time() - t0
+        clean_query = self.__clean_query(query)
+        if self.__stored is not None:
+            return self.__stored.search(clean_query, k=k, candidates=candidates), time.time() - t0
+        if self.__backend == "sparse":
+            return self.__sparse.search(clean_query, k=k, candidates=candidates), time.time() - t0
+        if self.__backend == "taat":
+            return self.__taat.search(clean_query, k=k, candidates=candidates), time.time() - t0
+        if self.__backend == "wand" or self.__backend == "bmw":
+            results = self.__pruning.search(clean_query, k=k, block_max=(self.__backend == "bmw"), candidates=candidates)
+            return results, time.time() - t0
         # Convert to a vector
         query_vector = [0] * len(self.__keyword_to_vect_position.keys())
         for word in clean_query:
             query_vector[self.__keyword_to_vect_position[word]] = 1
-        # Compute distances
-        distances = {}
-        for docID in self.__vectors:
-            if docID > 0:
-                distances[docID] = cosine(self.__vectors[docID], query_vector)
+        # Compute distances, only the k closest documents are kept
+        top_k = TopK(k)
+        for docID in self.__vectors if candidates is None else sorted(candidates):
+            if docID > 0 and docID in self.__vectors:
+                distance = cosine(self.__vectors[docID], query_vector)
+                if distance < 1:
+                    top_k.push(docID, distance)
 
         # Return the list of documents and the time
-        def get_distance(_t):
-            """ Helper """
-            return _t[1]
-
-        results = sorted(distances.items(), key=get_distance)
-        results = [t for t in results if get_distance(t) < 1]
-
-        return results, time.time() - t0
+        return top_k.results(), time.time() - t0
@@ -0,0 +1,158 @@
+import heapq
+from bisect import bisect_left
+from math import sqrt
+from .TermAtATime import TermAtATimeScorer
+
+END_OF_LIST = float('inf')
+
+class _Cursor():
+    """ Position in the docID-sorted posting list of a query term """
+    __slots__ = ['docIDs', 'scores', 'pos', 'upper_bound', 'block_max', 'block_last', 'block_size']
+
+    def __init__(self, postings, block_size):
+        self.docIDs, self.scores, self.upper_bound, self.block_max, self.block_last = postings
+        self.block_size = block_size
+        self.pos = 0
+
+    @property
+    def doc(self):
+        """ Current docID, END_OF_LIST once the list is exhausted """
+        if self.pos < len(self.docIDs):
+            return self.docIDs[self.pos]
+        return END_OF_LIST
+
+    def seek(self, docID):
+        """ Moves to the first posting >= docID without reading the postings in between """
+        self.pos = bisect_left(self.docIDs, docID, self.pos)
+
+    def __block(self, docID):
+        """ Index of the block that may contain docID, starting from the current block """
+        return bisect_left(self.block_last, docID, self.pos // self.block_size)
+
+    def block_max_at(self, docID):
+        """ Upper bound of the scores in the block containing docID """
+        block = self.__block(docID)
+        if block < len(self.block_max):
+            return self.block_max[block]
+        return 0
+
+    def block_end(self, docID):
+        """ Last docID of the block containing docID """
+        block = self.__block(docID)
+        if block < len(self.block_last):
+            return self.block_last[block]
+        return END_OF_LIST
+
+
+class DynamicPruningScorer():
+    """ Top-k retrieval with WAND and Block-Max WAND over docID-sorted postings """
+    def __init__(self, index, idfs, ponderation="tf-idf", block_size=64):
+        self.__scorer = TermAtATimeScorer(index, idfs, ponderation)
+        self.__block_size = block_size
+        self.__postings = {}
+        self.stats = {}
+        self.__build_postings(index)
+
+    def __build_postings(self, index):
+        """ Sorts the postings by docID and stores the normalized scores with their upper bounds """
+        for word in index:
+            # A document whose words all weigh 0 has no direction, it is never returned
+            docIDs = [docID for docID in sorted(index[word]) if self.__scorer.norm(docID) > 0]
+            if len(docIDs) == 0:
+                # The word still counts in the norm of the queries
+                self.__postings[word] = None
+                continue
+            scores = []
+            for docID in docIDs:
+                w = self.__scorer.weight(word, docID, len(index[word][docID]))
+                scores.append(w / self.__scorer.norm(docID))
+            block_max = []
+            block_last = []
+            for start in range(0, len(docIDs), self.__block_size):
+                block_max.append(max(scores[start:start + self.__block_size]))
+                block_last.append(docIDs[min(start + self.__block_size, len(docIDs)) - 1])
+            self.__postings[word] = (docIDs, scores, max(scores), block_max, block_last)
+
+    def search(self, clean_query, k=50, block_max=False, candidates=None):
+        """
+        Returns the k documents closest to the query as a list of (docID, cosine distance)
+        If candidates is a set of docIDs, the other documents are left out
+        """
+        if k is None:
+            # Without a bound on the results, nothing can be pruned
+            k = float('inf')
+        query_terms = set(word for word in clean_query if word in self.__postings)
+        cursors = [_Cursor(self.__postings[word], self.__block_size) for word in query_terms if self.__postings[word] is not None]
+        self.stats = {
+            "postings": sum(len(c.docIDs) for c in cursors),
+            "scored": 0,
+        }
+        if len(cursors) == 0 or k <= 0:
+            self.stats["skipped"] = self.stats["postings"]
+            return []
+
+        top_k = [] # Min-heap of (score, docID)
+        threshold = 0
+        while True:
+            cursors = [c for c in cursors if c.doc != END_OF_LIST]
+            if len(cursors) == 0:
+                break
+            cursors.sort(key=lambda c: c.doc)
+
+            # The pivot is the first cursor at which the upper bounds can beat the threshold
+            pivot = None
+            bound = 0
+            for i, c in enumerate(cursors):
+                bound += c.upper_bound
+                if bound > threshold:
+                    pivot = i
+                    break
+            if pivot is None:
+                break
+            pivot_doc = cursors[pivot].doc
+
+            if block_max:
+                last = pivot
+                while last + 1 < len(cursors) and cursors[last + 1].doc == pivot_doc:
+                    last += 1
+                if sum(c.block_max_at(pivot_doc) for c in cursors[:last + 1]) <= threshold:
+                    # No document can enter the top-k before the end of the current blocks
+                    next_doc = min(c.block_end(pivot_doc) for c in cursors[:last + 1]) + 1
+                    if last + 1 < len(cursors):
+                        next_doc = min(next_doc, cursors[last + 1].doc)
+                    for c in cursors[:last + 1]:
+                        c.seek(next_doc)
+                    continue
+
+            if cursors[0].doc == pivot_doc and candidates is not None and pivot_doc not in candidates:
+                # Filtered out: the cursors move on without scoring the document
+                for c in cursors:
+                    if c.doc != pivot_doc:
+                        break
+                    c.pos += 1
+            elif cursors[0].doc == pivot_doc:
+                # Every cursor up to the pivot is on the pivot document: fully score it
+                score = 0
+                for c in cursors:
+                    if c.doc != pivot_doc:
+                        break
+                    score += c.scores[c.pos]
+                    c.pos += 1
+                    self.stats["scored"] += 1
+                if len(top_k) < k:
+                    heapq.heappush(top_k, (score, -pivot_doc))
+                elif score > top_k[0][0]:
+                    heapq.heapreplace(top_k, (score, -pivot_doc))
+                if len(top_k) == k:
+                    threshold = top_k[0][0]
+            else:
+                # The documents before the pivot cannot enter the top-k
+                for c in cursors[:pivot]:
+                    c.seek(pivot_doc)
+
+        # Every posting that was not scored has been skipped by the pruning
+        self.stats["skipped"] = self.stats["postings"] - self.stats["scored"]
+        query_norm = sqrt(len(query_terms))
+        results = [(-docID, 1 - score / query_norm) for score, docID in top_k]
+        results.sort(key=lambda t: (t[1], t[0]))
+        return results
@@ -0,0 +1,205 @@
+import json
+import os
+from collections import Counter
+from math import sqrt
+import numpy as np
+from .SparseBackend import PONDERATIONS
+from add_ins import TermDictionary
+from add_ins.Mapping import map_array
+
+# Version of the on-disk format, an index written with another version has to be rebuilt
+FORMAT_VERSION = 3
+
+METADATA_FILENAME = "meta.json"
+# Sorted terms front-coded by blocks, the offsets of the blocks, and the termID of every term as 32 bits integers
+TERMS_FILENAME = "terms.bin"
+BLOCKS_FILENAME = "blocks.bin"
+TERMIDS_FILENAME = "termids.bin"
+# Start of the row of every document in the two files below as 64 bits integers, a last offset marks the end
+ROWS_FILENAME = "rows.bin"
+# termIDs of the rows, one document after the other, as 32 bits integers
+COLUMNS_FILENAME = "columns.bin"
+# Weights of the rows divided by the norm of their document, as 32 bits floats
+# The file holds the term frequencies until the second pass replaces them
+WEIGHTS_FILENAME = "weights.bin"
+
+# The same entries by term, the term-major view read by a search: start of the list of every termID as 64 bits integers,
+# a last offset marks the end, then the docIDs of the lists as 32 bits integers and their weights as 32 bits floats
+TERM_OFFSETS_FILENAME = "term_offsets.bin"
+TERM_DOCIDS_FILENAME = "term_docids.bin"
+TERM_WEIGHTS_FILENAME = "term_weights.bin"
+
+# Entries kept in memory before being written, and entries read at once by the second pass and by a search
+BUFFER_SIZE = 2**20
+
+def build(directory, documents, ponderation="tf-idf", metadata=None):
+    """
+    Writes the weighted document-term matrix of a collection row by row, without keeping the collection in memory
+    documents yields the words of every document once, the docIDs are their positions in it
+    metadata is written once every document has been read
+    The first pass writes the term frequencies and counts the document frequencies,
+    the second pass replaces the frequencies by the weights and copies them into the lists of their terms,
+    one block of rows at a time
+    """
+    if ponderation not in PONDERATIONS:
+        raise ValueError("Unknown ponderation {}. Please choose from {}".format(ponderation, PONDERATIONS))
+    os.makedirs(directory, exist_ok=True)
+    columns_filename = os.path.join(directory, COLUMNS_FILENAME)
+    weights_filename = os.path.join(directory, WEIGHTS_FILENAME)
+
+    # The terms get their termIDs in the order they are met
+    vocabulary = {}
+    dfs = []
+    rows = [0]
+    columns, tfs = [], []
+    with open(columns_filename, 'wb') as columns_file, open(weights_filename, 'wb') as weights_file:
+        for document in documents:
+            row = Counter(document)
+            for word, tf in row.items():
+                termID = vocabulary.get(word)
+                if termID is None:
+                    termID = vocabulary[word] = len(dfs)
+                    dfs.append(0)
+                dfs[termID] += 1
+                columns.append(termID)
+                tfs.append(tf)
+            rows.append(rows[-1] + len(row))
+            if len(columns) >= BUFFER_SIZE:
+                np.array(columns, dtype=np.int32).tofile(columns_file)
+                np.array(tfs, dtype=np.float32).tofile(weights_file)
+                columns, tfs = [], []
+        np.array(columns, dtype=np.int32).tofile(columns_file)
+        np.array(tfs, dtype=np.float32).tofile(weights_file)
+    rows = np.array(rows, dtype=np.int64)
+    rows.tofile(os.path.join(directory, ROWS_FILENAME))
+    _weigh_rows(directory, rows, np.array(dfs, dtype=np.float64), ponderation)
+    _transpose_rows(directory, rows, np.array(dfs, dtype=np.int64))
+
+    terms = sorted(vocabulary)
+    TermDictionary.save(os.path.join(directory, TERMS_FILENAME), os.path.join(directory, BLOCKS_FILENAME), terms)
+    np.array([vocabulary[term] for term in terms], dtype=np.int32).tofile(os.path.join(directory, TERMIDS_FILENAME))
+    metadata = dict(metadata or {})
+    metadata.update({"version": FORMAT_VERSION, "ponderation": ponderation, "terms": len(dfs),
+                     "documents": len(rows) - 1, "entries": int(rows[-1])})
+    with open(os.path.join(directory, METADATA_FILENAME), 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+def _weigh_rows(directory, rows, dfs, ponderation):
+    """ Second pass: replaces the term frequencies by the normalized weights, in place and by blocks of rows """
+    N = len(rows) - 1
+    if rows[-1] == 0:
+        return
+    idfs = np.log10(N / dfs)
+    columns = np.memmap(os.path.join(directory, COLUMNS_FILENAME), dtype=np.int32, mode='r')
+    weights = np.memmap(os.path.join(directory, WEIGHTS_FILENAME), dtype=np.float32, mode='r+')
+    first = 0
+    while first < N:
+        # At least one row, at most BUFFER_SIZE entries otherwise
+        last = max(first + 1, int(np.searchsorted(rows, rows[first] + BUFFER_SIZE, side='right')) - 1)
+        start, end = rows[first], rows[last]
+        tfs = np.asarray(weights[start:end], dtype=np.float64)
+        # Row of every entry of the block
+        documents = np.repeat(np.arange(last - first), np.diff(rows[first:last + 1]))
+        if ponderation == "freq-norm":
+            max_tfs = np.zeros(last - first)
+            np.maximum.at(max_tfs, documents, tfs)
+            w = tfs / max_tfs[documents]
+        else:
+            w = (1 + np.log10(tfs)) * idfs[columns[start:end]]
+        # A document made of terms found in every document has a null vector, it is never returned
+        norms = np.sqrt(np.bincount(documents, w * w, minlength=last - first))
+        norms[norms == 0] = 1
+        weights[start:end] = w / norms[documents]
+        first = last
+    weights.flush()
+    del weights
+
+def _transpose_rows(directory, rows, dfs):
+    """ Writes the weighted rows as the lists of their terms, by blocks of rows: every block appends to the lists it contains """
+    offsets = np.zeros(len(dfs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(dfs)
+    offsets.tofile(os.path.join(directory, TERM_OFFSETS_FILENAME))
+    # Files of the same size as the rows, filled in place
+    for filename in (TERM_DOCIDS_FILENAME, TERM_WEIGHTS_FILENAME):
+        with open(os.path.join(directory, filename), 'wb') as f:
+            f.truncate(4 * int(rows[-1]))
+    if rows[-1] == 0:
+        return
+    columns = np.memmap(os.path.join(directory, COLUMNS_FILENAME), dtype=np.int32, mode='r')
+    weights = np.memmap(os.path.join(directory, WEIGHTS_FILENAME), dtype=np.float32, mode='r')
+    term_docIDs = np.memmap(os.path.join(directory, TERM_DOCIDS_FILENAME), dtype=np.int32, mode='r+')
+    term_weights = np.memmap(os.path.join(directory, TERM_WEIGHTS_FILENAME), dtype=np.float32, mode='r+')
+    # Next free entry of the list of every term
+    ends = offsets[:-1].copy()
+    N = len(rows) - 1
+    first = 0
+    while first < N:
+        last = max(first + 1, int(np.searchsorted(rows, rows[first] + BUFFER_SIZE, side='right')) - 1)
+        start, end = rows[first], rows[last]
+        # Sorted by term, the entries of a term stay in the order of the documents
+        order = np.argsort(columns[start:end], kind='stable')
+        termIDs = np.asarray(columns[start:end])[order]
+        documents = np.repeat(np.arange(first, last, dtype=np.int32), np.diff(rows[first:last + 1]))[order]
+        used, starts, counts = np.unique(termIDs, return_index=True, return_counts=True)
+        # Position of every entry in the list of its term
+        targets = ends[termIDs] + np.arange(len(termIDs)) - np.repeat(starts, counts)
+        term_docIDs[targets] = documents
+        term_weights[targets] = np.asarray(weights[start:end])[order]
+        ends[used] += counts
+        first = last
+    term_docIDs.flush()
+    term_weights.flush()
+    del term_docIDs, term_weights
+
+
+class OutOfCoreScorer():
+    """
+    Cosine similarity on the weighted rows written by build, the files are mapped in memory
+    A search only reads the lists of the query terms, only the first terms of the vocabulary blocks and the scores are kept in memory
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, METADATA_FILENAME), 'r') as f:
+            self.metadata = json.load(f)
+        if self.metadata.get("version") != FORMAT_VERSION:
+            raise ValueError("Index format version {} is not supported (expected {}). Please rebuild the index".format(
+                self.metadata.get("version"), FORMAT_VERSION))
+        self.__rows = np.fromfile(os.path.join(directory, ROWS_FILENAME), dtype=np.int64)
+        self.__offsets = np.fromfile(os.path.join(directory, TERM_OFFSETS_FILENAME), dtype=np.int64)
+        self.__docIDs = self.__map(TERM_DOCIDS_FILENAME, np.int32)
+        self.__weights = self.__map(TERM_WEIGHTS_FILENAME, np.float32)
+        self.vocabulary = TermDictionary.TermDictionary(self.__map(TERMS_FILENAME, np.uint8), np.fromfile(
+            os.path.join(directory, BLOCKS_FILENAME), dtype=np.uint64), self.metadata["terms"], values=self.__map(TERMIDS_FILENAME, np.int32))
+
+    def __map(self, filename, dtype):
+        return map_array(os.path.join(self.directory, filename), dtype)
+
+    def __len__(self):
+        return len(self.__rows) - 1
+
+    def search(self, clean_query, k=None, candidates=None):
+        """
+        Returns the k closest documents as a list of (docID, cosine distance)
+        If candidates is a set of docIDs, the other documents are left out
+        """
+        query_terms = set(self.vocabulary.get(word) for word in clean_query) - {None}
+        query_terms = np.array(sorted(query_terms), dtype=np.int32)
+        if len(query_terms) == 0 or (k is not None and k <= 0):
+            return []
+        scores = np.zeros(len(self))
+        for termID in query_terms.tolist():
+            start, end = self.__offsets[termID], self.__offsets[termID + 1]
+            # A document appears once in the list of a term
+            scores[self.__docIDs[start:end]] += self.__weights[start:end]
+
+        docIDs = np.flatnonzero(scores > 0)
+        if candidates is not None:
+            docIDs = docIDs[np.isin(docIDs, list(candidates))]
+        # The rows are unit vectors, the query is a binary vector
+        similarities = scores[docIDs] / sqrt(len(query_terms))
+        if k is not None and k < len(docIDs):
+            best = np.argpartition(-similarities, k - 1)[:k]
+            docIDs = docIDs[best]
+            similarities = similarities[best]
+        order = np.lexsort((docIDs, -similarities))
+        return [(int(docIDs[i]), float(1 - similarities[i])) for i in order]
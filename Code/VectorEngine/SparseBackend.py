@@ -0,0 +1,88 @@
+from collections import Counter
+from math import log10, sqrt
+import numpy as np
+from scipy.sparse import csr_matrix
+
+PONDERATIONS = ["tf-idf", "tf-idf-norm", "freq-norm"]
+
+class SparseBackend():
+    """ Document-term matrix stored as a float32 CSR matrix, queried with one sparse product """
+    def __init__(self, documents, keyword_to_vect_position, idfs, ponderation="tf-idf"):
+        if ponderation not in PONDERATIONS:
+            raise ValueError("Unknown ponderation {}. Please choose from {}".format(ponderation, PONDERATIONS))
+        self.__keyword_to_vect_position = keyword_to_vect_position
+        self.__idfs = idfs
+        self.__ponderation = ponderation
+        self.__docIDs = np.array(list(documents.keys()), dtype=np.int64)
+        self.__matrix = self.__build_matrix(documents)
+        # Norms of the rows, computed once for the cosine similarity
+        squared = self.__matrix.multiply(self.__matrix).sum(axis=1)
+        self.__norms = np.sqrt(np.asarray(squared, dtype=np.float32).ravel())
+
+    def __weights(self, document):
+        """ Returns the (column, weight) pairs of a document for the chosen ponderation """
+        tfs = Counter(document)
+        if len(tfs) == 0:
+            return [], []
+        columns = [self.__keyword_to_vect_position[word] for word in tfs]
+        if self.__ponderation == "freq-norm":
+            max_tf = max(tfs.values())
+            weights = [tf / max_tf for tf in tfs.values()]
+        else:
+            weights = [(1 + log10(tf)) * self.__idfs[word] for word, tf in tfs.items()]
+            if self.__ponderation == "tf-idf-norm":
+                n = sqrt(sum(w * w for w in weights))
+                if n != 0:
+                    weights = [w / n for w in weights]
+        return columns, weights
+
+    def __build_matrix(self, documents):
+        """ Builds the CSR matrix row by row, in the order of the docIDs """
+        indptr = [0]
+        indices = []
+        data = []
+        for docID in self.__docIDs:
+            columns, weights = self.__weights(documents[docID])
+            indices.extend(columns)
+            data.extend(weights)
+            indptr.append(len(indices))
+        shape = (len(self.__docIDs), len(self.__keyword_to_vect_position))
+        return csr_matrix(
+            (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+            shape=shape
+        )
+
+    @property
+    def nbytes(self):
+        """ Memory used by the matrix and the norms """
+        m = self.__matrix
+        return m.data.nbytes + m.indices.nbytes + m.indptr.nbytes + self.__norms.nbytes
+
+    def search(self, clean_query, k=None, candidates=None):
+        """
+        Scores every document against the query, returns the k closest as a list of (docID, cosine distance)
+        If candidates is a set of docIDs, the other documents are left out
+        """
+        columns = set()
+        for word in clean_query:
+            if word in self.__keyword_to_vect_position:
+                columns.add(self.__keyword_to_vect_position[word])
+        if len(columns) == 0 or (k is not None and k <= 0):
+            return []
+        # Binary query vector, as in the dense model
+        query_vector = np.zeros(self.__matrix.shape[1], dtype=np.float32)
+        query_vector[list(columns)] = 1
+        dot_products = self.__matrix.dot(query_vector)
+
+        # Only the documents sharing at least a word with the query can have a distance < 1
+        rows = np.flatnonzero((dot_products > 0) & (self.__norms > 0))
+        if candidates is not None:
+            rows = rows[np.isin(self.__docIDs[rows], list(candidates))]
+        similarities = dot_products[rows] / (self.__norms[rows] * sqrt(len(columns)))
+        # Partial selection of the k best rows, only those are sorted
+        if k is not None and k < len(rows):
+            best = np.argpartition(-similarities, k - 1)[:k]
+            rows = rows[best]
+            similarities = similarities[best]
+        order = np.lexsort((self.__docIDs[rows], -similarities))
+        return [(int(self.__docIDs[rows[i]]), float(1 - similarities[i])) for i in order]
@@ -0,0 +1,68 @@
+from math import log10, sqrt
+import numpy as np
+from .SparseBackend import PONDERATIONS
+from add_ins.PostingCache import PostingCache
+
+def document_norms(index, docIDs, idfs, ponderation="tf-idf"):
+    """
+    Norms of the document vectors, from a positional index {word: {docID: [positions]}}
+    The weights are not divided by the largest tf (freq-norm) or by the norm (tf-idf-norm), which leaves the cosine unchanged
+    """
+    if ponderation not in PONDERATIONS:
+        raise ValueError("Unknown ponderation {}. Please choose from {}".format(ponderation, PONDERATIONS))
+    rows = {docID: i for i, docID in enumerate(docIDs)}
+    squared_norms = np.zeros(len(docIDs))
+    for word in index:
+        for docID, positions in index[word].items():
+            if ponderation == "freq-norm":
+                w = len(positions)
+            else:
+                w = (1 + log10(len(positions))) * idfs[word]
+            squared_norms[rows[docID]] += w * w
+    return np.sqrt(squared_norms)
+
+
+class StoredScorer():
+    """ Term-at-a-time scoring on an index opened from the disk, with the document norms saved with it """
+    def __init__(self, store, ponderation="tf-idf", cache_memory=16 * 2**20):
+        if ponderation not in PONDERATIONS:
+            raise ValueError("Unknown ponderation {}. Please choose from {}".format(ponderation, PONDERATIONS))
+        self.__store = store
+        self.__ponderation = ponderation
+        # The posting lists are read from the disk through a LRU cache bounded in bytes
+        self.cache = PostingCache(store, capacity=cache_memory)
+
+    def search(self, clean_query, k=None, candidates=None):
+        """
+        Accumulates the scores term by term, returns the k closest as a list of (docID, cosine distance)
+        If candidates is a set of docIDs, the other documents are left out
+        """
+        vocabulary = self.__store.vocabulary
+        query_terms = set(vocabulary[word] for word in clean_query if word in vocabulary)
+        if len(query_terms) == 0 or (k is not None and k <= 0):
+            return []
+        docIDs = self.__store.docIDs
+        scores = np.zeros(len(docIDs))
+        for termID in query_terms:
+            ids, tfs = self.cache.arrays(termID)
+            if len(ids) == 0:
+                # Every document of the term was deleted
+                continue
+            if self.__ponderation == "freq-norm":
+                weights = tfs
+            else:
+                weights = (1 + np.log10(tfs)) * log10(len(docIDs) / len(ids))
+            # Every document appears once in a posting list
+            scores[np.searchsorted(docIDs, ids)] += weights
+
+        rows = np.flatnonzero(scores > 0)
+        if candidates is not None:
+            rows = rows[np.isin(docIDs[rows], list(candidates))]
+        # The query is a binary vector, its norm is the square root of its length
+        similarities = scores[rows] / (self.__store.norms[rows] * sqrt(len(query_terms)))
+        if k is not None and k < len(rows):
+            best = np.argpartition(-similarities, k - 1)[:k]
+            rows = rows[best]
+            similarities = similarities[best]
+        order = np.lexsort((docIDs[rows], -similarities))
+        return [(int(docIDs[rows[i]]), float(1 - similarities[i])) for i in order]
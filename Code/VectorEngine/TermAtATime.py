@@ -0,0 +1,68 @@
+from math import log10, sqrt
+from .SparseBackend import PONDERATIONS
+from .TopK import TopK
+
+class TermAtATimeScorer():
+    """ Scores the documents by walking the postings of the query terms only """
+    def __init__(self, index, idfs, ponderation="tf-idf"):
+        if ponderation not in PONDERATIONS:
+            raise ValueError("Unknown ponderation {}. Please choose from {}".format(ponderation, PONDERATIONS))
+        # {word: {docID: [positions]}}, the term frequency is the number of positions
+        self.__index = index
+        self.__idfs = idfs
+        self.__ponderation = ponderation
+        self.__max_tfs = {}
+        self.__norms = {}
+        self.__compute_norms()
+
+    def weight(self, word, docID, tf):
+        """ Weight of a word in a document, without the normalization of tf-idf-norm """
+        if self.__ponderation == "freq-norm":
+            return tf / self.__max_tfs[docID]
+        return (1 + log10(tf)) * self.__idfs[word]
+
+    def __compute_norms(self):
+        """ Precomputes the norm of every document vector from the postings """
+        if self.__ponderation == "freq-norm":
+            for word in self.__index:
+                for docID, positions in self.__index[word].items():
+                    if len(positions) > self.__max_tfs.get(docID, 0):
+                        self.__max_tfs[docID] = len(positions)
+        squared_norms = {}
+        for word in self.__index:
+            for docID, positions in self.__index[word].items():
+                w = self.weight(word, docID, len(positions))
+                squared_norms[docID] = squared_norms.get(docID, 0) + w * w
+        # tf-idf-norm vectors are divided by these norms, which leaves the cosine unchanged
+        self.__norms = {docID: sqrt(n) for docID, n in squared_norms.items()}
+
+    def norm(self, docID):
+        """ Returns the precomputed norm of a document """
+        return self.__norms.get(docID, 0)
+
+    def search(self, clean_query, k=None, candidates=None):
+        """
+        Accumulates the scores term by term, returns the k closest as a list of (docID, cosine distance)
+        If candidates is a set of docIDs, the other documents are left out
+        """
+        query_terms = set(word for word in clean_query if word in self.__index)
+        if len(query_terms) == 0:
+            return []
+        accumulators = {}
+        for word in query_terms:
+            for docID, positions in self.__index[word].items():
+                if candidates is not None and docID not in candidates:
+                    continue
+                accumulators[docID] = accumulators.get(docID, 0) + self.weight(word, docID, len(positions))
+
+        # The query is a binary vector, its norm is the square root of its length
+        query_norm = sqrt(len(query_terms))
+        top_k = TopK(k)
+        for docID, score in accumulators.items():
+            # A document whose words all weigh 0 has no direction, it is not similar to any query
+            if self.__norms[docID] == 0:
+                continue
+            similarity = score / (self.__norms[docID] * query_norm)
+            if similarity > 0:
+                top_k.push(docID, 1 - similarity)
+        return top_k.results()
@@ -0,0 +1,24 @@
+import heapq
+
+class TopK():
+    """ Streaming selection of the k documents with the smallest distances, in a bounded heap """
+    def __init__(self, k=None):
+        # No bound if k is None, nothing is kept if k <= 0, like the other backends
+        self.__k = k
+        # Max-heap on (distance, docID): the root is the worst document kept so far
+        self.__heap = []
+
+    def __len__(self):
+        return len(self.__heap)
+
+    def push(self, docID, distance):
+        """ Offers a document to the selection, in O(log k) """
+        item = (-distance, -docID)
+        if self.__k is None or len(self.__heap) < self.__k:
+            heapq.heappush(self.__heap, item)
+        elif len(self.__heap) > 0 and item > self.__heap[0]:
+            heapq.heapreplace(self.__heap, item)
+
+    def results(self):
+        """ Returns the selected documents as a list of (docID, distance), closest first """
+        return sorted(((-docID, -distance) for distance, docID in self.__heap), key=lambda t: (t[1], t[0]))
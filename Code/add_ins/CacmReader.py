@@ -0,0 +1,87 @@
+import re
+from functools import partial
+import nltk
+from . import Parallel
+
+# Markers of the fields of a record: the text of the kept fields is indexed, the other fields are skipped
+MARKERS_TO_KEEP = ['.T', '.W', '.K']
+MARKERS_TO_DROP = ['.B', '.A', '.N', '.X', '.C']
+MARKERS = set(MARKERS_TO_KEEP + MARKERS_TO_DROP)
+# Line starting a record, with its number
+RECORD_MARKER = re.compile(r'\.I \d+')
+
+TOKENIZERS = ["nltk", "regex"]
+# Single pass of the regex tokenizer: a marker alone on its line, or a number with thousands separators,
+# or a word with its inner hyphens, dots and slashes, or a clitic like 's, or an ellipsis, or a punctuation mark
+TOKEN_PATTERN = re.compile(r"^(\.[TWKBANXC])$|(\d+(?:,\d{3})+(?:\.\d+)?|\w+(?:[-./^]\w+)*|'\w+|\.\.\.|[^\w\s])", re.MULTILINE)
+
+def read_records(filename):
+    """ Yields the (docID, text) of the records of the collection one at a time, the docIDs start at 1 """
+    docID, lines = 0, []
+    with open(filename, 'r') as f:
+        for line in f:
+            match = RECORD_MARKER.match(line)
+            if match is None:
+                lines.append(line)
+                continue
+            # The text before the first record is not a document
+            if docID > 0:
+                yield docID, ''.join(lines)
+            docID += 1
+            lines = [line[match.end():]]
+    if docID > 0:
+        yield docID, ''.join(lines)
+
+def tokenize(text, tokenizer="nltk"):
+    """ Splits a text into tokens, the markers are kept as tokens """
+    if tokenizer == "nltk":
+        return nltk.tokenize.word_tokenize(text)
+    if tokenizer == "regex":
+        return [marker or token for marker, token in TOKEN_PATTERN.findall(text)]
+    raise ValueError("Unknown tokenizer {}. Please choose from {}".format(tokenizer, TOKENIZERS))
+
+def analyze(text, stop_words, tokenizer="nltk"):
+    """ Tokenizes a record and keeps the lowercase words of its kept fields that are not stop words, in a single pass """
+    if tokenizer == "regex":
+        return _analyze_regex(text, stop_words)
+    if tokenizer != "nltk":
+        raise ValueError("Unknown tokenizer {}. Please choose from {}".format(tokenizer, TOKENIZERS))
+    words = []
+    keep = False
+    for token in nltk.tokenize.word_tokenize(text):
+        if token in MARKERS:
+            keep = token not in MARKERS_TO_DROP
+            continue
+        if keep:
+            word = token.lower()
+            if word not in stop_words:
+                words.append(word)
+    return words
+
+def _analyze_regex(text, stop_words):
+    """ Same cleaning as analyze, the markers are recognised by the pattern at the start of their line """
+    words = []
+    keep = False
+    for marker, token in TOKEN_PATTERN.findall(text):
+        if marker:
+            keep = marker not in MARKERS_TO_DROP
+        elif keep:
+            word = token.lower()
+            if word not in stop_words:
+                words.append(word)
+    return words
+
+def analyze_record(record, stop_words, tokenizer="nltk"):
+    """ Cleans a record (docID, text), in a worker process if the analysis is parallel """
+    docID, text = record
+    return docID, analyze(text, stop_words, tokenizer)
+
+def clean_documents(filename, stop_words, workers=1, tokenizer="nltk"):
+    """
+    Yields the clean documents (docID, [words]) of the collection in order, the records are read one at a time
+    With several workers, chunks of records are analyzed in a pool of processes
+    """
+    if tokenizer not in TOKENIZERS:
+        raise ValueError("Unknown tokenizer {}. Please choose from {}".format(tokenizer, TOKENIZERS))
+    analyzer = partial(analyze_record, stop_words=stop_words, tokenizer=tokenizer)
+    return Parallel.map_in_order(analyzer, read_records(filename), workers)
@@ -0,0 +1,85 @@
+import os
+import numpy as np
+
+# Names of the files of the documents, encoded in UTF-8 one after the other
+NAMES_FILENAME = "document_names.bin"
+# Start of the name of every docID as 64 bits integers, a last offset marks the end
+OFFSETS_FILENAME = "document_offsets.bin"
+# (folder, first docID) of every range of docIDs as 64 bits integers
+FOLDERS_FILENAME = "document_folders.bin"
+
+class DocIDTable():
+    """
+    docID -> (folder, filename) of a collection split in folders, the docIDs of a folder follow each other
+    Files added to a folder later get a range of docIDs of their own, after every docID given before
+    The names are kept in one byte buffer and the folders as ranges of docIDs, there is no Python object per document
+    """
+    def __init__(self, folders=None, offsets=None, names=None):
+        self.__folders = np.zeros((0, 2), dtype=np.int64) if folders is None else folders.reshape(-1, 2)
+        self.__offsets = np.zeros(1, dtype=np.int64) if offsets is None else offsets
+        self.__names = np.zeros(0, dtype=np.uint8) if names is None else names
+
+    def add_folder(self, folder, files):
+        """ Gives the next docIDs to the files of a folder the first time it is added, returns the docID of its first file """
+        rows = np.flatnonzero(self.__folders[:, 0] == folder)
+        if len(rows) > 0:
+            return int(self.__folders[rows[0], 1])
+        return self.add_files(folder, files)
+
+    def add_files(self, folder, files):
+        """ Gives the next docIDs to files of a folder, even if the folder was added before, returns the docID of the first file """
+        first_docID = len(self)
+        # No files, no range of docIDs
+        if len(files) == 0:
+            return first_docID
+        encoded = [file.encode('utf-8') for file in files]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        self.__folders = np.vstack([self.__folders, np.array([[folder, first_docID]], dtype=np.int64)])
+        self.__offsets = np.concatenate([self.__offsets, self.__offsets[-1] + np.cumsum(lengths)])
+        self.__names = np.concatenate([self.__names, np.frombuffer(b''.join(encoded), dtype=np.uint8)])
+        return first_docID
+
+    def __len__(self):
+        return len(self.__offsets) - 1
+
+    def __getitem__(self, docID):
+        """ Returns the (folder, filename) of a docID """
+        if not 0 <= docID < len(self):
+            raise KeyError(docID)
+        row = np.searchsorted(self.__folders[:, 1], docID, side='right') - 1
+        name = self.__names[self.__offsets[docID]:self.__offsets[docID + 1]].tobytes().decode('utf-8')
+        return int(self.__folders[row, 0]), name
+
+    def files(self, folder):
+        """ Returns the {filename: docID} of the files of a folder """
+        ends = np.append(self.__folders[1:, 1], len(self))
+        files = {}
+        for row in np.flatnonzero(self.__folders[:, 0] == folder).tolist():
+            for docID in range(int(self.__folders[row, 1]), int(ends[row])):
+                files[self.__names[self.__offsets[docID]:self.__offsets[docID + 1]].tobytes().decode('utf-8')] = docID
+        return files
+
+    def path(self, docID, root=''):
+        """ Path of the file of a docID, from the root of the collection """
+        folder, name = self[docID]
+        return os.path.join(root, str(folder), name)
+
+    def save(self, directory):
+        """ Writes the arrays of the table next to an index """
+        self.__folders.tofile(os.path.join(directory, FOLDERS_FILENAME))
+        self.__offsets.tofile(os.path.join(directory, OFFSETS_FILENAME))
+        self.__names.tofile(os.path.join(directory, NAMES_FILENAME))
+
+    @classmethod
+    def load(cls, directory):
+        """ Reads the table saved with an index, None if the index was saved without one """
+        if not os.path.exists(os.path.join(directory, OFFSETS_FILENAME)):
+            return None
+        return cls(np.fromfile(os.path.join(directory, FOLDERS_FILENAME), dtype=np.int64),
+                   np.fromfile(os.path.join(directory, OFFSETS_FILENAME), dtype=np.int64),
+                   np.fromfile(os.path.join(directory, NAMES_FILENAME), dtype=np.uint8))
+
+    @property
+    def nbytes(self):
+        """ Memory used by the arrays of the table """
+        return self.__folders.nbytes + self.__offsets.nbytes + self.__names.nbytes
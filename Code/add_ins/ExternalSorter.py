@@ -1,96 +1,81 @@
-import csv
-import ast
+import heapq
+import os
 import sys
+from array import array
+import numpy as np
 
-class ExternalSorter():
-    """ This is a custom implementation of the external sorting algorithm """
-    def __init__(self, file_1, file_2, buffer_size=1000):
-        self.f1 = file_1
-        self.f2 = file_2
-        self.__f1_done = False
-        self.__f2_done = False
-        self.__buffer_size = buffer_size
-        self.__buffer_1 = []
-        self.__buffer_1_pointer = 0
-        self.__buffer_2 = []
-        self.__buffer_2_pointer = 0
-        self.__buffer_output = []
+# Size of an item of the runs, in bytes
+ITEM_SIZE = 8
 
-    def __replenish_buffer(self, buffer_id):
+def pack(high, low):
+    """ Packs two 32 bits integers into one key, sorted on high first """
+    return (high << 32) | low
 
-        if buffer_id == 1:
-            # Replenish buffer 1 if possible
-            with open(self.f1, 'r') as list_1:
-                tracker = False
-                for i, line in enumerate(list_1):
-                    if i >= self.__buffer_1_pointer and i < self.__buffer_size + self.__buffer_1_pointer:
-                        self.__buffer_1.append(ast.literal_eval(line.strip()))
-                        tracker = True
-                # Set new pointer
-                self.__buffer_1_pointer += self.__buffer_size
-                # Track if a change has been made to the buffer
-                if not tracker:
-                    # No changes have been made
-                    self.__f1_done = True
+def unpack(key):
+    """ Splits a key into its two 32 bits integers """
+    return key >> 32, key & 0xFFFFFFFF
 
-        elif buffer_id == 2:
-            # Replenish buffer 2 if possible
-            with open(self.f2, 'r') as list_2:
-                tracker = False
-                for i, line in enumerate(list_2):
-                    if i >= self.__buffer_2_pointer and i < self.__buffer_size + self.__buffer_2_pointer:
-                        self.__buffer_2.append(ast.literal_eval(line.strip()))
-                        tracker = True
-                # Set new pointer
-                self.__buffer_1_pointer += self.__buffer_size
-                # Track if a change has been made to the buffer
-                if not tracker:
-                    # No changes have been made
-                    self.__f2_done = True
 
-        else:
-            raise ValueError("There are only 2 buffers")
+class RunReader():
+    """ Sequential reader of a binary run, a buffer of keys is read at once """
+    def __init__(self, filename, buffer_size):
+        self.filename = filename
+        self.__buffer_size = buffer_size
 
-    def sort(self):
-        """ Sort in 3 buffers
-        buffer_a is for the first list
-        buffer_b is for the second list
-        buffer_output is the output
-        """
-        
-        # Initialize buffer 1
-        self.__replenish_buffer(1)
+    def __iter__(self):
+        with open(self.filename, 'rb') as f:
+            while True:
+                data = f.read(self.__buffer_size * ITEM_SIZE)
+                if len(data) == 0:
+                    break
+                buffer = array('Q')
+                buffer.frombytes(data)
+                yield from buffer
 
-        # Initialize buffer 2
-        self.__replenish_buffer(2)
-        
-        # Main loop
-        iteration = 0
-        while len(self.__buffer_output) > 0 or len(self.__buffer_1) > 0 or len(self.__buffer_2) > 0:
-            # Check which is bigger
-            if self.__buffer_1[0][0] > self.__buffer_2[0][0]:
-                self.__buffer_output.append(self.__buffer_2[0])
-                self.__buffer_2.pop(0)
-            else:
-                self.__buffer_output.append(self.__buffer_1[0])
-                self.__buffer_1.pop(0)
 
-            # Check if one of the input buffers is empty
-            if len(self.__buffer_1) == 0 and not self.__f1_done:
-                self.__replenish_buffer(1)
+class ExternalSorter():
+    """
+    This is a custom implementation of the external sorting algorithm, for unsigned 64 bits keys
+    The keys are sorted in memory by blocks that fit in the memory budget, each block is written
+    to disk as a binary run, and the runs are combined with a k-way merge
+    """
+    def __init__(self, directory, memory_budget=64 * 2**20, buffer_size=2**14):
+        self.__directory = directory
+        # Number of keys of a block, the budget is given in bytes
+        self.__block_size = max(1, memory_budget // ITEM_SIZE)
+        # Number of keys read at once from each run during the merge
+        self.__buffer_size = buffer_size
+        self.__block = array('Q')
+        self.runs = []
+        os.makedirs(directory, exist_ok=True)
 
-            if len(self.__buffer_2) == 0 and not self.__f2_done:
-                self.__replenish_buffer(2)
+    def add(self, key):
+        """ Adds a key, the block is written to disk once it is full """
+        self.__block.append(key)
+        if len(self.__block) >= self.__block_size:
+            self.__write_run()
 
-            # Check if the output buffer is full
-            if len(self.__buffer_output) >= self.__buffer_size:
-                with open('sorted.csv', 'a') as end:
-                    writer = csv.writer(end)
-                    writer.writerows(self.__buffer_output)
-                # Flush it
-                self.__buffer_output = []
-            iteration += 1
-            sys.stdout.write("Currently at iteration: %d%%   \r" % iteration)
-            sys.stdout.flush()
+    def __write_run(self):
+        """ Sorts the current block and writes it as a binary run """
+        if len(self.__block) == 0:
+            return
+        filename = os.path.join(self.__directory, "run_{}.bin".format(len(self.runs)))
+        # Sorted in place as a view of the block, the keys never become Python integers
+        keys = np.frombuffer(self.__block, dtype=np.uint64)
+        keys.sort()
+        keys.tofile(filename)
+        self.runs.append(filename)
+        self.__block = array('Q')
+        sys.stdout.write("Written run {}                              \r".format(len(self.runs)))
+        sys.stdout.flush()
 
-        return True
+    def merge(self):
+        """ Yields every key in ascending order, the runs are deleted at the end """
+        self.__write_run()
+        readers = [RunReader(filename, self.__buffer_size) for filename in self.runs]
+        yield from heapq.merge(*readers)
+        for filename in self.runs:
+            os.remove(filename)
+        self.runs = []
+        if len(os.listdir(self.__directory)) == 0:
+            os.rmdir(self.__directory)
@@ -0,0 +1,163 @@
+import os
+import zlib
+import numpy as np
+from . import TermDictionary
+from .Mapping import map_array
+
+# Hashes of every term and of the term with up to its largest correction distance of letters deleted (at least one),
+# sorted, as 32 bits integers
+HASHES_FILENAME = "deletion_hashes.bin"
+# Rank of the term of every hash, as 32 bits integers
+RANKS_FILENAME = "deletion_ranks.bin"
+
+def max_distance(term):
+    """ Largest edit distance of a correction of a term: none under three letters, two typos over five """
+    if len(term) <= 2:
+        return 0
+    return 1 if len(term) <= 5 else 2
+
+def levenshtein(a, b, bound):
+    """
+    Edit distance between two terms, bound + 1 as soon as it is known to be greater than bound
+    The column of the distances to the prefixes of a is kept as the bits of its increments (Myers), one step per letter of b
+    """
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    if len(a) == 0:
+        return min(len(b), bound + 1)
+    # Bit i of the mask of a letter is set where a[i] is this letter
+    masks = {}
+    for i, x in enumerate(a):
+        masks[x] = masks.get(x, 0) | (1 << i)
+    full, last = (1 << len(a)) - 1, 1 << (len(a) - 1)
+    # Positions where the distance goes up or down by one from the previous prefix of a, d is the distance to the whole of a
+    up, down, d = full, 0, len(a)
+    for j, y in enumerate(b, 1):
+        match = masks.get(y, 0)
+        vertical = match | down
+        horizontal = (((match & up) + up) ^ up) | match
+        right = down | (~(horizontal | up) & full)
+        left = up & horizontal
+        if right & last:
+            d += 1
+        elif left & last:
+            d -= 1
+        right = ((right << 1) | 1) & full
+        left = (left << 1) & full
+        up = left | (~(vertical | right) & full)
+        down = right & vertical
+        # Every letter left in b lowers the distance by one at most
+        if d - (len(b) - j) > bound:
+            return bound + 1
+    return min(d, bound + 1)
+
+def _deletions(strings):
+    """ Every string made by deleting one letter of one of the strings """
+    return {string[:i] + string[i + 1:] for string in strings for i in range(len(string))}
+
+def _hash(string):
+    return zlib.crc32(string.encode('utf-8'))
+
+
+class FuzzyIndex():
+    """
+    Hashes of the terms of a vocabulary and of their deletions -> ranks of the terms, sorted by hash (symmetric delete)
+    Two terms d edits apart give the same string once at most d letters are deleted from each of them:
+    the candidates of a misspelled term are found by looking up its own deletions, then checked with the edit distance
+    A term is stored with one letter deleted, and with two if it is long enough to be corrected twice
+    The ranks are the positions of the terms in the sorted vocabulary, the termIDs of a saved index
+    """
+    def __init__(self, vocabulary, hashes, ranks):
+        self.vocabulary = vocabulary
+        self.__hashes = hashes
+        self.__ranks = ranks
+
+    @classmethod
+    def build(cls, terms):
+        """ Builds the index of any iterable of terms """
+        return cls.from_vocabulary(TermDictionary.TermDictionary.from_terms(sorted(set(terms))))
+
+    @classmethod
+    def from_vocabulary(cls, vocabulary):
+        """ Builds the index of the terms of a TermDictionary """
+        counts = np.zeros(len(vocabulary), dtype=np.int64)
+
+        def strings():
+            for rank, term in enumerate(vocabulary):
+                # Only the misspelled terms of more than five letters are corrected twice, a term of five letters at most
+                # two edits away from one of them never needs two of its own letters deleted
+                strings, level = {term}, {term}
+                for _ in range(max(1, max_distance(term))):
+                    level = _deletions(level)
+                    strings |= level
+                counts[rank] = len(strings)
+                yield from strings
+
+        # The hashes go straight into an array, the ranks are repeated once the number of strings of every term is known
+        hashes = np.fromiter((_hash(string) for string in strings()), dtype=np.uint32)
+        ranks = np.repeat(np.arange(len(vocabulary), dtype=np.uint64), counts)
+        # One 64 bits key (hash, rank) per string, sorted in place
+        keys = hashes.astype(np.uint64) << np.uint64(32)
+        del hashes
+        keys |= ranks
+        del ranks
+        keys.sort()
+        return cls(vocabulary, (keys >> np.uint64(32)).astype(np.uint32), (keys & np.uint64(0xffffffff)).astype(np.int32))
+
+    def save(self, directory):
+        """ Writes the hashes and their ranks next to an index, the vocabulary is written by the index """
+        self.__hashes.tofile(os.path.join(directory, HASHES_FILENAME))
+        self.__ranks.tofile(os.path.join(directory, RANKS_FILENAME))
+
+    @classmethod
+    def load(cls, directory, vocabulary):
+        """ Opens the hashes saved with an index whose terms are vocabulary, None if the index was saved without them """
+        if not os.path.exists(os.path.join(directory, HASHES_FILENAME)):
+            return None
+        return cls(vocabulary, map_array(os.path.join(directory, HASHES_FILENAME), np.uint32),
+                   map_array(os.path.join(directory, RANKS_FILENAME), np.int32))
+
+    def closest(self, term, distance=None):
+        """
+        Returns the terms at the smallest edit distance from a term, at most distance edits away, and this distance
+        distance is given by the length of the term if None, a larger distance may miss terms of the vocabulary
+        """
+        if distance is None:
+            distance = max_distance(term)
+        if distance == 0:
+            return ([term], 0) if term in self.vocabulary else ([], None)
+        # The terms one edit away are all found with one letter deleted, the next deletions are only needed without them
+        level, looked_up, checked = {term}, set(), set()
+        best, matches = distance + 1, []
+        for deleted in range(1, distance + 1):
+            level = _deletions(level)
+            strings = (level | {term}) - looked_up
+            looked_up |= strings
+            hashes = np.array(sorted({_hash(string) for string in strings}), dtype=np.uint32)
+            starts = np.searchsorted(self.__hashes, hashes, side='left')
+            ends = np.searchsorted(self.__hashes, hashes, side='right')
+            # The ranks of every interval are read at once
+            lengths = ends - starts
+            rows = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            ranks = set(self.__ranks[rows].tolist())
+            # Different strings may have the same hash, every candidate is checked
+            for candidate in self.vocabulary.terms(sorted(ranks - checked)):
+                d = levenshtein(term, candidate, distance)
+                if d < best:
+                    best, matches = d, [candidate]
+                elif d == best:
+                    matches.append(candidate)
+            checked |= ranks
+            if best <= deleted:
+                break
+        if best > distance:
+            return [], None
+        return matches, best
+
+    def __len__(self):
+        return len(self.__hashes)
+
+    @property
+    def nbytes(self):
+        """ Memory used by the hashes and their ranks """
+        return self.__hashes.nbytes + self.__ranks.nbytes
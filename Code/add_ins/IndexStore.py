@@ -0,0 +1,212 @@
+import json
+import os
+import numpy as np
+from . import TermDictionary, KGramIndex, FuzzyIndex
+from .Mapping import map_array
+
+# Version of the on-disk format, an index written with another version has to be rebuilt
+FORMAT_VERSION = 2
+
+METADATA_FILENAME = "meta.json"
+# Sorted terms, encoded in UTF-8 and front-coded by blocks
+TERMS_FILENAME = "terms.bin"
+# Offset of every block of terms as 64 bits integers, a last offset marks the end
+BLOCKS_FILENAME = "blocks.bin"
+# One row of 64 bits integers per term: (postings offset, document frequency, positions offset)
+# The offsets are counted in 32 bits integers, a last row marks the ends
+LEXICON_FILENAME = "lexicon.bin"
+# docIDs then term frequencies of every term, as 32 bits integers
+POSTINGS_FILENAME = "postings.bin"
+# Positions of the postings of every term, in the order of the docIDs, as 32 bits integers
+POSITIONS_FILENAME = "positions.bin"
+# Sorted docIDs of the collection as 32 bits integers, and the norms of their vectors as 32 bits floats
+DOCIDS_FILENAME = "docids.bin"
+NORMS_FILENAME = "norms.bin"
+
+LEXICON_COLUMNS = 3
+
+def save(directory, terms, postings, positions=None, docIDs=None, norms=None, metadata=None, kgrams=False,
+         deletions=False):
+    """
+    Writes an index in the on-disk format
+    postings(term) returns the {docID: tf} of a term, positions(term) its {docID: [positions]} if there are any
+    docIDs defaults to every docID of the postings, norms[i] is the norm of the vector of the i-th docID
+    kgrams also writes the k-gram index of the terms, for the wildcards of the boolean model
+    deletions also writes the deletions of the terms, for the correction of the misspelled words of the boolean model
+    Terms without any posting are left out
+    """
+    os.makedirs(directory, exist_ok=True)
+    lexicon = []
+    kept_terms = []
+    collection = set()
+    postings_offset, positions_offset = 0, 0
+    with open(os.path.join(directory, POSTINGS_FILENAME), 'wb') as postings_file, \
+            open(os.path.join(directory, POSITIONS_FILENAME), 'wb') as positions_file:
+        # Python sorts the strings like their UTF-8 bytes
+        for term in sorted(terms):
+            term_postings = postings(term)
+            ids = sorted(term_postings)
+            if len(ids) == 0:
+                continue
+            lexicon.append((postings_offset, len(ids), positions_offset))
+            kept_terms.append(term)
+            np.array(ids, dtype=np.uint32).tofile(postings_file)
+            np.array([term_postings[docID] for docID in ids], dtype=np.uint32).tofile(postings_file)
+            postings_offset += 2 * len(ids)
+            if positions is not None:
+                term_positions = positions(term)
+                for docID in ids:
+                    np.array(term_positions[docID], dtype=np.uint32).tofile(positions_file)
+                    positions_offset += len(term_positions[docID])
+            if docIDs is None:
+                collection.update(ids)
+    lexicon.append((postings_offset, 0, positions_offset))
+    TermDictionary.save(os.path.join(directory, TERMS_FILENAME), os.path.join(directory, BLOCKS_FILENAME), kept_terms)
+    # The ranks of the k-grams lists and of the deletions are the termIDs of the index
+    if kgrams:
+        KGramIndex.KGramIndex.build(kept_terms).save(directory)
+    if deletions:
+        FuzzyIndex.FuzzyIndex.build(kept_terms).save(directory)
+    np.array(lexicon, dtype=np.uint64).tofile(os.path.join(directory, LEXICON_FILENAME))
+
+    docIDs = np.array(sorted(collection if docIDs is None else docIDs), dtype=np.uint32)
+    docIDs.tofile(os.path.join(directory, DOCIDS_FILENAME))
+    if norms is not None and len(norms) != len(docIDs):
+        raise ValueError("Got {} norms for {} documents".format(len(norms), len(docIDs)))
+    np.array([] if norms is None else norms, dtype=np.float32).tofile(os.path.join(directory, NORMS_FILENAME))
+
+    metadata = dict(metadata or {})
+    metadata.update({"version": FORMAT_VERSION, "terms": len(lexicon) - 1, "documents": len(docIDs),
+                     "positions": positions is not None, "norms": norms is not None})
+    with open(os.path.join(directory, METADATA_FILENAME), 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+
+class PositionalView():
+    """ Positional index {word: {docID: [positions]}} read from the positions file of an index """
+    def __init__(self, store):
+        self.__store = store
+
+    def __getitem__(self, word):
+        return self.__store.positions(self.__store.vocabulary[word])
+
+    def get(self, word, default=None):
+        if word not in self:
+            return default
+        return self[word]
+
+    def __contains__(self, word):
+        return word in self.__store.vocabulary
+
+    def __iter__(self):
+        return iter(self.__store.vocabulary)
+
+    def __len__(self):
+        return len(self.__store.vocabulary)
+
+
+class IndexStore():
+    """
+    Index {termID: {docID: tf}} opened from the on-disk format, the files are mapped in memory
+    Nothing is read before a posting list is accessed, the termIDs are given by the vocabulary
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, METADATA_FILENAME), 'r') as f:
+            self.metadata = json.load(f)
+        if self.metadata.get("version") != FORMAT_VERSION:
+            raise ValueError("Index format version {} is not supported (expected {}). Please rebuild the index".format(
+                self.metadata.get("version"), FORMAT_VERSION))
+        self.__lexicon = self.__map(LEXICON_FILENAME, np.uint64).reshape(-1, LEXICON_COLUMNS)
+        self.__postings = self.__map(POSTINGS_FILENAME, np.uint32)
+        self.__positions = self.__map(POSITIONS_FILENAME, np.uint32)
+        self.docIDs = self.__map(DOCIDS_FILENAME, np.uint32)
+        self.norms = self.__map(NORMS_FILENAME, np.float32)
+        self.vocabulary = TermDictionary.TermDictionary(self.__map(TERMS_FILENAME, np.uint8), self.__map(BLOCKS_FILENAME, np.uint64),
+                                                        len(self), offsets=self.__lexicon[:, 0])
+        self.positional_index = PositionalView(self) if self.metadata["positions"] else None
+        # Read or built on first use
+        self.__kgram_index = None
+        self.__fuzzy_index = None
+
+    def __map(self, filename, dtype):
+        return map_array(os.path.join(self.directory, filename), dtype)
+
+    @property
+    def kgram_index(self):
+        """ k-grams of the vocabulary, mapped if they were saved with the index, built in memory otherwise """
+        if self.__kgram_index is None:
+            self.__kgram_index = KGramIndex.KGramIndex.load(self.directory, self.vocabulary)
+        if self.__kgram_index is None:
+            self.__kgram_index = KGramIndex.KGramIndex.from_vocabulary(self.vocabulary)
+        return self.__kgram_index
+
+    @property
+    def fuzzy_index(self):
+        """ Deletions of the vocabulary, mapped if they were saved with the index, built in memory otherwise """
+        if self.__fuzzy_index is None:
+            self.__fuzzy_index = FuzzyIndex.FuzzyIndex.load(self.directory, self.vocabulary)
+        if self.__fuzzy_index is None:
+            self.__fuzzy_index = FuzzyIndex.FuzzyIndex.from_vocabulary(self.vocabulary)
+        return self.__fuzzy_index
+
+    def arrays(self, key):
+        """ Returns the docIDs and term frequencies of a termID, as arrays on the mapped file """
+        if key not in self:
+            raise KeyError(key)
+        offset, df = int(self.__lexicon[key, 0]), int(self.__lexicon[key, 1])
+        return self.__postings[offset:offset + df], self.__postings[offset + df:offset + 2 * df]
+
+    def postings_arrays(self):
+        """ Returns the termID, docID and term frequency of every posting, in the order of the termIDs, as three arrays """
+        offsets = self.__lexicon[:-1, 0].astype(np.int64)
+        dfs = self.__lexicon[:-1, 1].astype(np.int64)
+        termIDs = np.repeat(np.arange(len(self), dtype=np.int64), dfs)
+        # Offset of every posting in the postings file, the term frequencies of a term follow its docIDs
+        ranks = np.arange(len(termIDs)) - np.repeat(np.cumsum(dfs) - dfs, dfs)
+        rows = np.repeat(offsets, dfs) + ranks
+        return termIDs, self.__postings[rows], self.__postings[rows + np.repeat(dfs, dfs)]
+
+    def postings(self, key):
+        """ Returns the sorted docIDs of a termID """
+        return self.arrays(key)[0].tolist()
+
+    def document_frequency(self, key):
+        """ Number of documents containing the termID, read from the lexicon """
+        if key not in self:
+            raise KeyError(key)
+        return int(self.__lexicon[key, 1])
+
+    def positions(self, key):
+        """ Returns the {docID: [positions]} of a termID """
+        docIDs, tfs = self.arrays(key)
+        offset = int(self.__lexicon[key, 2])
+        ends = np.cumsum(tfs, dtype=np.int64) + offset
+        starts = ends - tfs
+        return {docID: self.__positions[start:end].tolist() for docID, start, end in zip(docIDs.tolist(), starts, ends)}
+
+    def norm(self, docID):
+        """ Returns the norm of the vector of a document """
+        i = np.searchsorted(self.docIDs, docID)
+        if i == len(self.docIDs) or self.docIDs[i] != docID:
+            raise KeyError(docID)
+        return float(self.norms[i])
+
+    def __getitem__(self, key):
+        """ Returns the posting dict {docID: tf} of a termID, like the in-memory index """
+        docIDs, tfs = self.arrays(key)
+        return dict(zip(docIDs.tolist(), tfs.tolist()))
+
+    def __contains__(self, key):
+        return isinstance(key, (int, np.integer)) and 0 <= key < len(self)
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+    def __len__(self):
+        return len(self.__lexicon) - 1
+
+    @property
+    def nbytes(self):
+        """ Size of the postings file """
+        return self.__postings.nbytes
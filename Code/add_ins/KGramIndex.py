@@ -0,0 +1,115 @@
+import os
+import re
+import numpy as np
+from . import TermDictionary
+from .Mapping import map_array
+
+K = 3
+# Marks the start and the end of a term, so that the k-grams of a prefix or a suffix are told apart
+BOUNDARY = '$'
+WILDCARD = '*'
+# Greater than every character, a term starting with a prefix is smaller than the prefix followed by it
+LAST_CHARACTER = '\U0010ffff'
+
+# Sorted k-grams front-coded by blocks, and the offsets of the blocks
+GRAMS_FILENAME = "kgrams.bin"
+GRAM_BLOCKS_FILENAME = "kgram_blocks.bin"
+# Start of the list of every k-gram as 64 bits integers, a last offset marks the end
+GRAM_OFFSETS_FILENAME = "kgram_offsets.bin"
+# Sorted ranks of the terms containing every k-gram, as 32 bits integers
+GRAM_POSTINGS_FILENAME = "kgram_postings.bin"
+
+def _grams(text, k):
+    """ Distinct k-grams of a text """
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+class KGramIndex():
+    """
+    k-grams of the terms of a vocabulary -> sorted ranks of the terms containing them, as a CSR matrix
+    A wildcard term is expanded by intersecting the lists of its k-grams, and the few candidates left are matched against it
+    The ranks are the positions of the terms in the sorted vocabulary, the termIDs of a saved index
+    """
+    def __init__(self, vocabulary, grams, offsets, postings, k=K):
+        self.vocabulary = vocabulary
+        self.k = k
+        self.__grams = grams
+        self.__offsets = offsets
+        self.__postings = postings
+
+    @classmethod
+    def build(cls, terms, k=K):
+        """ Builds the index of any iterable of terms """
+        return cls.from_vocabulary(TermDictionary.TermDictionary.from_terms(sorted(set(terms))), k)
+
+    @classmethod
+    def from_vocabulary(cls, vocabulary, k=K):
+        """ Builds the index of the terms of a TermDictionary """
+        lists = {}
+        # The terms come in the order of their ranks, every list is sorted
+        for rank, term in enumerate(vocabulary):
+            for gram in _grams(BOUNDARY + term + BOUNDARY, k):
+                lists.setdefault(gram, []).append(rank)
+        grams = sorted(lists)
+        offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(lists[gram]) for gram in grams])
+        postings = np.fromiter((rank for gram in grams for rank in lists[gram]), dtype=np.int32, count=int(offsets[-1]))
+        return cls(vocabulary, TermDictionary.TermDictionary.from_terms(grams), offsets, postings, k)
+
+    def save(self, directory):
+        """ Writes the k-grams and their lists next to an index, the vocabulary is written by the index """
+        TermDictionary.save(os.path.join(directory, GRAMS_FILENAME), os.path.join(directory, GRAM_BLOCKS_FILENAME),
+                            list(self.__grams))
+        self.__offsets.tofile(os.path.join(directory, GRAM_OFFSETS_FILENAME))
+        self.__postings.tofile(os.path.join(directory, GRAM_POSTINGS_FILENAME))
+
+    @classmethod
+    def load(cls, directory, vocabulary, k=K):
+        """ Opens the k-grams saved with an index whose terms are vocabulary, None if the index was saved without them """
+        if not os.path.exists(os.path.join(directory, GRAM_OFFSETS_FILENAME)):
+            return None
+        offsets = np.fromfile(os.path.join(directory, GRAM_OFFSETS_FILENAME), dtype=np.int64)
+        grams = TermDictionary.TermDictionary(map_array(os.path.join(directory, GRAMS_FILENAME), np.uint8),
+                                              np.fromfile(os.path.join(directory, GRAM_BLOCKS_FILENAME), dtype=np.uint64),
+                                              len(offsets) - 1)
+        return cls(vocabulary, grams, offsets, map_array(os.path.join(directory, GRAM_POSTINGS_FILENAME), np.int32), k)
+
+    def __ranks(self, gram):
+        """ Sorted ranks of the terms containing a k-gram """
+        i = self.__grams.get(gram)
+        if i is None:
+            return self.__postings[:0]
+        return self.__postings[self.__offsets[i]:self.__offsets[i + 1]]
+
+    def expand(self, pattern):
+        """
+        Returns the sorted terms matching a pattern, where every * stands for any characters
+        Raises a ValueError if the pattern has neither a prefix nor a k-gram to look for
+        """
+        if WILDCARD not in pattern:
+            return [pattern] if pattern in self.vocabulary else []
+        candidates = None
+        # The terms starting with the prefix are an interval of ranks
+        prefix = pattern.split(WILDCARD)[0]
+        if prefix:
+            candidates = np.arange(self.vocabulary.bisect(prefix), self.vocabulary.bisect(prefix + LAST_CHARACTER), dtype=np.int32)
+        pieces = (BOUNDARY + pattern + BOUNDARY).split(WILDCARD)
+        lists = [self.__ranks(gram) for gram in set().union(*(_grams(piece, self.k) for piece in pieces))]
+        # The shortest lists first, the intersection only gets shorter
+        for ranks in sorted(lists, key=len):
+            candidates = ranks if candidates is None else np.intersect1d(candidates, ranks, assume_unique=True)
+            if len(candidates) == 0:
+                return []
+        if candidates is None:
+            raise ValueError("The wildcard {} has too few letters to be expanded".format(pattern))
+        # The k-grams may appear in the wrong order or overlap a *, the candidates are checked
+        matcher = re.compile('.*'.join(re.escape(piece) for piece in pattern.split(WILDCARD)), re.DOTALL)
+        return [term for term in self.vocabulary.terms(candidates.tolist()) if matcher.fullmatch(term)]
+
+    def __len__(self):
+        return len(self.__offsets) - 1
+
+    @property
+    def nbytes(self):
+        """ Memory used by the k-grams and their lists """
+        return self.__grams.nbytes + self.__offsets.nbytes + self.__postings.nbytes
@@ -0,0 +1,11 @@
+import os
+import numpy as np
+
+def map_array(filename, dtype):
+    """
+    Maps a file read-only as a NumPy array, the pages are shared with the other processes
+    The mapping stays open as long as the array is used, an empty file gives an empty array
+    """
+    if os.path.getsize(filename) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode='r')
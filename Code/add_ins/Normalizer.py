@@ -0,0 +1,62 @@
+import json
+import os
+from collections import OrderedDict
+import nltk
+
+# Normalized form of the words met while indexing, saved with the index
+NORMALIZATION_FILENAME = "normalization.json"
+
+class Normalizer():
+    """
+    Lemmatizes then stems words, every distinct word is normalized once and kept in a LRU cache
+    The cache holds at most capacity words, the least recently used are evicted first
+    """
+    def __init__(self, capacity=2**20, cache=None):
+        self.capacity = capacity
+        self.__lemmatizer = nltk.stem.WordNetLemmatizer()
+        self.__stemmer = nltk.stem.SnowballStemmer("english")
+        # {word: normalized word}, from the least to the most recently used
+        self.__cache = OrderedDict(cache or {})
+        while len(self.__cache) > capacity:
+            self.__cache.popitem(last=False)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def normalize(self, word):
+        """ Returns the stem of the lemma of a word """
+        normalized = self.__cache.get(word)
+        if normalized is not None:
+            self.__cache.move_to_end(word)
+            self.stats["hits"] += 1
+            return normalized
+        self.stats["misses"] += 1
+        normalized = self.__stemmer.stem(self.__lemmatizer.lemmatize(word))
+        self.__cache[word] = normalized
+        if len(self.__cache) > self.capacity:
+            self.__cache.popitem(last=False)
+            self.stats["evictions"] += 1
+        return normalized
+
+    def normalize_document(self, document):
+        """ Normalizes every word of a document """
+        return [self.normalize(word) for word in document]
+
+    def save(self, directory):
+        """ Writes the cache next to an index, the queries on that index are then normalized by lookups """
+        with open(os.path.join(directory, NORMALIZATION_FILENAME), 'w') as f:
+            json.dump(self.__cache, f)
+
+    @classmethod
+    def load(cls, directory, capacity=2**20):
+        """ Opens the cache saved with an index, an index saved without it gives an empty cache """
+        filename = os.path.join(directory, NORMALIZATION_FILENAME)
+        if not os.path.exists(filename):
+            return cls(capacity)
+        with open(filename, 'r') as f:
+            return cls(capacity, json.load(f))
+
+    def __len__(self):
+        return len(self.__cache)
+
+    def __str__(self):
+        return "Normalization cache: {} words, {} hits, {} misses, {} evictions".format(
+            len(self), self.stats["hits"], self.stats["misses"], self.stats["evictions"])
@@ -0,0 +1,24 @@
+from multiprocessing import Pool
+
+# Number of items sent to a worker at once, large enough to hide the cost of the messages
+CHUNK_SIZE = 64
+
+def map_in_order(function, items, workers=1, chunk_size=CHUNK_SIZE):
+    """
+    Yields function(item) for every item, computed in a pool of processes if there are several workers
+    Items are sent in chunks and the results come back in the order of the items
+    function must be a module-level function, or a functools.partial of one
+    """
+    if workers < 1:
+        raise ValueError("At least one worker is needed. Please use a positive number of workers")
+    if workers == 1:
+        yield from map(function, items)
+        return
+    with Pool(workers) as pool:
+        yield from pool.imap(function, items, chunksize=chunk_size)
+
+def clean_file(filename, stop_words):
+    """ Reads a document and removes its stop words, in a worker process if the analysis is parallel """
+    with open(filename, 'r') as f:
+        doc = f.read().split(' ')
+    return [word for word in doc if word not in stop_words]
@@ -0,0 +1,77 @@
+from collections import OrderedDict
+import numpy as np
+
+class PostingCache():
+    """
+    Reader of an on-disk index that keeps the posting lists it reads in a LRU cache bounded in bytes
+    Only the dictionary of the index stays in memory, the least recently used lists are evicted first
+    """
+    def __init__(self, index, capacity=16 * 2**20):
+        # Any index with arrays(key) and document_frequency(key), like IndexStore or DiskIndex
+        self.index = index
+        self.capacity = capacity
+        # Bytes used by the cached lists
+        self.size = 0
+        # {key: (docIDs, tfs)}, from the least to the most recently used
+        self.__entries = OrderedDict()
+        # Changes of an index that can change, like segments, the cache is emptied when they differ
+        self.__changes = getattr(index, "changes", None)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def arrays(self, key):
+        """ Returns the docIDs and term frequencies of a key, read from the disk if they are not cached """
+        changes = getattr(self.index, "changes", None)
+        if changes != self.__changes:
+            self.clear()
+            self.__changes = changes
+        entry = self.__entries.get(key)
+        if entry is not None:
+            self.__entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry
+        self.stats["misses"] += 1
+        docIDs, tfs = self.index.arrays(key)
+        # Copies, the cache must not keep the pages of a mapped file
+        entry = (np.array(docIDs), np.array(tfs))
+        nbytes = entry[0].nbytes + entry[1].nbytes
+        if nbytes > self.capacity:
+            # A list larger than the whole cache is read every time
+            return entry
+        self.__entries[key] = entry
+        self.size += nbytes
+        while self.size > self.capacity:
+            docIDs, tfs = self.__entries.popitem(last=False)[1]
+            self.size -= docIDs.nbytes + tfs.nbytes
+            self.stats["evictions"] += 1
+        return entry
+
+    def clear(self):
+        """ Empties the cache, the lists have to be read again once the index has changed """
+        self.__entries.clear()
+        self.size = 0
+
+    def postings(self, key):
+        """ Returns the sorted docIDs of a key """
+        return self.arrays(key)[0].tolist()
+
+    def document_frequency(self, key):
+        """ Number of documents containing the key, read from the dictionary """
+        return self.index.document_frequency(key)
+
+    def __getitem__(self, key):
+        """ Returns the posting dict {docID: tf} of a key, like the in-memory index """
+        docIDs, tfs = self.arrays(key)
+        return dict(zip(docIDs.tolist(), tfs.tolist()))
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __str__(self):
+        return "Posting cache: {} hits, {} misses, {} evictions, {:.1f} of {:.1f} MB used".format(
+            self.stats["hits"], self.stats["misses"], self.stats["evictions"], self.size / 2**20, self.capacity / 2**20)
@@ -0,0 +1,663 @@
+import json
+import os
+import shutil
+import threading
+from math import log10
+import numpy as np
+from . import IndexStore
+from .DocIDTable import DocIDTable
+
+FORMAT_VERSION = 1
+
+# List of the live segments, from the oldest to the newest
+MANIFEST_FILENAME = "segments.json"
+SEGMENT_PREFIX = "segment_"
+# Bitset of the deleted documents of a segment, one bit per docID in the order of its docid table
+TOMBSTONES_FILENAME = "deleted.bin"
+
+def tier(documents, merge_factor):
+    """ Size class of a segment: segments of the same tier hold about the same number of documents """
+    level = 0
+    while documents >= merge_factor:
+        documents //= merge_factor
+        level += 1
+    return level
+
+
+class Segment():
+    """ Segment opened from the disk with the bitset of its deleted documents, deleting documents gives a new Segment """
+    def __init__(self, name, store, tombstones=None, forward=None):
+        self.name = name
+        self.store = store
+        # Packed bits, None while no document is deleted
+        self.tombstones = tombstones
+        self.deleted = 0 if tombstones is None else int(np.unpackbits(tombstones).sum())
+        # termIDs of the documents, built on first use and shared with the segments made by deleting documents
+        self.__forward = forward
+
+    @classmethod
+    def open(cls, directory, name):
+        """ Opens a segment and its tombstones """
+        path = os.path.join(directory, name)
+        tombstones = None
+        if os.path.exists(os.path.join(path, TOMBSTONES_FILENAME)):
+            tombstones = np.fromfile(os.path.join(path, TOMBSTONES_FILENAME), dtype=np.uint8)
+        return cls(name, IndexStore.IndexStore(path), tombstones)
+
+    def __len__(self):
+        """ Number of documents that are not deleted """
+        return len(self.store.docIDs) - self.deleted
+
+    def is_deleted(self, docIDs):
+        """ Boolean mask of the docIDs of this segment that are deleted """
+        if self.tombstones is None:
+            return np.zeros(len(docIDs), dtype=bool)
+        rows = np.searchsorted(self.store.docIDs, docIDs).astype(np.int64)
+        return ((self.tombstones[rows >> 3] >> (7 - (rows & 7))) & 1).astype(bool)
+
+    def delete(self, docIDs):
+        """ Returns the segment with these docIDs deleted too, and the docIDs newly deleted """
+        docIDs = np.asarray(docIDs, dtype=np.int64)
+        rows = np.searchsorted(self.store.docIDs, docIDs)
+        found = rows < len(self.store.docIDs)
+        rows, docIDs = rows[found], docIDs[found]
+        rows = rows[self.store.docIDs[rows] == docIDs]
+        rows = rows[~self.is_deleted(self.store.docIDs[rows])]
+        if len(rows) == 0:
+            return self, rows
+        if self.tombstones is None:
+            tombstones = np.zeros((len(self.store.docIDs) + 7) // 8, dtype=np.uint8)
+        else:
+            tombstones = self.tombstones.copy()
+        np.bitwise_or.at(tombstones, rows >> 3, (128 >> (rows & 7)).astype(np.uint8))
+        # Written aside then renamed, a crash leaves either the old or the new bitset
+        filename = os.path.join(self.store.directory, TOMBSTONES_FILENAME)
+        tombstones.tofile(filename + ".tmp")
+        os.replace(filename + ".tmp", filename)
+        return Segment(self.name, self.store, tombstones, self.__forward), self.store.docIDs[rows]
+
+    @property
+    def docIDs(self):
+        """ docIDs of the documents that are not deleted """
+        docIDs = self.store.docIDs
+        if self.tombstones is None:
+            return docIDs
+        return docIDs[~self.is_deleted(docIDs)]
+
+    def terms_of(self, docIDs):
+        """ termIDs of the terms of some documents of the segment, once per document containing them """
+        if self.__forward is None:
+            # The postings ordered by document instead of by term
+            termIDs, ids, _ = self.store.postings_arrays()
+            rows = np.searchsorted(self.store.docIDs, ids)
+            order = np.argsort(rows, kind='stable')
+            starts = np.searchsorted(rows[order], np.arange(len(self.store.docIDs) + 1))
+            self.__forward = (termIDs[order].astype(np.int32), starts)
+        termIDs, starts = self.__forward
+        rows = np.searchsorted(self.store.docIDs, docIDs)
+        return np.concatenate([termIDs[starts[row]:starts[row + 1]] for row in rows.tolist()] + [np.zeros(0, dtype=np.int32)])
+
+    def arrays(self, termID):
+        """ Returns the docIDs and term frequencies of a termID, without the deleted documents """
+        docIDs, tfs = self.store.arrays(termID)
+        if self.tombstones is None:
+            return docIDs, tfs
+        live = ~self.is_deleted(docIDs)
+        return docIDs[live], tfs[live]
+
+    def document_frequency(self, termID):
+        """ Number of live documents containing the termID """
+        if self.tombstones is None:
+            return self.store.document_frequency(termID)
+        return len(self.arrays(termID)[0])
+
+    def positions(self, termID):
+        """ Returns the {docID: [positions]} of a termID, without the deleted documents """
+        positions = self.store.positions(termID)
+        if self.tombstones is None:
+            return positions
+        docIDs = np.fromiter(positions, dtype=np.int64, count=len(positions))
+        for docID in docIDs[self.is_deleted(docIDs)].tolist():
+            del positions[docID]
+        return positions
+
+
+class SegmentVocabulary():
+    """ Terms of every segment, a term is its own key in the segmented index """
+    def __init__(self, index):
+        self.__index = index
+
+    def __getitem__(self, term):
+        if term not in self.__index:
+            raise KeyError(term)
+        return term
+
+    def __contains__(self, term):
+        return term in self.__index
+
+    def __iter__(self):
+        return iter(self.__index)
+
+    def __len__(self):
+        return len(self.__index)
+
+
+class SegmentPositions():
+    """ Positional index {word: {docID: [positions]}} gathered from every segment """
+    def __init__(self, index):
+        self.__index = index
+
+    def __getitem__(self, word):
+        return self.__index.positions(word)
+
+    def get(self, word, default=None):
+        if word not in self.__index:
+            return default
+        return self[word]
+
+    def __contains__(self, word):
+        return word in self.__index
+
+    def __iter__(self):
+        return iter(self.__index)
+
+    def __len__(self):
+        return len(self.__index)
+
+
+class NormSums():
+    """
+    Document frequencies of the live documents and, for every docID, the sums that give the norm of its vector
+    With u the weight of a term in a document before its idf, l the log of the df of the term and L the log of the number
+    of documents, the squared norm is L² Σu² - 2L Σu²l + Σu²l². Adding or deleting documents only changes L and the sums
+    of the documents sharing a term with them, which are brought up to date on the next norms
+    """
+    def __init__(self, ponderation="tf-idf"):
+        self.ponderation = ponderation
+        self.dfs = {}
+        # df of the terms whose df changed since the last norms, as used in the sums
+        self.__stale = {}
+        # Σu², Σu²l and Σu²l² of every docID
+        self.__sums = np.zeros((3, 0))
+
+    def __weights(self, tfs):
+        """ Weights of the postings before their idf """
+        if self.ponderation == "freq-norm":
+            return tfs.astype(np.float64)
+        return 1 + np.log10(tfs)
+
+    def __change_df(self, term, count):
+        """ Adds count to the df of a term, returns the log of the df used in the sums """
+        df = self.dfs.get(term, 0)
+        used = self.__stale.setdefault(term, df)
+        if df + count == 0:
+            del self.dfs[term]
+        else:
+            self.dfs[term] = df + count
+        return log10(max(used, 1))
+
+    @classmethod
+    def gather(cls, segments, ponderation="tf-idf"):
+        """ Sums of the live documents of some segments, the dfs are counted first so that no sum is stale """
+        sums = cls(ponderation)
+        postings = [sums.__live_postings(segment) for segment in segments]
+        for segment, (termIDs, _, _) in zip(segments, postings):
+            used, counts = np.unique(termIDs, return_counts=True)
+            for term, count in zip(segment.store.vocabulary.terms(used.tolist()), counts.tolist()):
+                sums.dfs[term] = sums.dfs.get(term, 0) + count
+        for segment, (termIDs, docIDs, tfs) in zip(segments, postings):
+            used = np.unique(termIDs)
+            logs = np.zeros(len(segment.store))
+            logs[used] = [log10(sums.dfs[term]) for term in segment.store.vocabulary.terms(used.tolist())]
+            sums.__add_sums(termIDs, docIDs, tfs, logs)
+        return sums
+
+    @staticmethod
+    def __live_postings(segment):
+        """ termIDs, docIDs and term frequencies of the postings of the live documents of a segment """
+        termIDs, docIDs, tfs = segment.store.postings_arrays()
+        if segment.tombstones is None:
+            return termIDs, docIDs, tfs
+        live = ~segment.is_deleted(docIDs)
+        return termIDs[live], docIDs[live], tfs[live]
+
+    def add(self, segment):
+        """ Adds the live documents of a segment, a document added again replaces its old sums """
+        termIDs, docIDs, tfs = self.__live_postings(segment)
+        used, counts = np.unique(termIDs, return_counts=True)
+        logs = np.zeros(len(segment.store))
+        for termID, term, count in zip(used.tolist(), segment.store.vocabulary.terms(used.tolist()), counts.tolist()):
+            logs[termID] = self.__change_df(term, count)
+        self.__add_sums(termIDs, docIDs, tfs, logs)
+
+    def __add_sums(self, termIDs, docIDs, tfs, logs):
+        """ Replaces the sums of the documents of some postings, logs[termID] is the log of the df of a term in the sums """
+        if len(docIDs) == 0:
+            return
+        if docIDs.max() >= self.__sums.shape[1]:
+            self.__sums = np.hstack([self.__sums, np.zeros((3, 2 * int(docIDs.max()) + 1 - self.__sums.shape[1]))])
+        ids, inverse = np.unique(docIDs, return_inverse=True)
+        squares = self.__weights(tfs) ** 2
+        self.__sums[0, ids] = np.bincount(inverse, squares, minlength=len(ids))
+        self.__sums[1, ids] = np.bincount(inverse, squares * logs[termIDs], minlength=len(ids))
+        self.__sums[2, ids] = np.bincount(inverse, squares * logs[termIDs] ** 2, minlength=len(ids))
+
+    def delete(self, segment, docIDs):
+        """ Takes documents just deleted from a segment out of the dfs """
+        used, counts = np.unique(segment.terms_of(docIDs), return_counts=True)
+        for term, count in zip(segment.store.vocabulary.terms(used.tolist()), counts.tolist()):
+            self.__change_df(term, -count)
+
+    def norms(self, segments, docIDs):
+        """ Norms of the vectors of the live docIDs of the segments, with the dfs of the live documents """
+        stale, self.__stale = self.__stale, {}
+        A = self.__sums[0, docIDs]
+        if self.ponderation == "freq-norm":
+            return np.sqrt(A)
+        # The documents containing a term whose df changed have their sums moved to the new log
+        for term, used in stale.items():
+            old, new = log10(max(used, 1)), log10(max(self.dfs.get(term, 0), 1))
+            if old == new:
+                continue
+            for segment in segments:
+                termID = segment.store.vocabulary.get(term)
+                if termID is None:
+                    continue
+                ids, tfs = segment.arrays(termID)
+                squares = self.__weights(tfs) ** 2
+                self.__sums[1, ids] += squares * (new - old)
+                self.__sums[2, ids] += squares * (new * new - old * old)
+        if len(docIDs) == 0:
+            return np.zeros(0)
+        L = log10(len(docIDs))
+        # Σu²(L - l)² is never negative, rounding errors are
+        return np.sqrt(np.maximum(A * L * L - 2 * L * self.__sums[1, docIDs] + self.__sums[2, docIDs], 0))
+
+
+class SegmentedIndex():
+    """
+    Index {term: {docID: tf}} made of immutable segments saved in the on-disk format
+    New documents are written as a new segment and queries read every segment. When merge_factor segments
+    are in the same tier, they are merged into a segment of the next tier by a background thread
+    Deleted documents are marked in a bitset of their segment, skipped by the queries and dropped by the merges
+    """
+    def __init__(self, directory, merge_factor=4, ponderation="tf-idf", tokenizer=None):
+        if merge_factor < 2:
+            raise ValueError("merge_factor should be at least 2, got {}".format(merge_factor))
+        self.directory = directory
+        self.merge_factor = merge_factor
+        # Ponderation of the document norms, for the vector model
+        self.ponderation = ponderation
+        # Tokenizer of the CACM documents, recorded in the manifest: every segment must be tokenized the same way
+        self.tokenizer = tokenizer
+        self.__lock = threading.Lock()
+        # Merging thread, None once it has stopped; both are guarded by the lock
+        self.__merger = None
+        # Set when the segments changed while the thread was running, it looks at the tiers again before stopping
+        self.__pending = False
+        # docIDs and norms of the live documents, computed again when the segments change
+        self.__docIDs = (None, None)
+        self.__norms = (None, None)
+        # Sorted terms of the segments, computed again when a segment is added or merged
+        self.__terms = (None, None)
+        # Sums of the norms, gathered from every segment on the first norms then updated with every change
+        self.__sums = None
+        # Number of additions, deletions and updates, the caches of the posting lists are emptied when it changes
+        self.changes = 0
+        os.makedirs(directory, exist_ok=True)
+        names, self.__next_segment = [], 0
+        # Largest docID ever added, even if its document was deleted since
+        self.last_docID = -1
+        manifest = os.path.join(directory, MANIFEST_FILENAME)
+        if os.path.exists(manifest):
+            with open(manifest, 'r') as f:
+                content = json.load(f)
+            if content.get("version") != FORMAT_VERSION:
+                raise ValueError("Segments format version {} is not supported (expected {}). Please rebuild the index".format(
+                    content.get("version"), FORMAT_VERSION))
+            names, self.__next_segment = content["segments"], content["next"]
+            self.last_docID = content.get("last_docID", -1)
+            # Segments written before the tokenizer was recorded were tokenized by NLTK
+            written = content.get("tokenizer", "nltk" if tokenizer is not None else None)
+            if written != tokenizer:
+                raise ValueError("The segments in {} were tokenized with {}. Please use the same tokenizer, or delete them and index again".format(
+                    directory, written))
+        # Segments missing from the manifest were left by an interrupted write or merge
+        for name in os.listdir(directory):
+            if name.startswith(SEGMENT_PREFIX) and name not in names:
+                shutil.rmtree(os.path.join(directory, name))
+        # List of Segment, replaced as a whole so that a query always sees a consistent list
+        self.__segments = [Segment.open(directory, name) for name in names]
+        if self.last_docID == -1 and len(self.docIDs) > 0:
+            self.last_docID = int(self.docIDs[-1])
+        self.vocabulary = SegmentVocabulary(self)
+        self.positional_index = SegmentPositions(self)
+
+    # WRITING
+    def __new_segment(self):
+        """ Reserves the name of a new segment """
+        with self.__lock:
+            name = "{}{}".format(SEGMENT_PREFIX, self.__next_segment)
+            self.__next_segment += 1
+        return name, os.path.join(self.directory, name)
+
+    def __write_manifest(self, segments=None):
+        """ Replaces the manifest by the list of segments in one step, a crash leaves either the old or the new list """
+        segments = self.__segments if segments is None else segments
+        manifest = os.path.join(self.directory, MANIFEST_FILENAME)
+        with open(manifest + ".tmp", 'w') as f:
+            content = {"version": FORMAT_VERSION, "segments": [segment.name for segment in segments],
+                       "next": self.__next_segment, "last_docID": self.last_docID}
+            if self.tokenizer is not None:
+                content["tokenizer"] = self.tokenizer
+            json.dump(content, f, indent=2)
+        os.replace(manifest + ".tmp", manifest)
+
+    def __write_segment(self, documents):
+        """ Writes the clean documents {docID: [words]} as a segment that is not live yet, returns its name """
+        index = {}
+        for docID, document in documents.items():
+            for position, word in enumerate(document):
+                index.setdefault(word, {}).setdefault(docID, []).append(position)
+        name, path = self.__new_segment()
+        IndexStore.save(
+            path, index, lambda word: {docID: len(positions) for docID, positions in index[word].items()},
+            positions=index.__getitem__, docIDs=list(documents), metadata={"segment": name}
+        )
+        return name
+
+    def __delete(self, segments, docIDs):
+        """ Deletes docIDs from some segments under the lock, returns the new segments and the (segment, docIDs) deleted """
+        kept, deleted = [], []
+        for segment in segments:
+            segment, ids = segment.delete(docIDs)
+            kept.append(segment)
+            if len(ids) > 0:
+                deleted.append((segment, ids))
+        return kept, deleted
+
+    def add_documents(self, documents):
+        """
+        Writes the clean documents {docID: [words]} as a new segment, then merges segments if needed
+        last_docID follows the docIDs added, which should be new ones unless a document is updated
+        """
+        if len(documents) == 0:
+            return
+        name = self.__write_segment(documents)
+        with self.__lock:
+            segment = Segment.open(self.directory, name)
+            self.__segments = self.__segments + [segment]
+            self.last_docID = max(self.last_docID, max(documents))
+            self.__write_manifest()
+            self.changes += 1
+        if self.__sums is not None:
+            self.__sums.add(segment)
+        self.__start_merges()
+
+    def add_new_documents(self, documents, batch_size=None):
+        """
+        Adds the clean documents {docID: [words]} newer than last_docID, batch_size documents per new segment or all in one
+        Deleted documents are not added again, returns the number of documents added
+        """
+        new_documents = [docID for docID in documents if docID > self.last_docID]
+        batch_size = batch_size or max(1, len(new_documents))
+        for start in range(0, len(new_documents), batch_size):
+            self.add_documents({docID: documents[docID] for docID in new_documents[start:start + batch_size]})
+        return len(new_documents)
+
+    def delete_documents(self, docIDs):
+        """ Marks documents as deleted in the segments holding them, returns the number of documents deleted """
+        docIDs = sorted(set(docIDs))
+        with self.__lock:
+            self.__segments, deleted = self.__delete(self.__segments, docIDs)
+            self.changes += 1
+        if self.__sums is not None:
+            for segment, ids in deleted:
+                self.__sums.delete(segment, ids)
+        # A segment with many deletions falls to a lower tier, where it is merged sooner
+        self.__start_merges()
+        return sum(len(ids) for _, ids in deleted)
+
+    def update_document(self, docID, document):
+        """
+        Replaces the clean words of a document: the new version is written and listed first, then the old one is deleted
+        Queries see either version. A crash between the manifest and the tombstones leaves both versions, never none
+        Raises a KeyError if the document is not live: a new docID would be taken from the documents still to be added
+        """
+        live = self.docIDs
+        row = np.searchsorted(live, docID)
+        if row == len(live) or live[row] != docID:
+            raise KeyError(docID)
+        name = self.__write_segment({docID: document})
+        with self.__lock:
+            segment = Segment.open(self.directory, name)
+            self.__write_manifest(self.__segments + [segment])
+            # Only the segments listed before the new one hold the old version
+            segments, deleted = self.__delete(self.__segments, [docID])
+            self.__segments = segments + [segment]
+            self.changes += 1
+        if self.__sums is not None:
+            for old, ids in deleted:
+                self.__sums.delete(old, ids)
+            self.__sums.add(segment)
+        self.__start_merges()
+
+    def edit(self, command, clean):
+        """
+        Runs a command of the query loop: \\d docID ... deletes documents, \\u docID text replaces a document
+        clean(text) gives the clean words of the new text, returns the message to print
+        """
+        delete = command.startswith("\\d ")
+        try:
+            if delete:
+                docIDs = [int(docID) for docID in command[3:].split()]
+            else:
+                docID, text = command[3:].split(' ', 1)
+                docID = int(docID)
+        except ValueError:
+            return "Please use \\d docID ... to delete documents, or \\u docID text to update a document"
+        if delete:
+            return "Deleted {} document(s)".format(self.delete_documents(docIDs))
+        try:
+            self.update_document(docID, clean(text))
+        except KeyError:
+            return "Document {} is not in the segments, only live documents can be updated".format(docID)
+        return "Updated document {}".format(docID)
+
+    def __start_merges(self):
+        """ Starts the merging thread, unless it is already running: it then checks the tiers again before stopping """
+        with self.__lock:
+            # A thread that died on an error is started again
+            if self.__merger is not None and self.__merger.is_alive():
+                self.__pending = True
+                return
+            self.__pending = False
+            self.__merger = threading.Thread(target=self.__merge_tiers)
+            self.__merger.start()
+
+    def __merge_tiers(self):
+        """ Merges merge_factor segments of the same tier until every tier has fewer segments """
+        while True:
+            # The tiers are checked and the thread stops under the lock, a segment added meanwhile starts a new thread
+            with self.__lock:
+                tiers = {}
+                for segment in self.__segments:
+                    tiers.setdefault(tier(len(segment), self.merge_factor), []).append(segment.name)
+                full = [names for names in tiers.values() if len(names) >= self.merge_factor]
+                if len(full) == 0:
+                    if self.__pending:
+                        self.__pending = False
+                        continue
+                    self.__merger = None
+                    return
+            self.__merge(full[0][:self.merge_factor])
+
+    def __merge(self, names):
+        """ Writes the live documents of some segments as one segment, which replaces them """
+        segments = [segment for segment in self.__segments if segment.name in names]
+        terms = set()
+        for segment in segments:
+            terms.update(segment.store.vocabulary)
+
+        def gather(term, read):
+            # Segments hold different documents, their postings are only put together
+            gathered = {}
+            for segment in segments:
+                termID = segment.store.vocabulary.get(term)
+                if termID is not None:
+                    gathered.update(read(segment, termID))
+            return gathered
+
+        def postings(segment, termID):
+            docIDs, tfs = segment.arrays(termID)
+            return zip(docIDs.tolist(), tfs.tolist())
+
+        name, path = self.__new_segment()
+        # The deleted documents are left out, terms found only in them are dropped by save
+        IndexStore.save(
+            path, terms, lambda term: gather(term, postings), positions=lambda term: gather(term, Segment.positions),
+            docIDs=np.concatenate([segment.docIDs for segment in segments]), metadata={"segment": name}
+        )
+        with self.__lock:
+            merged = Segment.open(self.directory, name)
+            # Documents deleted while the merge was running are deleted in the new segment too
+            for old, current in zip(segments, [segment for segment in self.__segments if segment.name in names]):
+                if current.deleted > old.deleted:
+                    merged = merged.delete(current.store.docIDs[current.is_deleted(current.store.docIDs)])[0]
+            first = [segment.name for segment in self.__segments].index(names[0])
+            kept = [segment for segment in self.__segments if segment.name not in names]
+            self.__segments = kept[:first] + [merged] + kept[first:]
+            self.__write_manifest()
+        # The files stay readable by the queries that still map them
+        for old in names:
+            shutil.rmtree(os.path.join(self.directory, old))
+
+    def wait(self):
+        """ Waits for the background merges to finish """
+        merger = self.__merger
+        # A segment added during the merges may have started another thread
+        while merger is not None:
+            merger.join()
+            if self.__merger is merger:
+                break
+            merger = self.__merger
+
+    def document_table(self):
+        """ Table of the files of the docIDs saved with the segments, raises a ValueError if it does not cover them """
+        documents = DocIDTable.load(self.directory) or DocIDTable()
+        if len(documents) != self.last_docID + 1:
+            raise ValueError("The segments in {} were written without their table of documents. Please delete them and index again".format(
+                self.directory))
+        return documents
+
+    @property
+    def segments(self):
+        """ Names and number of live documents of the segments """
+        return [(segment.name, len(segment)) for segment in self.__segments]
+
+    # READING
+    def __parts(self, term):
+        """ (segment, termID) of the segments containing a term """
+        parts = []
+        for segment in self.__segments:
+            termID = segment.store.vocabulary.get(term)
+            if termID is not None:
+                parts.append((segment, termID))
+        return parts
+
+    def arrays(self, term):
+        """ Returns the docIDs and term frequencies of a term over every segment, without the deleted documents """
+        parts = self.__parts(term)
+        if len(parts) == 0:
+            raise KeyError(term)
+        postings = [segment.arrays(termID) for segment, termID in parts]
+        docIDs = np.concatenate([docIDs for docIDs, _ in postings])
+        tfs = np.concatenate([tfs for _, tfs in postings])
+        # A merged segment can hold older and newer documents than the next ones
+        order = np.argsort(docIDs, kind='stable')
+        return docIDs[order], tfs[order]
+
+    def postings(self, term):
+        """ Returns the sorted docIDs of a term """
+        return self.arrays(term)[0].tolist()
+
+    def document_frequency(self, term):
+        """ Number of live documents containing the term, summed over the segments """
+        parts = self.__parts(term)
+        if len(parts) == 0:
+            raise KeyError(term)
+        return sum(segment.document_frequency(termID) for segment, termID in parts)
+
+    def positions(self, term):
+        """ Returns the {docID: [positions]} of a term """
+        parts = self.__parts(term)
+        if len(parts) == 0:
+            raise KeyError(term)
+        positions = {}
+        for segment, termID in parts:
+            positions.update(segment.positions(termID))
+        return positions
+
+    def expand(self, pattern):
+        """ Returns the sorted terms of the segments matching a wildcard pattern, through the k-grams of every segment """
+        terms = set()
+        for segment in self.__segments:
+            terms.update(segment.store.kgram_index.expand(pattern))
+        return sorted(terms)
+
+    def closest(self, term, distance=None):
+        """ Returns the terms of the segments at the smallest edit distance from a term and this distance, through every segment """
+        best, terms = None, set()
+        for segment in self.__segments:
+            matches, d = segment.store.fuzzy_index.closest(term, distance)
+            if d is None or (best is not None and d > best):
+                continue
+            if best is None or d < best:
+                best, terms = d, set()
+            terms.update(matches)
+        return sorted(terms), best
+
+    def __getitem__(self, term):
+        """ Returns the posting dict {docID: tf} of a term """
+        docIDs, tfs = self.arrays(term)
+        return dict(zip(docIDs.tolist(), tfs.tolist()))
+
+    def __contains__(self, term):
+        return isinstance(term, str) and any(term in segment.store.vocabulary for segment in self.__segments)
+
+    def __iter__(self):
+        return iter(self.__sorted_terms())
+
+    def __len__(self):
+        return len(self.__sorted_terms())
+
+    def __sorted_terms(self):
+        """ Sorted terms of every segment, kept for the names of the segments since deletions leave their terms """
+        names = tuple(segment.name for segment in self.__segments)
+        if self.__terms[0] != names:
+            terms = set()
+            for segment in self.__segments:
+                terms.update(segment.store.vocabulary)
+            self.__terms = (names, sorted(terms))
+        return self.__terms[1]
+
+    @property
+    def docIDs(self):
+        """ Sorted docIDs of the live documents of every segment """
+        # The cache is kept for the list of segments it was computed from, deletions replace the list too
+        segments = self.__segments
+        if self.__docIDs[0] is not segments:
+            docIDs = np.concatenate([segment.docIDs for segment in segments] + [np.zeros(0, dtype=np.uint32)])
+            self.__docIDs = (segments, np.sort(docIDs))
+        return self.__docIDs[1]
+
+    @property
+    def norms(self):
+        """ Norms of the document vectors, in the order of docIDs, with the idfs of the live documents """
+        segments = self.__segments
+        if self.__norms[0] is not segments:
+            if self.__sums is None:
+                self.__sums = NormSums.gather(segments, self.ponderation)
+            docIDs = np.sort(np.concatenate([segment.docIDs for segment in segments] + [np.zeros(0, dtype=np.uint32)]))
+            self.__norms = (segments, self.__sums.norms(segments, docIDs))
+        return self.__norms[1]
@@ -0,0 +1,216 @@
+import sys
+from bisect import bisect_right
+import numpy as np
+
+# Terms of a block: the first one is written whole, the others as the length of the prefix
+# they share with the term before them and the rest of their bytes
+BLOCK_SIZE = 16
+
+def _write_number(output, n):
+    """ Appends a length as a variable byte number, 7 bits per byte with the high bit set on the last byte """
+    while n >= 128:
+        output.append(n & 127)
+        n >>= 7
+    output.append(n | 128)
+
+def _read_number(block, i):
+    """ Reads a variable byte number at position i of a block, returns it with the position that follows """
+    n, shift = 0, 0
+    while block[i] < 128:
+        n |= block[i] << shift
+        shift += 7
+        i += 1
+    return n | ((block[i] & 127) << shift), i + 1
+
+def encode(terms, block_size=BLOCK_SIZE):
+    """
+    Front-codes sorted terms by blocks, returns the bytes of the blocks and the offset of every block
+    A last offset marks the end of the bytes
+    """
+    output = bytearray()
+    blocks = []
+    previous = b''
+    for i, term in enumerate(terms):
+        encoded = term.encode('utf-8')
+        if i % block_size == 0:
+            blocks.append(len(output))
+            _write_number(output, len(encoded))
+            output += encoded
+        else:
+            prefix = 0
+            while prefix < min(len(previous), len(encoded)) and previous[prefix] == encoded[prefix]:
+                prefix += 1
+            _write_number(output, prefix)
+            _write_number(output, len(encoded) - prefix)
+            output += encoded[prefix:]
+        previous = encoded
+    blocks.append(len(output))
+    return bytes(output), np.array(blocks, dtype=np.uint64)
+
+def save(terms_filename, blocks_filename, terms, block_size=BLOCK_SIZE):
+    """ Writes the front-coded blocks of sorted terms and their offsets """
+    buffer, blocks = encode(terms, block_size)
+    with open(terms_filename, 'wb') as f:
+        f.write(buffer)
+    blocks.tofile(blocks_filename)
+
+
+class TermDictionary():
+    """
+    Sorted terms front-coded in blocks of a single byte buffer, the buffer may be a mapped file
+    A term is found by binary search on the first terms of the blocks, then by decoding a single block
+    The termID of a term is its rank, or values[rank] if values are given; offsets[termID] locates its postings
+    """
+    def __init__(self, buffer, blocks, length, values=None, offsets=None, block_size=BLOCK_SIZE):
+        self.__buffer = buffer
+        self.__blocks = blocks.tolist()
+        # Only the first term of every block is kept as an object, the blocks are found by bisection on them
+        self.__first_terms = [self.__first_term(b) for b in range(len(self.__blocks) - 1)]
+        self.__length = length
+        self.__values = values
+        self.__offsets = offsets
+        self.__block_size = block_size
+
+    @classmethod
+    def from_terms(cls, terms, values=None, block_size=BLOCK_SIZE):
+        """ Builds the dictionary of sorted terms in memory """
+        buffer, blocks = encode(terms, block_size)
+        return cls(buffer, blocks, len(terms), values=values, block_size=block_size)
+
+    @classmethod
+    def from_dict(cls, dictionary, block_size=BLOCK_SIZE):
+        """ Builds the dictionary of a {term: termID} dict, the termIDs are kept in an array """
+        terms = sorted(dictionary)
+        values = np.array([dictionary[term] for term in terms], dtype=np.int32)
+        return cls.from_terms(terms, values, block_size)
+
+    def __block(self, b):
+        return bytes(self.__buffer[self.__blocks[b]:self.__blocks[b + 1]])
+
+    def __first_term(self, b):
+        """ First term of a block, as bytes """
+        start = self.__blocks[b]
+        length, i = _read_number(bytes(self.__buffer[start:start + 10]), 0)
+        return bytes(self.__buffer[start + i:start + i + length])
+
+    def __decode(self, b):
+        """ Yields the terms of a block as bytes """
+        block = self.__block(b)
+        length, i = _read_number(block, 0)
+        term = block[i:i + length]
+        i += length
+        yield term
+        while i < len(block):
+            prefix, i = _read_number(block, i)
+            length, i = _read_number(block, i)
+            term = term[:prefix] + block[i:i + length]
+            i += length
+            yield term
+
+    def __find_block(self, encoded):
+        """ Last block whose first term is not greater than the encoded term, -1 if there is none """
+        return bisect_right(self.__first_terms, encoded) - 1
+
+    def __value(self, rank):
+        return rank if self.__values is None else int(self.__values[rank])
+
+    def rank(self, term):
+        """ Rank of a term among the sorted terms """
+        encoded = term.encode('utf-8')
+        b = self.__find_block(encoded)
+        if b >= 0:
+            for i, candidate in enumerate(self.__decode(b)):
+                if candidate == encoded:
+                    return b * self.__block_size + i
+                if candidate > encoded:
+                    break
+        raise KeyError(term)
+
+    def bisect(self, term):
+        """ Rank of the first term that is not smaller than a term, the number of terms if there is none """
+        encoded = term.encode('utf-8')
+        b = self.__find_block(encoded)
+        if b < 0:
+            return 0
+        smaller = 0
+        for candidate in self.__decode(b):
+            if candidate >= encoded:
+                break
+            smaller += 1
+        return b * self.__block_size + smaller
+
+    def lookup(self, term):
+        """ Returns the termID of a term and the offset of its postings, None if there are no offsets """
+        termID = self[term]
+        return termID, None if self.__offsets is None else int(self.__offsets[termID])
+
+    def term(self, rank):
+        """ Returns the term of a rank, which is its termID if there are no values """
+        if not 0 <= rank < len(self):
+            raise IndexError(rank)
+        for i, term in enumerate(self.__decode(rank // self.__block_size)):
+            if i == rank % self.__block_size:
+                return term.decode('utf-8')
+
+    def terms(self, ranks):
+        """ Yields the terms of sorted ranks, every block is decoded once and only up to the last rank needed """
+        b = None
+        for rank in ranks:
+            if rank // self.__block_size != b:
+                b = rank // self.__block_size
+                decoded, i = self.__decode(b), -1
+            while i < rank % self.__block_size:
+                term = next(decoded)
+                i += 1
+            yield term.decode('utf-8')
+
+    def range(self, start=None, end=None):
+        """ Yields the (term, termID) of the terms from start (included) to end (excluded), in order """
+        first = 0
+        if start is not None:
+            start = start.encode('utf-8')
+            first = max(self.__find_block(start), 0)
+        end = None if end is None else end.encode('utf-8')
+        for b in range(first, len(self.__blocks) - 1):
+            for i, term in enumerate(self.__decode(b)):
+                if start is not None and term < start:
+                    continue
+                if end is not None and term >= end:
+                    return
+                yield term.decode('utf-8'), self.__value(b * self.__block_size + i)
+
+    def prefix(self, prefix):
+        """ Yields the (term, termID) of the terms starting with a prefix, in order """
+        encoded = prefix.encode('utf-8')
+        for term, termID in self.range(prefix):
+            if not term.encode('utf-8').startswith(encoded):
+                return
+            yield term, termID
+
+    def __getitem__(self, term):
+        """ Returns the termID of a term """
+        return self.__value(self.rank(term))
+
+    def get(self, term, default=None):
+        try:
+            return self[term]
+        except KeyError:
+            return default
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    def __iter__(self):
+        return (term for term, _ in self.range())
+
+    def items(self):
+        return self.range()
+
+    def __len__(self):
+        return self.__length
+
+    @property
+    def nbytes(self):
+        """ Memory used by the blocks, their offsets, their first terms and the termIDs """
+        first_terms = sum(sys.getsizeof(term) for term in self.__first_terms)
+        return len(self.__buffer) + 8 * len(self.__blocks) + first_terms + (0 if self.__values is None else self.__values.nbytes)